@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Ack Tracker
+
+Keeps track of every message that has been sent but not yet ACK'd. Entries
+are stored in a table keyed by destination name and message id so that an
+incoming ACK can be settled in constant time no matter how many messages are
+in flight. The destination is part of the key because message ids are only
+unique per destination.
+
+Retransmission deadlines are kept in a min-heap so the thread resending
+messages only wakes up when the earliest deadline is due. Settled messages
+are not removed from the heap right away, they are skipped once they reach
+the top (or dropped when the heap is compacted).
+"""
+
+import heapq
+import itertools
+import clock
+from threading import Condition, RLock
+
+
+class AckTracker():
+    COMPACT_THRESHOLD = 1024  # stale heap entries tolerated before compacting
+
+    def __init__(self):
+        self.lock = RLock()
+        self.deadline_changed = Condition(self.lock)
+        self.awaiting_ack = {}
+        self.deadlines = []
+        self._counter = itertools.count()
+
+    def track(self, message, time_sent, timeout):
+        """ Start waiting for an ACK for `message` for `timeout` seconds """
+        deadline = time_sent + timeout
+        key = self.key_for(message)
+        with self.lock:
+            self.awaiting_ack[key] = (message, time_sent, deadline)
+            wakeup = not self.deadlines or deadline < self.deadlines[0][0]
+            heapq.heappush(self.deadlines,
+                           (deadline, next(self._counter), key))
+            self._compact_if_needed()
+            if wakeup:
+                self.deadline_changed.notify()
+
+    @staticmethod
+    def key_for(message):
+        return (message.destination_node.get_name(), message.get_message_id())
+
+    def settle(self, peer_name, message_id):
+        """
+        Mark the message with `message_id` sent to `peer_name` as received by
+        the other side. Returns the (message, time_sent, deadline) tuple or
+        None if nothing was waiting
+        """
+        with self.lock:
+            return self.awaiting_ack.pop((peer_name, message_id), None)
+
+    def is_waiting(self, message):
+        with self.lock:
+            return self.key_for(message) in self.awaiting_ack
+
+    def next_deadline(self):
+        """ Returns the earliest retransmission deadline or None """
+        with self.lock:
+            self._drop_stale_deadlines()
+            if self.deadlines:
+                return self.deadlines[0][0]
+            return None
+
+    def pop_expired(self, now):
+        """
+        Removes and returns all (message, time_sent, deadline) tuples whose
+        deadline has passed
+        """
+        expired = []
+        with self.lock:
+            self._drop_stale_deadlines()
+            while self.deadlines and self.deadlines[0][0] <= now:
+                deadline, _, key = heapq.heappop(self.deadlines)
+                expired.append(self.awaiting_ack.pop(key))
+                self._drop_stale_deadlines()
+        return expired
+
+    def wait_for_expired(self):
+        """ Blocks until at least one deadline has passed and returns them """
+        with self.lock:
+            while True:
+                deadline = self.next_deadline()
+                now = clock.now()
+                if deadline is not None and deadline <= now:
+                    return self.pop_expired(now)
+                timeout = None if deadline is None else deadline - now
+                clock.wait(self.deadline_changed, timeout)
+
+    def size(self):
+        with self.lock:
+            return len(self.awaiting_ack)
+
+    """
+    Util Functions
+    """
+
+    def _is_stale(self, heap_entry):
+        """ Heap entries are stale once settled or rescheduled """
+        deadline, _, key = heap_entry
+        entry = self.awaiting_ack.get(key)
+        return entry is None or entry[2] != deadline
+
+    def _drop_stale_deadlines(self):
+        while self.deadlines and self._is_stale(self.deadlines[0]):
+            heapq.heappop(self.deadlines)
+
+    def _compact_if_needed(self):
+        """ Rebuild the heap once settled entries make up most of it """
+        stale = len(self.deadlines) - len(self.awaiting_ack)
+        if stale > self.COMPACT_THRESHOLD and stale > len(self.awaiting_ack):
+            self.deadlines = [entry for entry in self.deadlines
+                              if not self._is_stale(entry)]
+            heapq.heapify(self.deadlines)
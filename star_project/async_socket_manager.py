@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Async Socket Manager
+
+SocketManager for the asyncio runtime (see async_star_node.py). Packets are
+received by a DatagramProtocol and sent straight from the event loop, and
+retransmissions and delayed ACKs are timers on the loop instead of threads.
+ACK tracking, flow control, duplicate suppression and the wire formats are
+shared with SocketManager.
+
+Received messages are not put in queues. Each one is handed to the handler
+registered for its type with set_handler, on the next turn of the loop.
+
+Every method has to be called from the thread running the event loop.
+
+Parameters:
+    - name: Name of the StarNode this socket is attached to
+    - port: Port number to listen on
+    - report_func: function called with every message received, and with
+    no message once the socket is started
+    - verbose: Indicates whether output should be printed with the logger
+    - delayed_acks: see SocketManager
+    - flow_control: see SocketManager
+    - transport: Function creating the endpoint packets are sent and received
+    with, called like StarDatagramProtocol(port, process_incoming_packet_func,
+    name). It has to provide open(), close(), send(message) and get_ip()
+"""
+
+import asyncio
+import socket
+import clock
+
+from message_factory import MessageFactory
+from reliable_socket import ReliableSocket
+from socket_manager import SocketManager
+from logger import Logger
+
+
+class StarDatagramProtocol(asyncio.DatagramProtocol):
+    """ UDP endpoint handing every packet to `process_incoming_packet_func` """
+
+    def __init__(self, port, process_incoming_packet_func, name, verbose=False):
+        self.port = port
+        self.process_incoming_packet = process_incoming_packet_func
+        self._log = Logger(name, verbose)
+        self.send_buffer = memoryview(bytearray(ReliableSocket.SEND_BUFFER_SIZE))
+        self.host = socket.gethostbyname(socket.gethostname())
+        self.transport = None
+
+    async def open(self):
+        """ Binds the endpoint on the running event loop """
+        loop = asyncio.get_event_loop()
+        await loop.create_datagram_endpoint(
+            lambda: self, local_addr=(self.host, self.port))
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        self.process_incoming_packet(data, address)
+
+    def error_received(self, exc):
+        """ Raised for ICMP errors, e.g. a peer that is no longer listening """
+        self._log.debug(f'Socket error: {exc}')
+
+    def get_ip(self):
+        """ Returns the IP of the socket """
+        return self.host
+
+    def send(self, message):
+        """ Send a Message as a UDP Packet without blocking the event loop """
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.transport.sendto(message.encode(self.send_buffer),
+                              message.destination_node.get_address())
+
+
+class AsyncSocketManager(SocketManager):
+
+    def __init__(self, name, port, report_func, verbose=False, delayed_acks=False,
+                 flow_control=False, transport=None):
+        self.loop = None
+        self.handlers = {}
+        self.retransmit_timer = None
+        self.ack_flush_timer = None
+        self.room_available = None
+        super().__init__(name, port, report_func, verbose, delayed_acks=delayed_acks,
+                         flow_control=flow_control, parser_workers=0,
+                         transport=transport)
+
+    def set_handler(self, message_type, handler):
+        """ Calls `handler` with every received message of `message_type` """
+        self.handlers[message_type] = handler
+
+    async def start(self):
+        """ Binds the socket on the running event loop """
+        self.loop = asyncio.get_event_loop()
+        self.room_available = asyncio.Event()
+        await self.sock.open()
+        self.report()
+
+    def stop(self):
+        """ Closes the socket and cancels every timer """
+        for timer in (self.retransmit_timer, self.ack_flush_timer):
+            if timer is not None:
+                timer.cancel()
+        self.retransmit_timer = None
+        self.ack_flush_timer = None
+        self.sock.close()
+
+    async def wait_for_room(self, destination):
+        """ Waits until a bulk message to `destination` can be sent right away """
+        while not self.has_room(destination):
+            self.room_available.clear()
+            await self.room_available.wait()
+
+    def _create_socket(self, port, name, batch_io):
+        transport = self.transport or StarDatagramProtocol
+        return transport(port, self.process_incoming_packet, name)
+
+    def _send_packet(self, message):
+        self.sock.send(message)
+
+    def _transmit(self, message, reliable=True):
+        super()._transmit(message, reliable)
+        if message.TYPE_STRING == "ack" or not reliable:
+            MessageFactory.recycle(message)  # sent right away and never resent
+        else:
+            self._schedule_retransmit()
+
+    def _schedule_retransmit(self):
+        """ Makes sure a timer fires at the earliest retransmission deadline """
+        deadline = self.awaiting_ack.next_deadline()
+        if deadline is None or self.loop is None:
+            return
+        when = self.loop.time() + max(0, deadline - clock.now())
+        if self.retransmit_timer is not None:
+            if self.retransmit_timer.when() <= when:
+                return
+            self.retransmit_timer.cancel()
+        self.retransmit_timer = self.loop.call_at(when, self._retransmit_expired)
+
+    def _retransmit_expired(self):
+        self.retransmit_timer = None
+        for sent_message, time_sent, deadline in self.awaiting_ack.pop_expired(clock.now()):
+            self.resend_message(sent_message)
+        self._schedule_retransmit()
+
+    def process_ack(self, ack_message):
+        super().process_ack(ack_message)
+        self._notify_room()
+
+    def resend_message(self, sent_message):
+        super().resend_message(sent_message)
+        self._notify_room()
+
+    def _notify_room(self):
+        """ Wakes up senders waiting for room in a window """
+        if self.room_available is not None:
+            self.room_available.set()
+
+    def acknowledge(self, message):
+        super().acknowledge(message)
+        if self.delayed_acks and self.pending_acks and self.ack_flush_timer is None:
+            self.ack_flush_timer = self.loop.call_later(
+                self.ACK_DELAY, self._flush_delayed_acks)
+
+    def _flush_delayed_acks(self):
+        """ Sends one BatchAckMessage per peer with the ACKs queued up """
+        self.ack_flush_timer = None
+        batches = self.pending_acks
+        self.pending_acks = {}
+        for node, ack_ids in batches.values():
+            self._send_ack_batch(node, ack_ids)
+
+    def _put_new_message_in_queue(self, message):
+        """
+        Settles ACKs right away and hands every other message to its handler
+        once the packet has been ACK'd
+        """
+        if message.TYPE_STRING == "ack":
+            self.process_ack(message)
+        else:
+            self.loop.call_soon(self.handlers[message.TYPE_STRING], message)
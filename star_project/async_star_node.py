@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Async StarNet Node
+
+StarNode running on an asyncio event loop instead of threads. Heartbeats,
+RTT calculations, discovery, app delivery and retransmissions are all
+coroutines or timers on one loop, so hundreds of nodes can share a process.
+The protocol is the same as StarNode's and both kinds of node can be part of
+the same StarNet.
+
+    node = AsyncStarNode("Node1", 5000, 3)
+    await node.start()
+    node.broadcast_string("hello")
+    node.disconnect()
+
+Every method has to be called from the thread running the event loop.
+Large files are sent from a task; broadcast_file returns it so callers can
+wait for the last fragment to be sent.
+
+Parameters:
+    - see StarNode
+"""
+
+import asyncio
+import clock
+
+from async_socket_manager import AsyncSocketManager
+from failure_detector import PhiAccrualDetector
+from messages import FileFragmentMessage
+from star_node import StarNode
+
+
+class AsyncStarNode(StarNode):
+
+    def __init__(self, name, port, num_nodes, poc_ip=0, poc_port=0, verbose=False,
+                 delayed_acks=False, transport=None, phi_threshold=PhiAccrualDetector.THRESHOLD,
+                 piggyback_heartbeats=False, swim_membership=False, flow_control=False):
+        super().__init__(name, port, num_nodes, poc_ip, poc_port, verbose,
+                         delayed_acks=delayed_acks, transport=transport,
+                         phi_threshold=phi_threshold,
+                         piggyback_heartbeats=piggyback_heartbeats,
+                         swim_membership=swim_membership,
+                         flow_control=flow_control)
+        self.rtt_queue = asyncio.Queue()
+        self.rtt_countdown_event = asyncio.Event()
+        self.tasks = set()
+        self.stopped = asyncio.Event()
+
+        self.socket_manager.set_handler("app", self.process_app_message)
+        self.socket_manager.set_handler("fragment", self.process_fragment_message)
+        self.socket_manager.set_handler("discovery", self.process_discovery_message)
+        self.socket_manager.set_handler("heartbeat", self.process_heartbeat_message)
+        self.socket_manager.set_handler("rtt", self.process_rtt_message)
+        self.socket_manager.set_handler("gossip", self.process_gossip_message)
+
+    """
+    General Control Functions
+    """
+
+    async def start(self):
+        """ Binds the socket and starts the node's coroutines """
+        await self.socket_manager.start()
+        if self.poc != None:
+            self._start_task(self.contact_poc())
+        if self.swim is not None:
+            self._start_task(self.run_swim_protocol())
+        else:
+            self._start_task(self.send_heartbeat_messages())
+            self._start_task(self.watch_for_heartbeat_timeouts())
+        self._start_task(self.calculate_rtt_timer())
+        self._start_task(self.watch_for_inactivity())
+
+    async def wait_stopped(self):
+        """ Waits until the node disconnected or terminated itself """
+        await self.stopped.wait()
+
+    def disconnect(self):
+        self.send_disconnect_messages()
+        self._log.write_to_log("Terminated", 'Node has gracefully terminated.')
+        self.stop()
+
+    def stop(self):
+        """ Cancels the node's coroutines and closes its socket """
+        for task in list(self.tasks):
+            task.cancel()
+        self.socket_manager.stop()
+        self.stopped.set()
+
+    async def watch_for_inactivity(self):
+        """ Stops the node once no packet was received for NO_CONTACT_TIMEOUT """
+        while not self.is_inactive():
+            await asyncio.sleep(self.time_until_inactive())
+        self._log.write_to_log(
+            "Terminated", "StarNode terminated due to inactivity with other nodes")
+        self.stop()
+
+    """
+    Application Message Functions
+    """
+
+    def _broadcast_fragments(self, file_name, total, pieces):
+        """ Sends the fragments from a task that waits for room in the windows """
+        return self._start_task(self._send_fragments(file_name, total, pieces))
+
+    async def _send_fragments(self, file_name, total, pieces):
+        transfer_id = FileFragmentMessage.new_transfer_id()
+        destinations, forward = self._get_fragment_destinations()
+        for sequence, piece in enumerate(pieces):
+            for node in destinations:
+                await self.socket_manager.wait_for_room(node)
+                self.socket_manager.send_message(self._generate_fragment_message(
+                    node, forward, transfer_id, sequence, total, file_name, piece))
+        self._log.write_to_log(
+            "Message", f'File sent to all nodes in {total} fragments.')
+
+    """
+    Peer Discovery Functions
+    """
+
+    async def contact_poc(self):
+        while self.directory.poc_not_added(self.poc):
+            self.send_discovery_message(self.poc, reliable=False)
+            await asyncio.sleep(self.POC_RETRY_INTERVAL)
+
+    """
+    Heartbeat Functions
+    """
+
+    async def watch_for_heartbeat_timeouts(self):
+        while True:
+            self.remove_unresponsive_nodes()
+            await asyncio.sleep(self.time_until_next_heartbeat_timeout())
+
+    async def send_heartbeat_messages(self):
+        while True:
+            self.send_heartbeats()
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+
+    """
+    SWIM Membership Functions
+    """
+
+    async def run_swim_protocol(self):
+        while True:
+            self.swim.probe()
+            await asyncio.sleep(self.swim.PING_TIMEOUT)
+            self.swim.probe_indirectly()
+            await asyncio.sleep(self.swim.PROTOCOL_PERIOD - self.swim.PING_TIMEOUT)
+
+    """
+    Round Trip Time (RTT) Functions
+    """
+
+    def _wake_rtt_timer(self):
+        self.rtt_countdown_event.set()
+
+    def _queue_rtt_response(self, response):
+        self.rtt_queue.put_nowait(response)
+
+    async def calculate_rtt_timer(self):
+        """ Calculates RTT whenever self.rtt_countdown has passed """
+        try:
+            while True:
+                while clock.now() < self.rtt_countdown:
+                    self.rtt_countdown_event.clear()
+                    try:
+                        await asyncio.wait_for(self.rtt_countdown_event.wait(),
+                                               self.rtt_countdown - clock.now())
+                    except asyncio.TimeoutError:
+                        pass
+                prev_time = self.rtt_countdown
+                await self.calculate_rtt()
+                if self.rtt_countdown == prev_time:
+                    self.rtt_countdown = clock.now() + self.RTT_COUNTDOWN_INIT
+        except Exception as e:
+            print(e)
+
+    async def calculate_rtt(self):
+        node_list = self.send_rtt_requests()
+        timeout = clock.now() + self.RTT_RESPONSE_TIMEOUT
+        rtt_responses = {}
+        while (clock.now() < timeout) and (len(rtt_responses) < len(node_list)):
+            try:
+                name, message = await asyncio.wait_for(
+                    self.rtt_queue.get(), timeout - clock.now())
+                rtt_responses[name] = message.get_rtt()
+            except asyncio.TimeoutError:
+                pass
+        self.finish_rtt_calculation(node_list, rtt_responses)
+
+    """
+    Util Functions
+    """
+
+    def _create_socket_manager(self, name, port, verbose, **options):
+        return AsyncSocketManager(name, port, self.report, verbose,
+                                  delayed_acks=options.get("delayed_acks", False),
+                                  flow_control=options.get("flow_control", False),
+                                  transport=options.get("transport"))
+
+    def _start_task(self, coroutine):
+        """ Runs `coroutine` on the loop until it ends or the node stops """
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
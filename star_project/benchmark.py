@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+"""
+Benchmarks
+
+Micro benchmarks for the performance sensitive parts of the StarNet.
+
+Usage:
+    python3 benchmark.py <benchmark name>
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import random
+import socket
+import tempfile
+import time
+import tracemalloc
+from queue import Queue
+from threading import Thread
+import clock
+
+from ack_tracker import AckTracker
+from async_star_node import AsyncStarNode
+from contact_directory import ContactDirectory
+from contact_node import ContactNode
+from message_factory import MessageFactory
+from messages import AckMessage, BaseMessage, HeartbeatMessage
+from reliable_socket import ReliableSocket
+from socket_manager import SocketManager
+from star_node import StarNode
+
+
+def _timeit(fn, repeat):
+    """ Returns the average number of seconds a single call to fn takes """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def _print_table(title, header, rows):
+    print(f'\n--------- {title} ---------')
+    print(''.join(format(column, '>16') for column in header))
+    for row in rows:
+        print(''.join(format(column, '>16') for column in row))
+
+
+"""
+ACK Handling
+"""
+
+
+def _create_in_flight_messages(count):
+    origin = ContactNode("origin", "127.0.0.1", 3000)
+    destination = ContactNode("destination", "127.0.0.1", 3001)
+    return [MessageFactory.generate_heartbeat_message(
+        origin_node=origin, destination_node=destination)
+        for _ in range(count)]
+
+
+def _legacy_process_ack(awaiting_ack, message_id):
+    """ The rotating Queue scan SocketManager.process_ack used to do """
+    while True:
+        sent_message, time_sent = awaiting_ack.get()
+        if sent_message.get_message_id() == message_id:
+            return sent_message, time_sent
+        awaiting_ack.put((sent_message, time_sent))
+
+
+def benchmark_ack_handling(sizes=(10, 100, 1000, 10000), acks=200):
+    """ Cost of settling one ACK with `size` messages in flight """
+    rows = []
+    for size in sizes:
+        messages = _create_in_flight_messages(size)
+        # ACKs arrive in any order. Each ACK'd message is put back in flight
+        # so the number of outstanding messages stays constant
+        to_ack = random.sample(messages, min(acks, size))
+
+        tracker = AckTracker()
+        for message in messages:
+            tracker.track(message, time.time(), 1.1)
+
+        def settle_with_table():
+            for message in to_ack:
+                tracker.settle("destination", message.get_message_id())
+                tracker.track(message, time.time(), 1.1)
+
+        queue = Queue()
+        for message in messages:
+            queue.put((message, time.time()))
+
+        def settle_with_queue():
+            for message in to_ack:
+                entry = _legacy_process_ack(queue, message.get_message_id())
+                queue.put(entry)
+
+        table_cost = _timeit(settle_with_table, 5) / len(to_ack)
+        queue_cost = _timeit(settle_with_queue, 1) / len(to_ack)
+        rows.append((size, f'{table_cost * 1e6:.2f} us',
+                     f'{queue_cost * 1e6:.2f} us'))
+
+    _print_table("Cost per ACK", ("in flight", "table", "queue"), rows)
+
+
+def benchmark_retransmit_scheduler(sizes=(1000, 10000, 50000), spread=2.0):
+    """
+    How late retransmissions fire and how much CPU the scheduler uses with
+    `size` deadlines spread evenly over `spread` seconds
+    """
+    rows = []
+    for size in sizes:
+        messages = _create_in_flight_messages(size)
+        tracker = AckTracker()
+        # leave time to fill the tracker before the first deadline is due
+        start = time.time() + 0.5
+        for i, message in enumerate(messages):
+            tracker.track(message, start, spread * i / size)
+
+        time.sleep(max(0, start - time.time()))
+        lateness = []
+        cpu_start = time.process_time()
+        while len(lateness) < size:
+            for message, time_sent, deadline in tracker.wait_for_expired():
+                lateness.append(time.time() - deadline)
+        cpu_used = time.process_time() - cpu_start
+
+        rows.append((size, f'{sum(lateness) / size * 1e3:.2f} ms',
+                     f'{max(lateness) * 1e3:.2f} ms',
+                     f'{cpu_used / spread * 100:.1f} %'))
+
+    _print_table("Retransmit scheduling", ("pending", "avg late",
+                                           "max late", "cpu"), rows)
+
+
+"""
+Bulk Transfer Throughput
+"""
+
+
+class LossySocketManager(SocketManager):
+    """ Drops incoming packets with probability `loss` """
+    loss = 0.0
+
+    def process_incoming_packet(self, data, address):
+        if random.random() >= self.loss:
+            super().process_incoming_packet(data, address)
+
+
+def _run_transfer(port, count, size, loss, flow_control, time_limit):
+    """
+    Sends `count` app messages one way, returns (seconds, delivered,
+    duplicates delivered, duplicates suppressed)
+    """
+    LossySocketManager.loss = loss
+    sender = LossySocketManager(
+        "sender", port, lambda message=None: None, flow_control=flow_control)
+    receiver = LossySocketManager(
+        "receiver", port + 1, lambda message=None: None, flow_control=flow_control)
+    sender.start()
+    receiver.start()
+
+    start = time.time()
+    for i in range(count):
+        message = MessageFactory.generate_app_message(
+            origin_node=sender.node,
+            destination_node=receiver.node,
+            sender=sender.node.get_16_byte_name(),
+            data='x' * size)
+        sender.send_message(message)
+
+    while time.time() < start + time_limit:
+        if sender.awaiting_ack.size() == 0 and sender.flow.pending_count() == 0:
+            break
+        time.sleep(0.01)
+    elapsed = time.time() - start
+
+    received = []
+    while not receiver.messages["app"].empty():
+        received.append(receiver.messages["app"].get().uuid)
+    delivered = len(set(received))
+    suppressed = receiver.duplicates.get_suppressed_count()
+    sender.sock.sock.close()
+    receiver.sock.sock.close()
+    return elapsed, delivered, len(received) - delivered, suppressed
+
+
+def benchmark_throughput(losses=(0.0, 0.01, 0.05), count=2000, size=1000,
+                         time_limit=30):
+    """
+    Loopback throughput of `count` app messages with and without flow
+    control while dropping a fraction of the packets on arrival
+    """
+    rows = []
+    port = 7100
+    for loss in losses:
+        for flow_control in (True, False):
+            elapsed, delivered, duplicates, suppressed = _run_transfer(
+                port, count, size, loss, flow_control, time_limit)
+            port += 2
+            rows.append((f'{loss * 100:.0f} %',
+                         'window' if flow_control else 'unlimited',
+                         f'{delivered}/{count}', f'{elapsed:.2f} s',
+                         f'{delivered * size / elapsed / 1e3:.1f} KB/s',
+                         duplicates, suppressed))
+
+    _print_table("Bulk transfer throughput", ("loss", "mode", "delivered",
+                                              "time", "throughput",
+                                              "dup delivered", "dup dropped"),
+                 rows)
+
+
+"""
+Packet Encoding
+"""
+
+
+def _create_sample_messages():
+    """ Returns a (label, message) pair for every kind of message """
+    origin = ContactNode("origin", "127.0.0.1", 3000)
+    destination = ContactNode("destination", "127.0.0.1", 3001)
+    nodes = [ContactNode(f'Node{i}', "127.0.0.1", 3000 + i).to_json()
+             for i in range(10)]
+    common = {"origin_node": origin, "destination_node": destination}
+    sender = origin.get_16_byte_name()
+    acked = _create_in_flight_messages(32)
+    return [
+        ("discovery", MessageFactory.generate_discovery_message(
+            direction="1", payload=json.dumps(nodes), **common)),
+        ("heartbeat", MessageFactory.generate_heartbeat_message(**common)),
+        ("rtt", MessageFactory.generate_rtt_message(**common)),
+        ("rtt sum", MessageFactory.generate_rtt_message(
+            stage="2", network_size=5, rtt_sum=0.123456, **common)),
+        ("app string", MessageFactory.generate_app_message(
+            sender=sender, data="hello " * 20, **common)),
+        ("app file", MessageFactory.generate_app_message(
+            sender=sender, is_file='1', file_name="file.bin",
+            data=bytes(8192), **common)),
+        ("app file 60K", MessageFactory.generate_app_message(
+            sender=sender, is_file='1', file_name="file.bin",
+            data=bytes(60000), **common)),
+        ("fragment", MessageFactory.generate_fragment_message(
+            sender=sender, transfer_id="0000abcd", sequence=7, total=9,
+            file_name="file.bin", data=bytes(1200), **common)),
+        ("ack", MessageFactory.generate_ack_message(acked[0])),
+        ("batch ack", MessageFactory.generate_batch_ack_message(
+            ack_ids=[message.get_message_id() for message in acked], **common)),
+    ]
+
+
+def _rate(fn, repeat):
+    return f'{1 / _timeit(fn, repeat):,.0f}/s'
+
+
+def benchmark_packet_encoding(repeat=20000):
+    """
+    Messages per second encoded and decoded with the string based
+    to_packet_string/from_packet_string and the buffer based
+    pack_into/from_packet_view, and encoded with encode, which picks one of
+    them by payload size
+    """
+    rows = []
+    buffer = memoryview(bytearray(65536))
+    address = ("127.0.0.1", 3000)
+    for label, message in _create_sample_messages():
+        cls = type(message)
+        packet = message.to_packet_string()
+
+        def decode_string():
+            cls.from_packet_string(address, message.destination_node, packet)
+
+        def decode_view():
+            cls.from_packet_view(address, message.destination_node,
+                                 memoryview(packet))
+
+        def encode_buffer():
+            message.pack_into(buffer)
+
+        def encode():
+            message.encode(buffer)
+
+        rows.append((label,
+                     _rate(message.to_packet_string, repeat),
+                     _rate(encode_buffer, repeat),
+                     _rate(encode, repeat),
+                     _rate(decode_string, repeat),
+                     _rate(decode_view, repeat)))
+
+    _print_table("Messages per second", ("type", "encode str", "encode buf", "encode",
+                                         "decode str", "decode view"), rows)
+
+
+def benchmark_wire_format(repeat=20000):
+    """ Packet size and encode + decode rate of the text and binary formats """
+    rows = []
+    buffer = memoryview(bytearray(65536))
+    address = ("127.0.0.1", 3000)
+    for label, message in _create_sample_messages():
+        if not message.supports_binary():
+            continue
+        MessageFactory.register_name(message.origin_node.name)
+        sizes = []
+        rates = []
+        for wire_version in (0, 1):
+            message.wire_version = wire_version
+
+            def round_trip():
+                length = message.pack_into(buffer)
+                MessageFactory.create_message(
+                    buffer[:length], origin_address=address,
+                    destination_node=message.destination_node)
+
+            sizes.append(message.pack_into(buffer))
+            rates.append(_rate(round_trip, repeat))
+        rows.append((label, f'{sizes[0]} B', f'{sizes[1]} B',
+                     f'{(1 - sizes[1] / sizes[0]) * 100:.0f} %', *rates))
+
+    _print_table("Text vs binary wire format", ("type", "text", "binary",
+                                                "saved", "text rate",
+                                                "binary rate"), rows)
+
+
+"""
+Message Ids
+"""
+
+
+def benchmark_message_ids(threads=8, per_thread=50000):
+    """
+    Generates ids for one destination from several threads at once and
+    checks that none of them collide
+    """
+    origin = ContactNode("origin", "127.0.0.1", 3000)
+    destination = ContactNode("destination", "127.0.0.1", 3001)
+    ids = [[] for _ in range(threads)]
+
+    def generate(results):
+        for _ in range(per_thread):
+            results.append(MessageFactory.get_new_id(origin, destination))
+
+    workers = [Thread(target=generate, args=(results,)) for results in ids]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    total = threads * per_thread
+    unique = len(set(uuid for results in ids for uuid in results))
+    _print_table("Message ids", ("threads", "ids", "unique", "ids/s"),
+                 [(threads, total, unique, f'{total / elapsed:,.0f}')])
+
+
+"""
+Socket I/O
+"""
+
+
+def _run_socket_io(port, count, batch_size, time_limit):
+    """
+    Sends `count` heartbeat packets from one ReliableSocket to another and
+    parses them on arrival. Returns (send seconds, receive seconds, received)
+    """
+    received = []
+    sender = ReliableSocket(port, lambda data, address: None, Queue(),
+                            "sender", batch_size=batch_size)
+    receiver_node = ContactNode("receiver", sender.get_ip(), port + 1)
+
+    def parse(data, address):
+        MessageFactory.create_message(
+            data, origin_address=address, destination_node=receiver_node)
+        received.append(time.perf_counter())
+
+    receiver = ReliableSocket(port + 1, parse, Queue(), "receiver",
+                              batch_size=batch_size)
+    receiver.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    sender_node = ContactNode("sender", sender.get_ip(), port)
+    MessageFactory.register_name(sender_node.name)
+    for _ in range(count):
+        message = MessageFactory.generate_heartbeat_message(
+            origin_node=sender_node, destination_node=receiver_node,
+            direction="0")
+        message.wire_version = BaseMessage.WIRE_VERSION
+        sender.outbox.put(message)
+
+    Thread(target=receiver.start_listening, daemon=True).start()
+    start = time.perf_counter()
+    Thread(target=sender.start_sending, daemon=True).start()
+    while not sender.outbox.empty():
+        time.sleep(0.001)
+    sent = time.perf_counter()
+    deadline = time.time() + time_limit
+    while len(received) < count and time.time() < deadline:
+        time.sleep(0.01)
+    sender.sock.close()
+    receiver.sock.close()
+    finished = received[-1] if received else sent
+    return sent - start, finished - start, len(received)
+
+
+def benchmark_socket_io(count=50000, time_limit=5):
+    """ Packets per second through the socket with and without batched I/O """
+    rows = []
+    port = 7300
+    for batch_size in (1, ReliableSocket.BATCH_SIZE):
+        sending, receiving, received = _run_socket_io(
+            port, count, batch_size, time_limit)
+        port += 2
+        rows.append(('batched' if batch_size > 1 else 'single',
+                     f'{count / sending:,.0f}/s',
+                     f'{received / receiving:,.0f}/s',
+                     f'{received}/{count}'))
+
+    _print_table("Socket I/O", ("mode", "send rate", "receive rate",
+                                "received"), rows)
+
+
+def _run_burst(port, count, parser_workers, time_limit):
+    """
+    Fires `count` pre-encoded heartbeats at a SocketManager as fast as a raw
+    socket can send them. Returns (parsed, dropped by the ring)
+    """
+    receiver = SocketManager("receiver", port, lambda message=None: None,
+                             parser_workers=parser_workers)
+    receiver.start()
+    sender_node = ContactNode("sender", receiver.node.ip, port + 1)
+    MessageFactory.register_name(sender_node.name)
+    buffer = memoryview(bytearray(ReliableSocket.SEND_BUFFER_SIZE))
+    packets = []
+    for _ in range(count):
+        message = MessageFactory.generate_heartbeat_message(
+            origin_node=sender_node, destination_node=receiver.node,
+            direction="0")
+        message.wire_version = BaseMessage.WIRE_VERSION
+        packets.append(bytes(buffer[:message.pack_into(buffer)]))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((receiver.node.ip, port + 1))
+    for packet in packets:
+        sock.sendto(packet, receiver.node.get_address())
+
+    parsed = 0
+    deadline = time.time() + time_limit
+    while time.time() < deadline:
+        if receiver.received_packets.size() == 0 and receiver.outbox.empty():
+            break
+        time.sleep(0.01)
+    while not receiver.messages["heartbeat"].empty():
+        receiver.messages["heartbeat"].get()
+        parsed += 1
+    sock.close()
+    receiver.sock.sock.close()
+    return parsed, receiver.get_receive_drops()
+
+
+def benchmark_receive_burst(count=20000, time_limit=10):
+    """
+    Packets lost to a burst of heartbeats when they are parsed on the
+    listening thread and when they are handed to parser workers
+    """
+    rows = []
+    port = 7400
+    for parser_workers in (0, 1, 4):
+        parsed, ring_drops = _run_burst(port, count, parser_workers, time_limit)
+        port += 2
+        rows.append((parser_workers, f'{parsed}/{count}', ring_drops,
+                     count - parsed - ring_drops))
+
+    _print_table("Receive burst", ("workers", "parsed", "ring drops",
+                                   "socket drops"), rows)
+
+
+"""
+Idle CPU
+"""
+
+
+def _idle_node_names(count):
+    return [f'idle{i}' for i in range(count)]
+
+
+def _measure_idle_cpu(runtime, port, count, warmup, seconds, results):
+    """
+    Starts a StarNet of `count` nodes with `runtime` in this process, lets it
+    settle and puts the CPU time used per node per second on `results`
+    """
+    names = _idle_node_names(count)
+    pocs = [{}] + [{"poc_ip": socket.gethostbyname(socket.gethostname()),
+                    "poc_port": port}] * (count - 1)
+
+    def measure():
+        start_cpu, start = time.process_time(), time.time()
+        time.sleep(seconds)
+        return (time.process_time() - start_cpu) / (time.time() - start) / count
+
+    if runtime == "async":
+        async def run():
+            nodes = []
+            for i, name in enumerate(names):
+                nodes.append(AsyncStarNode(name, port + i, count, **pocs[i]))
+                await nodes[-1].start()
+            await asyncio.sleep(warmup)
+            cpu = await asyncio.get_event_loop().run_in_executor(None, measure)
+            for node in nodes:
+                node.stop()
+            return cpu
+        results.put(clock.run_in_real_time(run()))
+        return
+
+    for i, name in enumerate(names):
+        node = StarNode(name, port + i, count, **pocs[i])
+        node.start_non_blocking()
+        if runtime == "busy-wait":
+            # the loop StarNode.start used to run
+            Thread(target=lambda node=node: [node.check_for_inactivity()
+                                             for _ in iter(int, 1)],
+                   daemon=True).start()
+    time.sleep(warmup)
+    results.put(measure())
+
+
+def benchmark_idle_cpu(count=3, warmup=5, seconds=10):
+    """
+    CPU used by each node of an idle StarNet, measured with process_time in
+    a separate process for every runtime
+    """
+    rows = []
+    port = 7500
+    for runtime in ("busy-wait", "threads", "async"):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_measure_idle_cpu,
+            args=(runtime, port, count, warmup, seconds, results))
+        process.start()
+        cpu = results.get()
+        process.terminate()
+        port += count
+        rows.append((runtime, count, f'{cpu * 100:.2f} %'))
+    for name in _idle_node_names(count):
+        os.remove(f'{name}-log.log')
+
+    _print_table("Idle CPU per node", ("runtime", "nodes", "cpu"), rows)
+
+
+"""
+Directory Sync
+"""
+
+
+def _create_directory(name, port, names=()):
+    directory = ContactDirectory(name, False)
+    directory.set_star_node(ContactNode(name, "10.0.0.1", port))
+    for i, other in enumerate(names):
+        if other != name:
+            directory.add(ContactNode(other, "10.0.0.1", 20000 + i))
+    return directory
+
+
+def _discover(requester, responder, delta):
+    """
+    One discovery request from `requester` answered by `responder`, as
+    StarNode does it, returning the bytes of both payloads
+    """
+    capabilities = {"wire": BaseMessage.WIRE_VERSION}
+    if delta:
+        capabilities.update(requester.get_sync_state(responder.name))
+    request = json.dumps(capabilities)
+    sync_state = json.loads(request)
+    if sync_state.get("directory"):
+        response = responder.serialize_delta(sync_state)
+    else:
+        response = responder.serialize()
+    requester.merge_serialized_directory(json.loads(response), responder.name)
+    return len(request) + len(response)
+
+
+def _join(size, delta):
+    """
+    Bytes and seconds of the discovery traffic when a node joins a StarNet
+    of `size` nodes: it asks the POC for its directory, then every node it
+    contacts finds it unknown and asks it for its directory in turn. One
+    directory stands in for all of those nodes, the newcomer is removed
+    from it again after every request
+    """
+    names = [f'node{i}' for i in range(size)]
+    poc = _create_directory(names[0], 20000, names)
+    peer = _create_directory(names[1], 20001, names)
+    newcomer = _create_directory("newcomer", 30000)
+    start = time.perf_counter()
+    sent = _discover(newcomer, poc, delta)
+    for _ in range(size):
+        sent += _discover(peer, newcomer, delta)
+        peer.remove(newcomer.name)
+    return sent, time.perf_counter() - start
+
+
+def benchmark_directory_sync(sizes=(50, 200, 1000)):
+    """
+    Discovery traffic of a node joining a StarNet of every size, with full
+    directories (legacy) and deltas
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as log_dir:
+        cwd = os.getcwd()
+        os.chdir(log_dir)  # merges write to the node logs
+        try:
+            for size in sizes:
+                for label, delta in (("legacy", False), ("delta", True)):
+                    sent, seconds = _join(size, delta)
+                    rows.append((size, label, f'{sent / 1000:.1f} KB',
+                                 f'{seconds * 1000:.1f} ms'))
+        finally:
+            os.chdir(cwd)
+    _print_table("Discovery per join", ("nodes", "directory", "bytes", "time"), rows)
+
+
+"""
+Parsed Packet Memory
+"""
+
+
+class _DictContactNode(ContactNode):
+    """ ContactNode with an instance __dict__ and an rtt_sum dict, as it used to be """
+
+    def __init__(self, name, ip, port):
+        super().__init__(name, ip, port)
+        self.rtt_sums = {"sum": 0, "network_size": 0}
+
+
+class _DictHeartbeatMessage(HeartbeatMessage):
+    """ HeartbeatMessage with an instance __dict__ """
+
+
+def _parse_packets(message_type, packet, origin, destination, resolve_node, count):
+    packet_view = memoryview(packet)
+    return [message_type.from_binary_view(
+        origin_address=origin.get_address(), destination_node=destination,
+        packet_view=packet_view, lookup_name=MessageFactory.lookup_name,
+        resolve_node=resolve_node) for _ in range(count)]
+
+
+def benchmark_parsed_memory(count=100000):
+    """
+    Memory and blocks held by `count` parsed binary heartbeats, measured
+    with tracemalloc, and the time it took to parse them
+    """
+    directory = _create_directory("node0", 20000, ("node0", "node1"))
+    origin, destination = directory.get("node1"), directory.star_node
+    MessageFactory.register_name(origin.name)
+    message = MessageFactory.generate_heartbeat_message(
+        origin_node=origin, destination_node=destination)
+    message.wire_version = BaseMessage.WIRE_VERSION
+    buffer = memoryview(bytearray(ReliableSocket.SEND_BUFFER_SIZE))
+    packet = bytes(buffer[:message.pack_into(buffer)])
+
+    variants = (
+        ("dict", _DictHeartbeatMessage,
+         lambda name, address: _DictContactNode(name, *address)),
+        ("slots", HeartbeatMessage, None),
+        ("slots + resolve", HeartbeatMessage, directory.resolve),
+    )
+    rows = []
+    for label, message_type, resolve_node in variants:
+        args = (message_type, packet, origin, destination, resolve_node, count)
+        gc.collect()
+        start = time.perf_counter()
+        messages = _parse_packets(*args)
+        seconds = time.perf_counter() - start
+        del messages
+        gc.collect()
+
+        tracemalloc.start()
+        messages = _parse_packets(*args)
+        size, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        tracemalloc.stop()
+        del messages
+        rows.append((label, f'{size / 1e6:.1f} MB', f'{blocks:,}', f'{seconds * 1000:.0f} ms'))
+    _print_table(f'{count:,} parsed heartbeats', ("objects", "memory", "blocks", "parse time"), rows)
+
+
+"""
+Heartbeat Cost
+"""
+
+
+def _fresh_heartbeat_round(origin, destination, buffer):
+    """ A heartbeat and its ACK built and encoded from scratch, as they used to be """
+    heartbeat = HeartbeatMessage(uuid=MessageFactory.get_new_id(origin, destination),
+                                 origin_node=origin, destination_node=destination)
+    heartbeat.wire_version = BaseMessage.WIRE_VERSION
+    heartbeat.encode_into(buffer)
+    ack = AckMessage(uuid=MessageFactory.get_new_id(destination, origin),
+                     origin_node=destination, destination_node=origin, ack_id=heartbeat.get_message_id(),
+                     wire_version=heartbeat.wire_version)
+    ack.encode_into(buffer)
+
+
+def _pooled_heartbeat_round(origin, destination, buffer):
+    """ A heartbeat and its ACK from the free lists, packed from templates """
+    heartbeat = MessageFactory.generate_heartbeat_message(
+        origin_node=origin, destination_node=destination)
+    heartbeat.wire_version = BaseMessage.WIRE_VERSION
+    heartbeat.pack_into(buffer)
+    ack = MessageFactory.generate_ack_message(heartbeat)
+    ack.pack_into(buffer)
+    MessageFactory.recycle(ack)
+    MessageFactory.recycle(heartbeat)
+
+
+def benchmark_heartbeat_cost(count=100000):
+    """
+    Time to create and encode a heartbeat and its ACK, and the number of
+    garbage collections the allocations trigger
+    """
+    origin = ContactNode("origin", "127.0.0.1", 3000)
+    destination = ContactNode("destination", "127.0.0.1", 3001)
+    buffer = memoryview(bytearray(ReliableSocket.SEND_BUFFER_SIZE))
+    rows = []
+    for label, heartbeat_round in (("fresh", _fresh_heartbeat_round),
+                                   ("pooled", _pooled_heartbeat_round)):
+        gc.collect()
+        collections = gc.get_stats()[0]["collections"]
+        seconds = _timeit(lambda: heartbeat_round(origin, destination, buffer), count)
+        collections = gc.get_stats()[0]["collections"] - collections
+        rows.append((label, f'{seconds * 1e6:.2f} us', collections))
+    _print_table(f'{count:,} heartbeats + ACKs', ("messages", "per round", "gc runs"), rows)
+
+
+BENCHMARKS = {
+    "acks": benchmark_ack_handling,
+    "retransmit": benchmark_retransmit_scheduler,
+    "throughput": benchmark_throughput,
+    "encoding": benchmark_packet_encoding,
+    "wire": benchmark_wire_format,
+    "ids": benchmark_message_ids,
+    "socket": benchmark_socket_io,
+    "burst": benchmark_receive_burst,
+    "idle": benchmark_idle_cpu,
+    "directory": benchmark_directory_sync,
+    "memory": benchmark_parsed_memory,
+    "heartbeat": benchmark_heartbeat_cost,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'benchmark', help='the benchmark to run', choices=list(BENCHMARKS) + ['all'])
+    parser.add_argument(
+        '--loss', help='fraction of packets to drop in the throughput benchmark', type=float,
+        nargs='+')
+    args = parser.parse_args()
+
+    options = {
+        "throughput": {"losses": args.loss} if args.loss else {},
+    }
+    if args.benchmark == 'all':
+        for name, benchmark in BENCHMARKS.items():
+            benchmark(**options.get(name, {}))
+    else:
+        BENCHMARKS[args.benchmark](**options.get(args.benchmark, {}))
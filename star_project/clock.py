@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Clock
+
+Every timeout, deadline and sleep in the StarNet goes through the clock
+installed here instead of the time module, so that it can be replaced in
+simulations. The default SystemClock uses the real time. A SimulatedClock
+only moves when it is advanced, so scenarios spanning minutes of protocol
+time (crashes, re-elections, retransmissions) run as fast as the CPU allows
+and the same way every time.
+
+The asyncio runtime runs on a VirtualTimeEventLoop, which advances the
+SimulatedClock to the next timer whenever it has nothing else to do:
+
+    run_in_virtual_time(main())
+
+run_in_real_time(main()) runs it on an ordinary event loop instead, like
+asyncio.run() which Python 3.6 does not have yet.
+
+Threaded nodes on a SimulatedClock sleep until someone calls advance().
+Virtual time only makes sense on a VirtualNetwork, packets from real
+sockets do not stop the clock from jumping ahead.
+"""
+
+import asyncio
+import selectors
+import time
+from threading import Condition
+
+
+class SystemClock():
+
+    def now(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, condition, timeout=None):
+        """ condition.wait(timeout), the caller has to hold the condition's lock """
+        return condition.wait(timeout)
+
+
+class SimulatedClock():
+    """
+    Parameters:
+        - start: Time the clock starts at, defaults to the real time
+    """
+
+    def __init__(self, start=None):
+        self.time = time.time() if start is None else start
+        self.advanced = Condition()
+        self.waiting = set()  # conditions threads are waiting on in wait()
+
+    def now(self):
+        return self.time
+
+    def advance(self, seconds):
+        """ Moves the clock forward and wakes every thread sleeping on it """
+        with self.advanced:
+            self.time += seconds
+            self.advanced.notify_all()
+            waiting = list(self.waiting)
+        for condition in waiting:
+            with condition:
+                condition.notify_all()
+
+    def sleep(self, seconds):
+        """ Blocks until the clock has been advanced by `seconds` """
+        with self.advanced:
+            wake_time = self.time + seconds
+            while self.time < wake_time:
+                self.advanced.wait()
+
+    def wait(self, condition, timeout=None):
+        """
+        Waits for `condition` to be notified or, if there is a timeout, for
+        the clock to be advanced. Callers check their deadline again after
+        every wakeup, as with spurious wakeups of condition.wait
+        """
+        if timeout is None:
+            return condition.wait()
+        with self.advanced:
+            self.waiting.add(condition)
+        try:
+            return condition.wait()
+        finally:
+            with self.advanced:
+                self.waiting.discard(condition)
+
+
+class VirtualTimeSelector():
+    """
+    Selector that polls its file descriptors without blocking and, if the
+    loop has nothing ready to run, advances the SimulatedClock by the
+    timeout instead of sleeping through it. Steps are at least MINIMUM_STEP,
+    smaller ones can vanish in the rounding of a clock holding the seconds
+    since the epoch, and a timer that is due right now is stepped past
+    """
+    MINIMUM_STEP = 1e-6  # seconds
+
+    def __init__(self, simulated_clock):
+        self.clock = simulated_clock
+        self.selector = selectors.DefaultSelector()
+        self.loop = None
+
+    def select(self, timeout=None):
+        ready = self.selector.select(0)
+        if ready or (timeout == 0 and self.loop.has_ready_callbacks()):
+            return ready
+        if timeout is None:
+            return self.selector.select(None)
+        self.clock.advance(max(timeout, self.MINIMUM_STEP))
+        return ready
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """ Event loop whose time is a SimulatedClock """
+
+    def __init__(self, simulated_clock):
+        self.simulated_clock = simulated_clock
+        selector = VirtualTimeSelector(simulated_clock)
+        super().__init__(selector)
+        selector.loop = self
+        # Timers only run once their time has passed, never slightly early
+        # as with a real clock, so code checking a deadline after its timer
+        # fired always finds it expired
+        self._clock_resolution = 0
+        if not hasattr(self, '_ready'):
+            raise RuntimeError(
+                'VirtualTimeEventLoop needs the _ready queue of asyncio.BaseEventLoop')
+
+    def time(self):
+        return self.simulated_clock.now()
+
+    def has_ready_callbacks(self):
+        """
+        Whether callbacks are waiting to run. asyncio has no public way to
+        ask, so this reads the private deque BaseEventLoop keeps them in,
+        which has had this name in every CPython since 3.4
+        """
+        return bool(self._ready)
+
+
+_clock = SystemClock()
+
+
+def install(new_clock):
+    """ Makes every part of the StarNet use `new_clock` """
+    global _clock
+    _clock = new_clock
+
+
+def get_clock():
+    return _clock
+
+
+def now():
+    return _clock.now()
+
+
+def sleep(seconds):
+    _clock.sleep(seconds)
+
+
+def wait(condition, timeout=None):
+    return _clock.wait(condition, timeout)
+
+
+def run_in_virtual_time(coroutine, simulated_clock=None):
+    """
+    Runs `coroutine` on a VirtualTimeEventLoop with `simulated_clock`
+    installed and returns its result
+    """
+    simulated_clock = simulated_clock or SimulatedClock()
+    previous_clock = get_clock()
+    install(simulated_clock)
+    try:
+        return _run_and_close(VirtualTimeEventLoop(simulated_clock), coroutine)
+    finally:
+        install(previous_clock)
+
+
+def run_in_real_time(coroutine):
+    """ Runs `coroutine` on a new event loop, like asyncio.run() from Python 3.7 """
+    return _run_and_close(asyncio.new_event_loop(), coroutine)
+
+
+def _run_and_close(loop, coroutine):
+    """ Runs `coroutine` on `loop`, cancels the tasks it left behind and closes `loop` """
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        tasks = _pending_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+
+
+def _pending_tasks(loop):
+    """ asyncio.all_tasks() is new in Python 3.7, Task.all_tasks() gone in 3.9 """
+    if hasattr(asyncio, 'all_tasks'):
+        return asyncio.all_tasks(loop)
+    return {task for task in asyncio.Task.all_tasks(loop) if not task.done()}
@@ -3,62 +3,161 @@
 Contact Node Directory
 
 Stores information about multiple Contact Nodes
+
+The directory is versioned so that discovery responses only carry what the
+requesting node is missing. Every time a node comes online the version goes
+up by one and the node's name is appended to the change log. Versions start
+at a random value, so a version from before a restart is not mistaken for
+a current one. A discovery request tells the responder:
+
+    - since: the last version of the responder's directory it merged
+    - size and digest: how many nodes it has online and the XOR of their
+    node ids
+
+and the response holds only the responder itself and the nodes that came
+online since that version, only the responder itself if the digests show
+the requester knows every other node (a node contacting a newcomer), or
+else the full directory. The responder is always included because the
+requester may have dropped it since the last merge, and a dropped peer's
+version is forgotten so the next request to it falls back to the digests.
+Nodes that do not advertise the "directory" capability get the old list of
+JSON encoded ContactNodes.
+
+The change log keeps the last MAX_CHANGES versions, deltas from an older
+version fall back to the digests or the full directory.
+
+Changes are made under the lock, but the online nodes are also kept in
+immutable tuples that are replaced whenever a node comes online or is
+removed. Readers (size, get_current_list, serialize) use the current tuple
+without taking the lock.
+
+The Central Node found by check_central_node is remembered along with the
+tuple it was picked from. An RTT sum broadcast only changes the sum of its
+sender, so while no node came online or was removed that sender only has
+to be compared with the last Central Node. Scanning every node for every
+broadcast took O(N^2) per node per RTT round.
+
+Nodes are also indexed by their (ip, port) address, so the POC check and
+resolve, which finds the ContactNode an incoming packet came from, take
+constant time.
 """
 
 import json
+import random
 from threading import RLock
 from contact_node import ContactNode
 from logger import Logger
 
 
 class ContactDirectory():
+    FORMAT = 1  # version of the delta format, advertised in discovery requests
+    MAX_CHANGES = 1024  # versions a delta can be computed from
 
     def __init__(self, name, verbose):
         self.name = name
         self._log = Logger(name, verbose=verbose)
         self.directory = {}
+        self.addresses = {}  # (ip, port) -> ContactNode
         self.star_node = None
         self.lock = RLock()
+        self.first_version = random.randrange(2**32)
+        self.version = self.first_version
+        self.changes = []  # node that came online in each version after first_version
+        self.digest = 0  # XOR of the node ids of every online node
+        self.peer_versions = {}  # name -> version of its directory last merged
+        self.online_nodes = ()  # snapshot of every online node, this one included
+        self.central = None  # (Central Node, its RTT sum, online_nodes it was picked from)
+        self.peers = ()  # snapshot of the online nodes other than this one
 
     def poc_not_added(self, poc):
-        for key in self.directory:
-            node = self.directory[key]
-            if node.ip == poc.ip and node.port == poc.port:
-                return False
-        return True
+        return poc.get_address() not in self.addresses
+
+    def resolve(self, name, address):
+        """
+        Returns the directory's ContactNode for a packet from `name` at
+        `address`, or a new ContactNode if there is none
+        """
+        node = self.addresses.get(address)
+        if node is not None and node.name == name.strip():
+            return node
+        return ContactNode(name, address[0], address[1])
 
     def set_star_node(self, star_node):
         self.star_node = star_node
         self.add(star_node)
 
-    def check_central_node(self):
-        size = self.size()
+    def check_central_node(self, changed=None):
+        """
+        Returns the name and RTT sum of the online node with the lowest RTT
+        sum measured for the current network size, or of this node. If only
+        the RTT sum of the node `changed` was updated since the last check
+        it is the only one compared with the last Central Node
+        """
         with self.lock:
-            central = self.name
-            rtt = self.star_node.rtt_sum["sum"]
-            for name in self.directory:
-                node = self.directory[name]
-                node_rtt = node.rtt_sum["sum"]
-                node_rtt_size = node.rtt_sum["network_size"]
-                if node_rtt < rtt and node.is_online and node_rtt_size == size:
-                    central = name
-                    rtt = node_rtt
-            return central, rtt
+            online_nodes = self.online_nodes
+            last = self.central
+            if changed is None or last is None or last[2] is not online_nodes or \
+                    changed is last[0]:
+                central, rtt = self._find_central_node(online_nodes)
+            else:
+                central, rtt = last[0], last[1]
+                if self._is_lower(changed, central, rtt, len(online_nodes)):
+                    central, rtt = changed, changed.rtt_sum
+            self.central = (central, rtt, online_nodes)
+            return central.name, rtt
+
+    def _find_central_node(self, online_nodes):
+        size = len(online_nodes)
+        central = self.star_node
+        rtt = central.rtt_sum
+        for node in online_nodes:
+            if self._is_lower(node, central, rtt, size):
+                central = node
+                rtt = node.rtt_sum
+        return central, rtt
+
+    @staticmethod
+    def _is_lower(node, central, rtt, size):
+        """ Ties go to the smallest name so every node picks the same one """
+        node_rtt = node.rtt_sum
+        lower = node_rtt < rtt or (node_rtt == rtt and node.name < central.name)
+        return lower and node.rtt_network_size == size
 
     def size(self):
-        with self.lock:
-            size = 0
-            for name in self.directory:
-                if self.directory[name].is_online:
-                    size += 1
-            return size
+        return len(self.online_nodes)
 
     def add(self, node):
         with self.lock:
             if node.name not in self.directory:
-                self.directory[node.name] = node
+                self._insert(node)
             elif node.name in self.directory:
-                self.directory[node.name].revive()
+                self._revive(self.directory[node.name])
+
+    def _insert(self, node):
+        """ Adds a node that is not in the directory yet, the lock has to be held """
+        self.directory[node.name] = node
+        self.addresses[node.get_address()] = node
+        self._came_online(node)
+
+    def _came_online(self, node):
+        """ Records a change in the log, the lock has to be held """
+        self.version += 1
+        self.changes.append(node.name)
+        if len(self.changes) > 2 * self.MAX_CHANGES:
+            dropped = len(self.changes) - self.MAX_CHANGES
+            del self.changes[:dropped]
+            self.first_version += dropped
+        self.digest ^= node.get_node_id()
+        self.online_nodes += (node,)
+        if node.name != self.name:
+            self.peers += (node,)
+
+    def _revive(self, node):
+        if not node.is_online:
+            node.revive()
+            self._came_online(node)
+        else:
+            node.revive()
 
     def get(self, name):
         if name == self.name:
@@ -66,6 +165,11 @@ class ContactDirectory():
         with self.lock:
             return self.directory[name]
 
+    def get_canonical(self, node):
+        """ Returns the directory's ContactNode with the same name as `node` """
+        with self.lock:
+            return self.directory.get(node.get_name(), node)
+
     def exists(self, name):
         with self.lock:
             if name in self.directory:
@@ -74,35 +178,82 @@ class ContactDirectory():
 
     def remove(self, name):
         with self.lock:
-            self.directory[name].is_online = False
+            node = self.directory[name]
+            if node.is_online:
+                self.digest ^= node.get_node_id()
+                self.online_nodes = tuple(n for n in self.online_nodes if n is not node)
+                self.peers = tuple(n for n in self.peers if n is not node)
+            node.is_online = False
+            self.peer_versions.pop(name, None)
 
     def get_current_list(self):
+        """ Returns the online nodes other than this one """
+        return self.peers
+
+    def get_sync_state(self, name):
+        """ What a discovery request to `name` tells it about this directory """
         with self.lock:
-            online_nodes = {k: v for k, v in self.directory.items()
-                            if v.is_online and k != self.name}
-            return online_nodes.values()
+            state = {"directory": self.FORMAT, "size": self.size(), "digest": self.digest}
+            if name in self.peer_versions:
+                state["since"] = self.peer_versions[name]
+            return state
 
     def serialize(self):
         """ Serializes the ContactNode Directory to JSON """
-        directory = []
+        return json.dumps([node.to_json() for node in self.online_nodes])
+
+    def serialize_delta(self, sync_state):
+        """
+        Serializes the nodes missing from the directory described by
+        `sync_state` (see get_sync_state), or every node if that is unknown
+        """
         with self.lock:
-            for key in self.directory:
-                if self.directory[key].is_online:
-                    directory.append(self.directory[key].to_json())
-            return json.dumps(directory)
+            nodes = self._get_delta(sync_state)
+            full = nodes is None
+            if full:
+                nodes = self.online_nodes
+            return json.dumps({
+                "v": self.version,
+                "full": full,
+                "nodes": [node.to_dict() for node in nodes]
+            })
+
+    def _get_delta(self, sync_state):
+        since = sync_state.get("since")
+        if isinstance(since, int) and self.first_version <= since <= self.version:
+            names = dict.fromkeys([self.name] + self.changes[since - self.first_version:])
+            return [self.directory[name] for name in names
+                    if self.directory[name].is_online]
+        size = self.size()
+        if sync_state.get("size") == size and sync_state.get("digest") == self.digest:
+            return []
+        own_digest = self.digest ^ self.star_node.get_node_id()
+        if sync_state.get("size") == size - 1 and sync_state.get("digest") == own_digest:
+            return [self.star_node]
+        return None
 
-    def merge_serialized_directory(self, serialized_directory):
-        """ Adds an array of serialized ContactNodes to the Directory """
+    def merge_serialized_directory(self, serialized_directory, name=None):
+        """
+        Adds the ContactNodes of a discovery response from `name` to the
+        Directory, either a delta or the legacy array of serialized nodes
+        """
+        if isinstance(serialized_directory, dict):
+            nodes = [ContactNode.create_from_dict(item)
+                     for item in serialized_directory["nodes"]]
+        else:
+            nodes = [ContactNode.create_from_json(item)
+                     for item in serialized_directory]
         with self.lock:
-            for item in serialized_directory:
-                node = ContactNode.create_from_json(item)
+            if isinstance(serialized_directory, dict) and name is not None:
+                self.peer_versions[name] = serialized_directory["v"]
+            for node in nodes:
                 if node.name != self.name:
                     if node.name in self.directory:
                         if not self.directory[node.name].is_online:
-                            self.directory[node.name].revive()
+                            self._revive(self.directory[node.name])
                             self._log.write_to_log(
                                 "Discovery", f'{node.name} discovered.')
                     else:
-                        self.directory[node.name] = node
+                        self._insert(node)
                         self._log.write_to_log(
                             "Discovery", f'{node.name} discovered.')
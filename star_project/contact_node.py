@@ -3,37 +3,97 @@
 Contact Node
 
 Stores information about a Contact Node in the StarNet.
+
+A node counts as unresponsive HEARTBEAT_TIMEOUT seconds after it was last
+heard from, or, given a phi threshold, once its phi accrual failure
+detector (see failure_detector.py) reaches that threshold. The detector is
+created with the first heartbeat and started over when the node is revived.
+Every later heartbeat gives it the time since the node was last heard from,
+which may have been through any other packet (see refresh). Until the
+detector is ready HEARTBEAT_TIMEOUT applies either way.
 """
 
 import json
-import time
+import clock
+import zlib
+
+from failure_detector import PhiAccrualDetector
 
 
 class ContactNode():
+    __slots__ = ('name', 'ip', 'port', 'rtt', 'rtt_sum', 'rtt_network_size',
+                 'last_contact', 'is_online', 'srtt', 'rttvar', 'rto',
+                 'failure_detector')
     HEARTBEAT_TIMEOUT = 15  # seconds
 
+    # Retransmission timeout (RTO) constants, see RFC 6298
+    INITIAL_RTO = 1.1  # seconds
+    MIN_RTO = 0.2  # seconds
+    MAX_RTO = 60  # seconds
+    RTO_ALPHA = 1 / 8
+    RTO_BETA = 1 / 4
+
     def __init__(self, name, ip, port):
         self.name = name
         self.ip = ip
         self.port = port
         self.rtt = 9999999999
-        self.rtt_sum = {"sum": 0, "network_size": 0}
-        self.last_contact = time.time()
+        self.rtt_sum = 0.0
+        self.rtt_network_size = 0  # size of the StarNet rtt_sum was computed for
+        self.last_contact = clock.now()
         self.is_online = True
+        self.srtt = None
+        self.rttvar = None
+        self.rto = self.INITIAL_RTO
+        self.failure_detector = None
 
     @classmethod
     def create_from_json(cls, raw_json):
         "returns a new instance of ContactNode from json"
-        data = json.loads(raw_json)
+        return cls.create_from_dict(json.loads(raw_json))
+
+    @classmethod
+    def create_from_dict(cls, data):
+        "returns a new instance of ContactNode from a dict made by to_dict"
         return cls(name=data["name"], ip=data["ip"], port=data["port"])
 
     def update_rtt_sum(self, new_sum, size):
-        self.rtt_sum["sum"] = float(new_sum)
-        self.rtt_sum["network_size"] = int(size)
+        self.rtt_sum = float(new_sum)
+        self.rtt_network_size = int(size)
+
+    def update_rto(self, sample):
+        """ Update the smoothed RTT and RTO with a new ACK round trip sample """
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = (1 - self.RTO_BETA) * self.rttvar + \
+                self.RTO_BETA * abs(self.srtt - sample)
+            self.srtt = (1 - self.RTO_ALPHA) * self.srtt + \
+                self.RTO_ALPHA * sample
+        rto = self.srtt + 4 * self.rttvar
+        self.rto = min(max(rto, self.MIN_RTO), self.MAX_RTO)
+
+    def seed_rto(self, rtt):
+        """ Use an RTT measurement as the first sample if there is none yet """
+        if self.srtt is None:
+            self.update_rto(rtt)
+
+    def get_rto(self, attempt=0):
+        """ Returns the RTO doubled for every previous attempt """
+        return min(self.rto * (2 ** attempt), self.MAX_RTO)
 
     def get_address(self):
         return (self.ip, self.port)
 
+    @staticmethod
+    def name_to_id(name):
+        """ Numeric id of a node used by the binary wire format """
+        return zlib.crc32(name.strip().encode())
+
+    def get_node_id(self):
+        return self.name_to_id(self.name)
+
     def get_16_byte_name(self):
         return format(self.name, '>16')
 
@@ -45,19 +105,43 @@ class ContactNode():
 
     def to_json(self):
         "serializes current object to json"
-        return json.dumps({
+        return json.dumps(self.to_dict())
+
+    def to_dict(self):
+        return {
             "name": self.name,
             "ip": self.ip,
             "port": self.port
-        })
+        }
 
-    def is_unresponsive(self):
-        return self.last_contact + self.HEARTBEAT_TIMEOUT < time.time()
+    def is_unresponsive(self, phi_threshold=None):
+        return self.get_timeout_deadline(phi_threshold) <= clock.now()
+
+    def get_timeout_deadline(self, phi_threshold=None):
+        """ Time at which the node counts as unresponsive without a heartbeat """
+        detector = self.failure_detector
+        if phi_threshold is None or detector is None or not detector.is_ready():
+            return self.last_contact + self.HEARTBEAT_TIMEOUT
+        return self.last_contact + detector.get_timeout(phi_threshold)
 
     def heartbeat(self):
-        self.last_contact = time.time()
+        now = clock.now()
+        if self.failure_detector is None:
+            self.failure_detector = PhiAccrualDetector()
+        else:
+            self.failure_detector.add_interval(now - self.last_contact)
+        self.last_contact = now
+
+    def refresh(self):
+        """ A packet other than a heartbeat arrived from the node """
+        self.last_contact = clock.now()
+
+    def is_idle(self, seconds):
+        """ Whether nothing has been heard from the node for `seconds` """
+        return self.last_contact + seconds <= clock.now()
 
     def revive(self):
         self.is_online = True
-        self.last_contact = time.time()
+        self.last_contact = clock.now()
+        self.failure_detector = None
         self.rtt = 88888888
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Duplicate Filter
+
+Remembers which message ids were recently received from every peer so that
+copies resent after a lost ACK are not handed to the StarNode twice. Every
+peer gets a sliding window over its sequence of message ids: the highest
+id seen so far plus a bitmap of the WINDOW_SIZE ids below it. Ids are
+compared with serial number arithmetic so the window keeps working when a
+sequence wraps around. Text packets only carry the low 16 bits of an id
+(see BaseMessage.TEXT_ID_LENGTH), so they get a window of their own over
+that smaller sequence space.
+
+An id further behind the highest one than WINDOW_SIZE is a straggler. It
+is dropped without moving the window, but it cannot be told apart from a
+message of a peer that restarted with a new random sequence behind its old
+window, so check() reports it as STRAGGLER rather than DUPLICATE and the
+SocketManager does not ACK it. The sender keeps resending it until the
+peer's windows are dropped with forget(), once it announces a new epoch in
+a discovery request or is removed from the directory (see SocketManager).
+
+Parameters:
+    - window_size: How many ids below the highest one are remembered per peer
+"""
+
+from threading import Lock
+
+NEW = "new"
+DUPLICATE = "duplicate"
+STRAGGLER = "straggler"
+
+
+class SequenceWindow():
+    """ The ids recently received from one peer """
+
+    def __init__(self, window_size, sequence, sequence_space):
+        self.window_size = window_size
+        self.sequence_space = sequence_space
+        self.highest = sequence
+        self.bitmap = 1  # bit n set = id (highest - n) was received
+
+    def is_behind(self, sequence):
+        """ Whether `sequence` is too far behind the highest id to be told apart """
+        return -self._distance(sequence, self.highest) >= self.window_size
+
+    def check_and_add(self, sequence):
+        """ Marks `sequence` as received. Returns False if it already was """
+        delta = self._distance(sequence, self.highest)
+        if delta > 0:
+            if delta < self.window_size:
+                self.bitmap = ((self.bitmap << delta) | 1) & self._mask()
+            else:
+                self.bitmap = 1
+            self.highest = sequence
+            return True
+        if -delta >= self.window_size:
+            return False  # too old to tell, it was most likely received
+        bit = 1 << -delta
+        if self.bitmap & bit:
+            return False
+        self.bitmap |= bit
+        return True
+
+    def _mask(self):
+        return (1 << self.window_size) - 1
+
+    def _distance(self, a, b):
+        """ How far `a` is ahead of `b` (negative if behind), mod the sequence space """
+        delta = (a - b) % self.sequence_space
+        if delta >= self.sequence_space // 2:
+            delta -= self.sequence_space
+        return delta
+
+
+class DuplicateFilter():
+    WINDOW_SIZE = 4096  # ids per peer
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.window_size = window_size
+        self.lock = Lock()
+        self.windows = {}  # (peer name, sequence space) -> SequenceWindow
+        self.suppressed = {}  # message type -> duplicates dropped
+        self.stragglers = 0
+
+    def check(self, message):
+        """
+        Records `message` as received. Returns NEW, DUPLICATE if a message
+        with the same id from the same peer was already received or
+        STRAGGLER if its id is behind the window of the peer
+        """
+        sequence_space = message.get_sequence_space()
+        key = (message.origin_node.get_name(), sequence_space)
+        sequence = message.get_sequence()
+        with self.lock:
+            if key not in self.windows:
+                self.windows[key] = SequenceWindow(self.window_size, sequence, sequence_space)
+                return NEW
+            window = self.windows[key]
+            if window.is_behind(sequence):
+                self.stragglers += 1
+                return STRAGGLER
+            if window.check_and_add(sequence):
+                return NEW
+            self.suppressed[message.TYPE_STRING] = \
+                self.suppressed.get(message.TYPE_STRING, 0) + 1
+            return DUPLICATE
+
+    def is_duplicate(self, message):
+        """ Records `message` as received and returns True unless it is NEW """
+        return self.check(message) != NEW
+
+    def forget(self, name):
+        """ Drops the windows of the peer `name`, its next id starts a new one """
+        with self.lock:
+            for key in [key for key in self.windows if key[0] == name]:
+                del self.windows[key]
+
+    def get_suppressed_count(self):
+        with self.lock:
+            return sum(self.suppressed.values())
+
+    def get_straggler_count(self):
+        with self.lock:
+            return self.stragglers
+
+    def get_stats(self):
+        """ Returns a copy of the number of duplicates dropped per message type """
+        with self.lock:
+            return dict(self.suppressed)
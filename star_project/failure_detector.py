@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Failure Detector
+
+Phi accrual failure detector (Hayashibara et al., "The phi accrual failure
+detector"). Instead of a fixed timeout it keeps the times between the last
+WINDOW_SIZE heartbeats of a peer and models them as a normal distribution.
+Heartbeats are not timed by the detector, ContactNode adds the intervals.
+The suspicion level phi of a peer that has been silent for t seconds is
+
+    phi(t) = -log10(P(next heartbeat arrives later than t))
+
+so phi 1 means a 10% chance of a mistake, phi 2 a 1% chance and so on. A
+peer is suspected once phi reaches the threshold. Links with steady
+heartbeats time out soon after a heartbeat is missed, busy links with
+irregular heartbeats get more time.
+
+The detector is not used until MIN_SAMPLES intervals were measured (see
+is_ready). The standard deviation never goes below MIN_STD_DEVIATION and
+ACCEPTABLE_PAUSE is added to the mean, so a single late heartbeat on a
+perfectly regular link is not a failure.
+
+Thresholds go up to MAX_THRESHOLD, beyond it the probabilities underflow
+and every timeout would be the same. Use parse_threshold as the argparse
+type of threshold options.
+
+Parameters:
+    - window_size: Number of heartbeat intervals remembered
+    - min_std_deviation: Smallest standard deviation in seconds used for phi
+    - acceptable_pause: Seconds added to the mean interval
+"""
+
+import argparse
+import math
+from collections import deque
+from functools import lru_cache
+
+MAX_DEVIATIONS = 38  # the probability a normal variable is further out is below 1e-315
+
+
+@lru_cache(maxsize=16)
+def _deviations_for_phi(threshold):
+    """
+    How many standard deviations past the mean phi reaches `threshold`.
+    Found by bisection on erfc since statistics.NormalDist needs Python 3.8
+    """
+    probability_later = 10 ** -threshold
+    low, high = -MAX_DEVIATIONS, MAX_DEVIATIONS
+    for _ in range(64):
+        middle = (low + high) / 2
+        if 0.5 * math.erfc(middle / math.sqrt(2)) > probability_later:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def parse_threshold(text):
+    """ argparse type of a phi threshold, a number in (0, MAX_THRESHOLD] """
+    threshold = float(text)
+    if not 0 < threshold <= PhiAccrualDetector.MAX_THRESHOLD:
+        raise argparse.ArgumentTypeError(
+            f'phi threshold must be above 0 and at most {PhiAccrualDetector.MAX_THRESHOLD}')
+    return threshold
+
+
+class PhiAccrualDetector():
+    __slots__ = ('intervals', 'interval_sum', 'squared_sum', 'min_std_deviation',
+                 'acceptable_pause')
+    THRESHOLD = 8
+    MAX_THRESHOLD = 300
+    WINDOW_SIZE = 100
+    MIN_SAMPLES = 3
+    MIN_STD_DEVIATION = 0.5  # seconds
+    ACCEPTABLE_PAUSE = 3  # seconds
+
+    def __init__(self, window_size=WINDOW_SIZE, min_std_deviation=MIN_STD_DEVIATION,
+                 acceptable_pause=ACCEPTABLE_PAUSE):
+        self.intervals = deque(maxlen=window_size)
+        self.interval_sum = 0.0
+        self.squared_sum = 0.0
+        self.min_std_deviation = min_std_deviation
+        self.acceptable_pause = acceptable_pause
+
+    def add_interval(self, interval):
+        """ Records that a heartbeat arrived `interval` seconds after the last one """
+        if len(self.intervals) == self.intervals.maxlen:
+            oldest = self.intervals[0]
+            self.interval_sum -= oldest
+            self.squared_sum -= oldest * oldest
+        self.intervals.append(interval)
+        self.interval_sum += interval
+        self.squared_sum += interval * interval
+
+    def is_ready(self):
+        """ Whether enough intervals were measured to estimate their distribution """
+        return len(self.intervals) >= self.MIN_SAMPLES
+
+    def get_mean(self):
+        return self.interval_sum / len(self.intervals) + self.acceptable_pause
+
+    def get_std_deviation(self):
+        count = len(self.intervals)
+        mean = self.interval_sum / count
+        variance = max(0.0, self.squared_sum / count - mean * mean)
+        return max(math.sqrt(variance), self.min_std_deviation)
+
+    def phi(self, elapsed):
+        """ Suspicion level after `elapsed` seconds without a heartbeat """
+        deviations = (elapsed - self.get_mean()) / self.get_std_deviation()
+        probability_later = 0.5 * math.erfc(deviations / math.sqrt(2))
+        if probability_later <= 0:
+            return math.inf
+        return -math.log10(probability_later)
+
+    def get_timeout(self, threshold=THRESHOLD):
+        """ Seconds without a heartbeat after which phi reaches `threshold` """
+        return self.get_mean() + _deviations_for_phi(threshold) * self.get_std_deviation()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+File Transfer
+
+Splits files into FileFragmentMessage sized chunks and puts the fragments
+received from other nodes back together.
+
+Neither side holds a whole file in memory. Outgoing files are read one
+fragment at a time and incoming fragments are written straight to their
+offset in a file on disk.
+
+The sequence number and fragment count come from the packet. Fragments
+numbered outside their count, claiming a different count than the
+fragments of the same transfer received before them, or carrying more than
+MAX_DATA_SIZE bytes are rejected before anything is written.
+"""
+
+import math
+import os
+import clock
+from threading import RLock
+
+from messages import FileFragmentMessage
+
+
+def count_fragments(size, fragment_size=FileFragmentMessage.MAX_DATA_SIZE):
+    """ Returns how many fragments a file of `size` bytes is sent in """
+    return max(1, math.ceil(size / fragment_size))
+
+
+def iter_fragments(data, fragment_size=FileFragmentMessage.MAX_DATA_SIZE):
+    """ Yields the pieces of `data` each fragment carries without copying """
+    view = memoryview(data)
+    for i in range(count_fragments(len(data), fragment_size)):
+        yield view[i * fragment_size:(i + 1) * fragment_size]
+
+
+def read_fragments(path, fragment_size=FileFragmentMessage.MAX_DATA_SIZE):
+    """ Yields the pieces of the file at `path` one fragment at a time """
+    with open(path, 'rb') as f:
+        for i in range(count_fragments(os.path.getsize(path), fragment_size)):
+            yield f.read(fragment_size)
+
+
+class IncomingTransfer():
+    """
+    Writes the fragments of one file into a .part file as they arrive. The
+    file grows as fragments are written, so no space is reserved for
+    fragments that never arrive. Which fragments have been received is kept
+    in a bitmap.
+    """
+
+    def __init__(self, output_path, file_name, sender, transfer_id, total):
+        self.output_path = output_path
+        self.file_name = file_name
+        self.sender = sender
+        self.total = total
+        self.received = bytearray(math.ceil(total / 8))
+        self.received_count = 0
+        self.size = 0
+        self.last_update = clock.now()
+
+        self.part_path = f'{output_path}.part-{transfer_id}'
+        self.file = open(self.part_path, 'w+b')
+
+    def get_sender(self):
+        return self.sender
+
+    def add(self, sequence, data):
+        """ Writes a fragment to its offset unless it was already received """
+        self.last_update = clock.now()
+        byte, bit = divmod(sequence, 8)
+        if self.received[byte] & (1 << bit):
+            return
+        self.received[byte] |= 1 << bit
+        self.received_count += 1
+
+        offset = sequence * FileFragmentMessage.MAX_DATA_SIZE
+        self.file.seek(offset)
+        self.file.write(data)
+        self.size = max(self.size, offset + len(data))
+
+    def is_complete(self):
+        return self.received_count == self.total
+
+    def finish(self):
+        """ Move the file to its final name """
+        self.file.close()
+        os.replace(self.part_path, self.output_path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.part_path)
+
+
+class FileAssembler():
+    """
+    Parameters:
+        - name: Name of the StarNode, files are saved as {name}-{file_name}
+    """
+    TRANSFER_TIMEOUT = 60  # seconds without a new fragment before giving up
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = RLock()
+        self.transfers = {}
+        self.completed = {}  # key -> time, catches fragments resent late
+
+    def add_fragment(self, message):
+        """
+        Writes the fragment carried by `message` to disk. Returns the
+        IncomingTransfer once every fragment of the file has arrived and the
+        file has been saved, otherwise None. Duplicate and invalid fragments
+        are ignored.
+        """
+        key = (message.get_sender(), message.transfer_id)
+        with self.lock:
+            self._drop_stale_transfers()
+            if key in self.completed or not self.is_valid_fragment(message):
+                return None
+            if key not in self.transfers:
+                self.transfers[key] = IncomingTransfer(
+                    f'{self.name}-{message.file_name}', message.file_name,
+                    message.get_sender(), message.transfer_id, message.total)
+            transfer = self.transfers[key]
+            transfer.add(message.sequence, message.data)
+            if transfer.is_complete():
+                del self.transfers[key]
+                self.completed[key] = clock.now()
+                transfer.finish()
+                return transfer
+            return None
+
+    def is_valid_fragment(self, message):
+        """
+        Whether the sequence number, fragment count and size of the fragment
+        carried by `message` fit the transfer it belongs to
+        """
+        if message.total < 1 or not 0 <= message.sequence < message.total:
+            return False
+        if len(message.data) > FileFragmentMessage.MAX_DATA_SIZE:
+            return False
+        with self.lock:
+            transfer = self.transfers.get((message.get_sender(), message.transfer_id))
+            return transfer is None or transfer.total == message.total
+
+    def _drop_stale_transfers(self):
+        now = clock.now()
+        stale = [key for key, transfer in self.transfers.items()
+                 if transfer.last_update + self.TRANSFER_TIMEOUT < now]
+        for key in stale:
+            self.transfers.pop(key).abort()
+        self.completed = {key: completed_at for key, completed_at
+                          in self.completed.items()
+                          if completed_at + self.TRANSFER_TIMEOUT >= now}
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Flow Control
+
+Limits how many bulk messages (app messages and file fragments) can be
+waiting for an ACK from a single peer. Every peer gets a congestion window
+that grows while ACKs come back (slow start, then additive increase) and is
+halved when a message has to be resent (multiplicative decrease). Messages
+that do not fit in the window wait in a per-peer queue until an ACK frees a
+slot. Senders streaming a large file can instead block in wait_for_room so
+that only a window's worth of the file is ever held in memory.
+
+Parameters:
+    - send_func: function called with a message once it may be sent
+"""
+
+from collections import deque
+from threading import Condition, RLock
+import clock
+
+
+class PeerWindow():
+    INITIAL_WINDOW = 4  # messages
+    INITIAL_SSTHRESH = 64  # messages
+    MIN_WINDOW = 1  # messages
+    MAX_WINDOW = 512  # messages
+
+    def __init__(self):
+        self.cwnd = self.INITIAL_WINDOW
+        self.ssthresh = self.INITIAL_SSTHRESH
+        self.in_flight = set()
+        self.pending = deque()
+        self.last_decrease = 0
+
+    def has_room(self):
+        return len(self.in_flight) < int(self.cwnd)
+
+    def grow(self):
+        """ Slow start below ssthresh, additive increase above it """
+        if self.cwnd < self.ssthresh:
+            self.cwnd += 1
+        else:
+            self.cwnd += 1 / self.cwnd
+        self.cwnd = min(self.cwnd, self.MAX_WINDOW)
+
+    def shrink(self, rto):
+        """ Halve the window, at most once per retransmission timeout """
+        now = clock.now()
+        if self.last_decrease + rto < now:
+            self.ssthresh = max(self.cwnd / 2, self.MIN_WINDOW * 2)
+            self.cwnd = max(self.cwnd / 2, self.MIN_WINDOW)
+            self.last_decrease = now
+
+
+class FlowController():
+    WINDOWED_TYPES = ("app", "fragment")
+
+    def __init__(self, send_func):
+        self.send = send_func
+        self.lock = RLock()
+        self.room_available = Condition(self.lock)
+        self.windows = {}
+
+    def is_windowed(self, message):
+        return message.TYPE_STRING in self.WINDOWED_TYPES
+
+    def submit(self, message):
+        """ Sends `message` if its peer's window has room, otherwise queue it """
+        with self.lock:
+            window = self._get_window(message)
+            if window.has_room() and not window.pending:
+                window.in_flight.add(message.get_message_id())
+                self.send(message)
+            else:
+                window.pending.append(message)
+
+    def has_room(self, name):
+        """ Returns True if a message to the peer `name` would be sent right away """
+        with self.lock:
+            window = self._get_window_by_name(name)
+            return window.has_room() and not window.pending
+
+    def wait_for_room(self, name):
+        """ Blocks until a message to the peer `name` would be sent right away """
+        with self.lock:
+            while not self.has_room(name):
+                self.room_available.wait()
+
+    def on_ack(self, message):
+        """ `message` was received by its peer, grow the window """
+        with self.lock:
+            window = self._get_window(message)
+            if message.get_message_id() in window.in_flight:
+                window.in_flight.discard(message.get_message_id())
+                window.grow()
+            self._release_pending(window)
+
+    def on_loss(self, message):
+        """ `message` timed out and is being resent, shrink the window """
+        with self.lock:
+            window = self._get_window(message)
+            window.shrink(message.destination_node.get_rto())
+
+    def on_drop(self, message):
+        """ `message` was given up on, free its slot """
+        with self.lock:
+            window = self._get_window(message)
+            window.in_flight.discard(message.get_message_id())
+            self._release_pending(window)
+
+    def pending_count(self):
+        with self.lock:
+            return sum(len(window.pending) for window in self.windows.values())
+
+    def get_window_size(self, name):
+        with self.lock:
+            if name in self.windows:
+                return self.windows[name].cwnd
+            return PeerWindow.INITIAL_WINDOW
+
+    """
+    Util Functions
+    """
+
+    def _get_window(self, message):
+        return self._get_window_by_name(message.destination_node.name)
+
+    def _get_window_by_name(self, name):
+        if name not in self.windows:
+            self.windows[name] = PeerWindow()
+        return self.windows[name]
+
+    def _release_pending(self, window):
+        while window.pending and window.has_room():
+            message = window.pending.popleft()
+            window.in_flight.add(message.get_message_id())
+            self.send(message)
+        self.room_available.notify_all()
@@ -3,11 +3,18 @@
 Logger
 
 Provides Basic Logging functions in a single place.
+
+Setting Logger.enabled to False stops every Logger from writing its log
+file, e.g. in a simulation of hundreds of nodes whose logs nobody reads.
 """
 from time import gmtime, strftime
 
+import clock
+
 
 class Logger():
+    enabled = True
+
     def __init__(self, name, verbose=False):
         self.name = name
         self.verbose = verbose
@@ -22,12 +29,16 @@ class Logger():
             print(f'ERROR {self.name}:  ', text, e)
 
     def clear_log(self):
+        if not self.enabled:
+            return
         with open(self.log_file_name, "w+") as f:
             f.write(f'------------- {self.name} ACTIVITY LOG -------------\n')
 
     def write_to_log(self, message_type, text):
+        if not self.enabled:
+            return
         with open(self.log_file_name, 'a+') as f:
-            time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
+            time = strftime("%Y-%m-%d %H:%M:%S", gmtime(clock.now()))
             message = f'{time} | {message_type} -- {text}\n'
             f.write(message)
 
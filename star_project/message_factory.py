@@ -6,59 +6,180 @@ Provides functionality to create all the different types of messages a StarNet
 node can send.
 """
 
-from messages import DiscoveryMessage, HeartbeatMessage, RTTMessage, AppMessage, AckMessage
+import random
+from threading import Lock
+
+from contact_node import ContactNode
+from messages import DiscoveryMessage, HeartbeatMessage, RTTMessage, AppMessage, AckMessage, \
+    BatchAckMessage, FileFragmentMessage, GossipMessage
 
 
 class MessageFactory():
-    LENGTH_OF_ID = 4
-    uuid = 0
+    """
+    Message ids are sequence numbers counted separately for every pair of
+    origin and destination so the receiver sees consecutive numbers, even
+    from nodes sharing a process. Destinations are told apart by address,
+    since the POC is known under a placeholder name until it answers. They are 32 bits wide, start at a random
+    value and are handed out under a lock because messages are created from
+    many threads.
+
+    Heartbeats and ACKs are kept on free lists once they are done with (see
+    recycle) and the next ones are initialised in place instead of being
+    allocated. Every origin node has its own free lists, so nodes sharing a
+    process never hand each other their messages.
+    """
+    SEQUENCE_SPACE = 2 ** 32
+    sequences = {}  # (origin name, destination address) -> next sequence number
+    sequence_lock = Lock()
+    MAX_FREE_MESSAGES = 1024  # per message type and origin node
+    POOLED_TYPES = (HeartbeatMessage, AckMessage)
+    free_messages = {}  # (message type, origin name) -> recycled messages
     code_mapping = {
         "D": DiscoveryMessage,
         "H": HeartbeatMessage,
         "R": RTTMessage,
         "A": AppMessage,
-        "K": AckMessage
+        "F": FileFragmentMessage,
+        "K": AckMessage,
+        "B": BatchAckMessage,
+        "G": GossipMessage
     }
 
     @classmethod
-    def get_new_id(cls):
-        new_id = str(cls.uuid % (10 ** cls.LENGTH_OF_ID))
-        new_id = new_id.zfill(cls.LENGTH_OF_ID)
-        cls.uuid += 1
-        return new_id
+    def get_new_id(cls, origin_node, destination_node):
+        """ Returns the next uuid for a message from `origin_node` to `destination_node` """
+        key = (origin_node.get_name(), destination_node.get_address())
+        with cls.sequence_lock:
+            sequence = cls.sequences.get(key)
+            if sequence is None:
+                sequence = random.randrange(cls.SEQUENCE_SPACE)
+            cls.sequences[key] = (sequence + 1) % cls.SEQUENCE_SPACE
+        return AckMessage.format_uuid(sequence)
+
+    @classmethod
+    def _new_id_for(cls, kwargs):
+        """ The next uuid for a message created with the constructor `kwargs` """
+        return cls.get_new_id(kwargs['origin_node'], kwargs['destination_node'])
+
+    binary_code_mapping = {
+        message_type.BINARY_CODE: message_type
+        for message_type in code_mapping.values()
+        if message_type.supports_binary()
+    }
+    node_names = {}  # node id -> 16 byte name, for the binary wire format
+
+    @classmethod
+    def register_name(cls, name):
+        """ Remember `name` so binary packets from that node can be parsed """
+        name = format(name.strip(), '>16')
+        cls.node_names[ContactNode.name_to_id(name)] = name
+
+    @classmethod
+    def lookup_name(cls, node_id):
+        if node_id not in cls.node_names:
+            raise ValueError(f'Packet from unknown node id {node_id}')
+        return cls.node_names[node_id]
+
+    @classmethod
+    def is_binary_packet(cls, raw_packet_data):
+        return raw_packet_data[0] >= 0x80
 
     @classmethod
     def _get_message_type(cls, raw_packet_data):
-        code_bit = raw_packet_data[:1].decode()
+        if cls.is_binary_packet(raw_packet_data):
+            return cls.binary_code_mapping[raw_packet_data[0]]
+        code_bit = chr(raw_packet_data[0])
         return cls.code_mapping[code_bit]
 
     @classmethod
     def create_message(cls, packet_data, **kwargs):
-        message_type = cls._get_message_type(packet_data)
-        return message_type.from_packet_string(
-            packet_string=packet_data, **kwargs)
+        """ Parse a packet (bytes or memoryview) without copying its payload """
+        packet_view = memoryview(packet_data)
+        message_type = cls._get_message_type(packet_view)
+        if cls.is_binary_packet(packet_view):
+            message = message_type.from_binary_view(
+                packet_view=packet_view, lookup_name=cls.lookup_name, **kwargs)
+        else:
+            message = message_type.from_packet_view(
+                packet_view=packet_view, **kwargs)
+        cls.register_name(message.origin_node.name)
+        return message
+
+    @classmethod
+    def recycle(cls, message):
+        """
+        Hands back a message that is neither queued to be sent nor waiting
+        for an ACK anymore, if its type is pooled
+        """
+        message_type = type(message)
+        if message_type not in cls.POOLED_TYPES:
+            return
+        free = cls.free_messages.setdefault(
+            (message_type, message.origin_node.get_name()), [])
+        if len(free) < cls.MAX_FREE_MESSAGES:
+            free.append(message)
+
+    @classmethod
+    def _take(cls, message_type, origin_node):
+        """
+        Returns a recycled message of `message_type` from `origin_node`, or
+        None if there is none. Messages are created from several threads,
+        so the list can run empty between checking and taking
+        """
+        free = cls.free_messages.get((message_type, origin_node.get_name()))
+        if free:
+            try:
+                return free.pop()
+            except IndexError:
+                pass
+        return None
 
     @classmethod
     def generate_ack_message(cls, message):
-        return AckMessage(
-            uuid=cls.get_new_id(),
-            origin_node=message.destination_node,
-            destination_node=message.origin_node,
-            ack_id=message.get_message_id()
-        )
+        uuid = cls.get_new_id(message.destination_node, message.origin_node)
+        ack_message = cls._take(AckMessage, message.destination_node)
+        if ack_message is None:
+            return AckMessage(
+                uuid=uuid,
+                origin_node=message.destination_node,
+                destination_node=message.origin_node,
+                ack_id=message.get_message_id(),
+                wire_version=message.wire_version
+            )
+        ack_message.reset(uuid, message.destination_node, message.origin_node,
+                          message.get_message_id(), message.wire_version)
+        return ack_message
+
+    @classmethod
+    def generate_batch_ack_message(cls, **kwargs):
+        return BatchAckMessage(uuid=cls._new_id_for(kwargs), **kwargs)
 
     @classmethod
     def generate_discovery_message(cls, **kwargs):
-        return DiscoveryMessage(uuid=cls.get_new_id(), **kwargs)
+        return DiscoveryMessage(uuid=cls._new_id_for(kwargs), **kwargs)
 
     @classmethod
     def generate_heartbeat_message(cls, **kwargs):
-        return HeartbeatMessage(uuid=cls.get_new_id(), **kwargs)
+        uuid = cls._new_id_for(kwargs)
+        message = cls._take(HeartbeatMessage, kwargs['origin_node'])
+        if message is None:
+            return HeartbeatMessage(uuid=uuid, **kwargs)
+        message.reset(uuid, kwargs['origin_node'], kwargs['destination_node'],
+                      kwargs.get('direction', '0'), kwargs.get('reliable', True))
+        return message
 
     @classmethod
     def generate_rtt_message(cls, **kwargs):
-        return RTTMessage(uuid=cls.get_new_id(), **kwargs)
+        return RTTMessage(uuid=cls._new_id_for(kwargs), **kwargs)
+
+    @classmethod
+    def generate_gossip_message(cls, **kwargs):
+        return GossipMessage(uuid=cls._new_id_for(kwargs), **kwargs)
 
     @classmethod
     def generate_app_message(cls, **kwargs):
-        return AppMessage(uuid=cls.get_new_id(), **kwargs)
+        return AppMessage(uuid=cls._new_id_for(kwargs), **kwargs)
+
+    @classmethod
+    def generate_fragment_message(cls, **kwargs):
+        return FileFragmentMessage(uuid=cls._new_id_for(kwargs), **kwargs)
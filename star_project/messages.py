@@ -6,16 +6,25 @@ Contains classes for all different types of messages used in the StarNet.
 """
 import json
 import random
-import time
+import struct
+from threading import Lock
+import clock
 from contact_node import ContactNode
 
 
+def decode_bytes(data):
+    """ Decode bytes or a memoryview to a string without copying it first """
+    return str(data, 'utf-8')
+
+
 class BaseMessage():
     """
     Holds all the information regarding a packet
 
     Properties:
-    - uuid: unique identifier for this message. Format = sender_name + packet_num
+    - uuid: sequence number of this message for its destination, in hex.
+    Text packets only carry its last TEXT_ID_LENGTH digits, as wide as the
+    ids of nodes from before the binary format, see fit_uuid_to_format()
     - origin_node: ContactNode object representing origin of packet
     - destination_node: ContactNode object representing destination of packet
     - payload: JSON string representing packet payload. Use self.get_payload()
@@ -26,16 +35,72 @@ class BaseMessage():
     payload should be parsed and stored in the message object
     - Overide self.serialize_payload_for_packet() to specify how self.payload
     should be serialized before sending
+    - Optionally override self.pack_payload_into() to write large payloads
+    into the send buffer without concatenating them to the header first
+
+    parse_payload_to_kwargs receives either bytes or a memoryview over the
+    packet, so it should only slice it and decode it with decode_bytes()
+
+    Binary wire format:
+    Messages that set BINARY_CODE can also be sent in a compact binary format
+    once the destination is known to understand it (wire_version > 0). The
+    header is BINARY_HEADER: binary type code (>= 0x80 so it never clashes
+    with a TYPE_CODE), wire version (high 4 bits) + message flags (low 4
+    bits), numeric id of the origin node and the uuid as a 32-bit sequence
+    number. Override get_binary_flags(), pack_binary_payload_into() and
+    parse_binary_payload_to_kwargs() to support it.
+
+    Messages are created for every packet, so every class declares its
+    attributes in __slots__ instead of having an instance __dict__.
+
+    Packet templates:
+    Classes that set TEMPLATED (all with a binary format) are sent at a steady
+    rate to every peer with nothing but their sequence numbers changing.
+    pack_into copies the packet encoded for the first such message to the
+    same destination with the same get_template_key() and patches the
+    changing fields with patch_template(). Every origin node keeps its own
+    MAX_TEMPLATES templates and the oldest one makes way for a new one.
     """
+    __slots__ = ('uuid', 'origin_node', 'destination_node', 'payload', 'resent',
+                 'wire_version')
     TYPE_STRING = None
     TYPE_CODE = None
+    BINARY_CODE = None
+    NAME_LENGTH = 16
+    ID_LENGTH = 8  # 32-bit sequence number in hex
+    TEXT_ID_LENGTH = 4  # low 16 bits of the sequence number in the text format
+    HEADER_LENGTH = 1 + NAME_LENGTH + TEXT_ID_LENGTH
+    SEQUENCE_SPACE = 2 ** 32
+    TEXT_SEQUENCE_SPACE = 16 ** TEXT_ID_LENGTH
+    WIRE_VERSION = 1
+    BINARY_HEADER = struct.Struct('!BBII')
+    BINARY_SEQUENCE = struct.Struct('!I')
+    SEQUENCE_OFFSET = BINARY_HEADER.size - BINARY_SEQUENCE.size
+    UUID_OFFSET = 1 + NAME_LENGTH
+    TEMPLATED = False
+    MAX_TEMPLATES = 4096
+    BUFFER_THRESHOLD = 16384  # bytes of file data, see AppMessage.encode
+    templates = {}  # origin name -> {get_template_key() -> packet}
+    template_lock = Lock()
 
     def __init__(self, uuid, origin_node, destination_node, payload='{}', **kwargs):
         self.uuid = uuid
         self.origin_node = self._ensure_contact_node(origin_node)
         self.destination_node = self._ensure_contact_node(destination_node)
-        self.payload = self._ensure_json_string(payload)
+        if payload != '{}':  # the default needs no validation
+            payload = self._ensure_json_string(payload)
+        self.payload = payload
+        self.resent = 0
+        self.wire_version = kwargs.get('wire_version', 0)
+
+    def reset(self, uuid, origin_node, destination_node, wire_version=0):
+        """ Reinitialise a recycled message in place, see MessageFactory.recycle """
+        self.uuid = uuid
+        self.origin_node = origin_node
+        self.destination_node = destination_node
+        self.payload = '{}'
         self.resent = 0
+        self.wire_version = wire_version
 
     """
     Functions to Override
@@ -49,10 +114,76 @@ class BaseMessage():
         """ Specify how to serialize Message Payload to packet string """
         return self.payload
 
+    def pack_payload_into(self, buffer, header):
+        """
+        Write the `header` string followed by the serialized payload into
+        `buffer`. Returns the length of the packet
+        """
+        payload = self.serialize_payload_for_packet()
+        if isinstance(payload, str):
+            return self._write(buffer, 0, header + payload)
+        offset = self._write(buffer, 0, header)
+        return self._write(buffer, offset, payload)
+
+    def get_binary_flags(self):
+        """ Specify the 4 flag bits sent in the binary header """
+        return 0
+
+    def needs_ack(self):
+        """ Specify whether the receiver has to ACK this Message """
+        return self.TYPE_STRING != "ack"
+
+    def pack_binary_payload_into(self, buffer, offset):
+        """ Write the binary payload at `offset`. Returns the packet length """
+        return offset
+
+    @classmethod
+    def parse_binary_payload_to_kwargs(cls, flags, packet_payload, lookup_name):
+        """
+        Parse a binary payload to a dict to be passed to constructor.
+        `lookup_name` turns a numeric node id back into a 16 byte name
+        """
+        return {}
+
     """
     General Functions
     """
 
+    @classmethod
+    def supports_binary(cls):
+        return cls.BINARY_CODE is not None
+
+    @classmethod
+    def format_uuid(cls, sequence):
+        """ Convert a sequence number to the uuid string used in ids """
+        return format(sequence, f'0{cls.ID_LENGTH}x')
+
+    @classmethod
+    def parse_uuid(cls, uuid):
+        """ Convert a uuid string to its sequence number """
+        return int(uuid, 16)
+
+    @classmethod
+    def parse_text_uuid(cls, text_uuid):
+        """ Convert the id of a text packet to a uuid """
+        return cls.format_uuid(int(text_uuid, 16))
+
+    def is_binary(self):
+        """ Whether this Message is sent in the binary format """
+        return bool(self.wire_version) and self.supports_binary()
+
+    def fit_uuid_to_format(self):
+        """
+        Cuts the uuid down to what the wire format carries, so the id the
+        receiver ACKs is the one we wait for
+        """
+        if not self.is_binary():
+            self.uuid = self.format_uuid(self.get_sequence() % self.TEXT_SEQUENCE_SPACE)
+
+    def get_sequence_space(self):
+        """ How many different uuids the wire format of this Message has """
+        return self.SEQUENCE_SPACE if self.is_binary() else self.TEXT_SEQUENCE_SPACE
+
     def prepare_packet(self):
         """ Return Tuple with string to send in packet & address tuple """
         return (self.to_packet_string(), self.destination_node.get_address())
@@ -67,27 +198,154 @@ class BaseMessage():
         """ Get the combination of the origin name and uuid """
         return self.origin_node.get_16_byte_name() + self.uuid
 
+    def get_text_id(self):
+        """ The message id as it is sent in the text format """
+        return self.origin_node.get_16_byte_name() + self.uuid[-self.TEXT_ID_LENGTH:]
+
+    def get_sequence(self):
+        """ Get the sequence number the uuid was generated from """
+        return self.parse_uuid(self.uuid)
+
     @classmethod
     def from_packet_string(cls, origin_address, destination_node, packet_string):
         """ Create a Message Instance from information received in a packet """
 
         name = packet_string[1:17].decode()
-        origin_node = ContactNode(name, origin_address[0], origin_address[1])
-        uuid = packet_string[17:21].decode()
-        payload_kwargs = cls.parse_payload_to_kwargs(packet_string[21:])
+        origin_node = cls._create_origin_node(name, origin_address)
+        uuid = cls.parse_text_uuid(packet_string[17:cls.HEADER_LENGTH].decode())
+        payload_kwargs = cls.parse_payload_to_kwargs(
+            packet_string[cls.HEADER_LENGTH:])
+        return cls(
+            uuid=uuid,
+            origin_node=origin_node,
+            destination_node=destination_node,
+            **payload_kwargs
+        )
+
+    @classmethod
+    def from_packet_view(cls, origin_address, destination_node, packet_view,
+                         resolve_node=None):
+        """
+        Create a Message Instance from a memoryview over a received packet.
+        The header is decoded once and the payload is parsed from slices of
+        the view, so large payloads are never copied
+        """
+        header = decode_bytes(packet_view[:cls.HEADER_LENGTH])
+        name = header[1:1 + cls.NAME_LENGTH]
+        origin_node = cls._create_origin_node(name, origin_address, resolve_node)
+        payload_kwargs = cls.parse_payload_to_kwargs(
+            packet_view[cls.HEADER_LENGTH:])
+        return cls(
+            uuid=cls.parse_text_uuid(header[cls.UUID_OFFSET:]),
+            origin_node=origin_node,
+            destination_node=destination_node,
+            **payload_kwargs
+        )
+
+    @classmethod
+    def from_binary_view(cls, origin_address, destination_node, packet_view, lookup_name,
+                         resolve_node=None):
+        """ Create a Message Instance from a packet in the binary format """
+        code, flags, node_id, sequence = cls.BINARY_HEADER.unpack_from(
+            packet_view)
+        payload_kwargs = cls.parse_binary_payload_to_kwargs(
+            flags & 0x0f, packet_view[cls.BINARY_HEADER.size:], lookup_name)
+        name = payload_kwargs.pop('name', None) or lookup_name(node_id)
+        origin_node = cls._create_origin_node(name, origin_address, resolve_node)
         return cls(
-            uuid=packet_string[17:21].decode(),
+            uuid=cls.format_uuid(sequence),
             origin_node=origin_node,
             destination_node=destination_node,
+            wire_version=flags >> 4,
             **payload_kwargs
         )
 
+    @staticmethod
+    def _create_origin_node(name, origin_address, resolve_node=None):
+        """
+        The ContactNode a packet came from. `resolve_node(name, address)`
+        can return an existing one so none is allocated per packet
+        """
+        if resolve_node is not None:
+            return resolve_node(name, origin_address)
+        return ContactNode(name, origin_address[0], origin_address[1])
+
+    def encode(self, buffer):
+        """
+        Returns the packet for this Message to be sent, either as new bytes
+        or as a slice of `buffer`. Small text packets are faster to
+        concatenate than to write into the buffer (see benchmark.py
+        encoding), so only the binary format, which has no other encoder,
+        and file data (see AppMessage) are written into it
+        """
+        if self.is_binary():
+            return buffer[:self.pack_into(buffer)]
+        return self.to_packet_string()
+
+    def pack_into(self, buffer):
+        """
+        Write the packet for this Message into `buffer`, a writable memoryview
+        that can be reused between packets. Returns the length of the packet
+        """
+        if self.TEMPLATED:
+            return self.pack_template_into(buffer)
+        return self.encode_into(buffer)
+
+    def encode_into(self, buffer):
+        """ Encode the whole packet for this Message into `buffer` """
+        if self.is_binary():
+            return self.pack_binary_into(buffer)
+        return self.pack_payload_into(buffer, self.TYPE_CODE + self.get_text_id())
+
+    def pack_template_into(self, buffer):
+        """ Copy the cached packet for this kind of Message into `buffer` and patch it """
+        key = self.get_template_key()
+        templates = self.templates.get(self.origin_node.name)
+        template = None if templates is None else templates.get(key)
+        if template is None:
+            length = self.encode_into(buffer)
+            self._store_template(key, bytes(buffer[:length]))
+            return length
+        length = len(template)
+        buffer[:length] = template
+        self.patch_template(buffer, self.wire_version)
+        return length
+
+    def _store_template(self, key, packet):
+        """ Caches a template of the origin node, evicting its oldest if it has too many """
+        with self.template_lock:
+            templates = self.templates.setdefault(self.origin_node.name, {})
+            if len(templates) >= self.MAX_TEMPLATES:
+                del templates[next(iter(templates))]
+            templates[key] = packet
+
+    def get_template_key(self):
+        """ Specify what packets of a TEMPLATED class may share a template """
+        return (self.TYPE_CODE, self.origin_node.name, self.destination_node.name,
+                self.wire_version)
+
+    def patch_template(self, buffer, binary):
+        """ Write the fields that differ between packets of a TEMPLATED class """
+        if binary:
+            self.BINARY_SEQUENCE.pack_into(buffer, self.SEQUENCE_OFFSET, int(self.uuid, 16))
+        else:
+            buffer[self.UUID_OFFSET:self.HEADER_LENGTH] = \
+                self.uuid[-self.TEXT_ID_LENGTH:].encode()
+
+    def pack_binary_into(self, buffer):
+        """ Write the packet for this Message in the binary format """
+        self.BINARY_HEADER.pack_into(
+            buffer, 0, self.BINARY_CODE,
+            (self.WIRE_VERSION << 4) | self.get_binary_flags(),
+            self.origin_node.get_node_id(), self.parse_uuid(self.uuid))
+        return self.pack_binary_payload_into(buffer, self.BINARY_HEADER.size)
+
     def to_packet_string(self):
         """ Convert Message object to string to be sent in packet"""
         # packet_string = self.TYPE_CODE + \
         #     self.get_message_id() + self.serialize_payload_for_packet()
 
-        packet_string = self.TYPE_CODE + self.get_message_id()
+        packet_string = self.TYPE_CODE + self.get_text_id()
         packet_string = packet_string.encode()
 
         serialized_payload = self.serialize_payload_for_packet()
@@ -98,6 +356,14 @@ class BaseMessage():
     Util Functions
     """
 
+    def _write(self, buffer, offset, data):
+        """ Copy a string or bytes-like `data` into `buffer` at `offset` """
+        if isinstance(data, str):
+            data = data.encode()
+        end = offset + len(data)
+        buffer[offset:end] = data
+        return end
+
     def _ensure_json_string(self, json_string):
         """ Ensure json_string is valid JSON """
         if not isinstance(json_string, str):
@@ -116,8 +382,10 @@ class BaseMessage():
 
 
 class DiscoveryMessage(BaseMessage):
+    __slots__ = ('direction', 'disconnect')
     TYPE_STRING = "discovery"
     TYPE_CODE = "D"
+    BINARY_CODE = 0x81
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -127,7 +395,7 @@ class DiscoveryMessage(BaseMessage):
     @classmethod
     def parse_payload_to_kwargs(cls, packet_payload):
         """ Parse package payload string to a dict to be passed to constructor """
-        packet_payload = packet_payload.decode()
+        packet_payload = decode_bytes(packet_payload)
         return {
             'direction': packet_payload[0],
             'disconnect': packet_payload[1],
@@ -138,26 +406,74 @@ class DiscoveryMessage(BaseMessage):
         """ Specify how to serialize Message Payload to packet string """
         return self.direction + self.disconnect + self.payload
 
+    def get_binary_flags(self):
+        return (self.direction == '1') | (self.disconnect == '1') << 1
+
+    def pack_binary_payload_into(self, buffer, offset):
+        """ The name is included so the receiver can resolve our node id """
+        return self._write(buffer, offset,
+                           self.origin_node.get_16_byte_name() + self.payload)
+
+    @classmethod
+    def parse_binary_payload_to_kwargs(cls, flags, packet_payload, lookup_name):
+        packet_payload = decode_bytes(packet_payload)
+        return {
+            'direction': '1' if flags & 1 else '0',
+            'disconnect': '1' if flags & 2 else '0',
+            'name': packet_payload[:cls.NAME_LENGTH],
+            'payload': packet_payload[cls.NAME_LENGTH:]
+        }
+
 
 class HeartbeatMessage(BaseMessage):
+    """
+    Heartbeats sent with reliable=False are not resent and tell the
+    receiver not to ACK them either. The text format carries the flag as a
+    second payload character, which nodes from before it ignore, so they
+    still ACK every heartbeat
+    """
+    __slots__ = ('direction', 'reliable')
     TYPE_STRING = "heartbeat"
     TYPE_CODE = "H"
+    BINARY_CODE = 0x82
+    TEMPLATED = True
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.direction = kwargs.get("direction", '0')
+        self.reliable = kwargs.get("reliable", True)
+
+    def reset(self, uuid, origin_node, destination_node, direction='0', reliable=True):
+        super().reset(uuid, origin_node, destination_node)
+        self.direction = direction
+        self.reliable = reliable
+
+    def get_template_key(self):
+        return (self.TYPE_CODE, self.origin_node.name, self.destination_node.name,
+                self.wire_version, self.direction, self.reliable)
+
+    def needs_ack(self):
+        return self.reliable
 
     @classmethod
     def parse_payload_to_kwargs(cls, packet_payload):
         """ Parse package payload string to a dict to be passed to constructor """
-        packet_payload = packet_payload.decode()
+        packet_payload = decode_bytes(packet_payload)
         return {
             'direction': packet_payload[0],
+            'reliable': packet_payload[1:2] != '0',
         }
 
     def serialize_payload_for_packet(self):
         """ Specify how to serialize Message Payload to packet string """
-        return self.direction
+        return self.direction + ('1' if self.reliable else '0')
+
+    def get_binary_flags(self):
+        return (self.direction == '1') | (not self.reliable) << 1
+
+    @classmethod
+    def parse_binary_payload_to_kwargs(cls, flags, packet_payload, lookup_name):
+        return {'direction': '1' if flags & 1 else '0', 'reliable': not flags & 2}
 
 
 class RTTMessage(BaseMessage):
@@ -165,9 +481,21 @@ class RTTMessage(BaseMessage):
     Stage 0: RTT Initial Request
     Stage 1: RTT Response
     Stage 2: Broadcast RTT Time
+
+    receive_time is set when a request or response is parsed
+
+    The text format of a broadcast has room for a one digit network size.
+    Larger ones are followed by SIZE_SEPARATOR, which nodes from before it
+    cannot parse, but they read larger sizes wrong anyway
     """
+    __slots__ = ('stage', 'rtt_sum', 'send_time', 'rtt_id', 'network_size',
+                 'receive_time')
     TYPE_STRING = "rtt"
     TYPE_CODE = "R"
+    BINARY_CODE = 0x83
+    BINARY_SEND_TIME = struct.Struct('!d')
+    BINARY_RTT_SUM = struct.Struct('!Id')
+    SIZE_SEPARATOR = ":"
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -176,31 +504,68 @@ class RTTMessage(BaseMessage):
         self.send_time = kwargs.get("send_time", "")
         self.rtt_id = kwargs.get("rtt_id", "")
         self.network_size = kwargs.get("network_size", "")
-        self.init_time = time.time()
+        self.receive_time = kwargs.get("receive_time")
 
     @classmethod
     def parse_payload_to_kwargs(cls, packet_payload):
         """ Parse package payload string to a dict to be passed to constructor """
-        packet_payload = packet_payload.decode()
+        packet_payload = decode_bytes(packet_payload)
         stage = packet_payload[0]
         if stage == "2":
+            network_size, separator, rtt_sum = packet_payload[1:].partition(
+                cls.SIZE_SEPARATOR)
+            if not separator:
+                network_size, rtt_sum = packet_payload[1], packet_payload[2:]
             return {
                 'stage': packet_payload[0],
-                'network_size': packet_payload[1],
-                'rtt_sum': packet_payload[2:]
+                'network_size': network_size,
+                'rtt_sum': rtt_sum
             }
         return {
             'stage': packet_payload[0],
             # 'rtt_id': packet_payload[1],
-            'send_time': packet_payload[1:]
+            'send_time': packet_payload[1:],
+            'receive_time': clock.now()
         }
 
     def serialize_payload_for_packet(self):
         """ Specify how to serialize Message Payload to packet string """
         if self.stage == "2":
-            return self.stage + str(self.network_size) + str(self.rtt_sum)
+            network_size = str(self.network_size)
+            if len(network_size) > 1:
+                network_size += self.SIZE_SEPARATOR
+            return self.stage + network_size + str(self.rtt_sum)
         # Add send time
-        return self.stage + str(self.rtt_id) + str(time.time())
+        return self.stage + str(self.rtt_id) + str(clock.now())
+
+    def get_binary_flags(self):
+        return int(self.stage)
+
+    def pack_binary_payload_into(self, buffer, offset):
+        if self.stage == "2":
+            self.BINARY_RTT_SUM.pack_into(
+                buffer, offset, int(self.network_size), float(self.rtt_sum))
+            return offset + self.BINARY_RTT_SUM.size
+        self.BINARY_SEND_TIME.pack_into(buffer, offset, clock.now())
+        return offset + self.BINARY_SEND_TIME.size
+
+    @classmethod
+    def parse_binary_payload_to_kwargs(cls, flags, packet_payload, lookup_name):
+        stage = str(flags)
+        if stage == "2":
+            network_size, rtt_sum = cls.BINARY_RTT_SUM.unpack_from(
+                packet_payload)
+            return {
+                'stage': stage,
+                'network_size': network_size,
+                'rtt_sum': rtt_sum
+            }
+        send_time, = cls.BINARY_SEND_TIME.unpack_from(packet_payload)
+        return {
+            'stage': stage,
+            'send_time': send_time,
+            'receive_time': clock.now()
+        }
 
     def get_rtt_sum(self):
         if self.stage == '2':
@@ -208,7 +573,7 @@ class RTTMessage(BaseMessage):
 
     def get_rtt(self):
         if self.stage != '2':
-            return self.init_time - float(self.send_time)
+            return self.receive_time - float(self.send_time)
 
     def get_network_size(self):
         if self.stage == "2":
@@ -216,6 +581,7 @@ class RTTMessage(BaseMessage):
 
 
 class AppMessage(BaseMessage):
+    __slots__ = ('forward', 'is_file', 'file_name', 'sender', 'data')
     TYPE_STRING = "app"
     TYPE_CODE = "A"
 
@@ -230,19 +596,26 @@ class AppMessage(BaseMessage):
     def get_sender(self):
         return self.sender.strip()
 
+    def encode(self, buffer):
+        """ File data of BUFFER_THRESHOLD bytes or more is copied once, into the buffer """
+        if len(self.data) >= self.BUFFER_THRESHOLD:
+            return buffer[:self.pack_into(buffer)]
+        return self.to_packet_string()
+
     def file_name_length(self):
         return format(len(self.file_name), '>2')
 
     @classmethod
     def parse_payload_to_file_kwargs(cls, packet_payload):
-        file_name_length = int(packet_payload[18:20].decode())
-        file_name = packet_payload[20: 20 + file_name_length].decode()
+        header = decode_bytes(packet_payload[:20])
+        file_name_length = int(header[18:20])
+        file_name = decode_bytes(packet_payload[20: 20 + file_name_length])
         data = packet_payload[20 + file_name_length:]
 
         return {
-            'forward': packet_payload[0:1].decode(),
-            'is_file': packet_payload[1:2].decode(),
-            'sender':  packet_payload[2:18].decode(),
+            'forward': header[0],
+            'is_file': header[1],
+            'sender':  header[2:18],
             'file_name': file_name,
             'data': data
         }
@@ -251,11 +624,11 @@ class AppMessage(BaseMessage):
     def parse_payload_to_kwargs(cls, packet_payload):
         """ Parse package payload string to a dict to be passed to constructor """
 
-        if packet_payload[1:2].decode() == '1':
+        if packet_payload[1:2] == b'1':
             return cls.parse_payload_to_file_kwargs(packet_payload)
 
         # parse payload to string kwargs
-        packet_payload = packet_payload.decode()
+        packet_payload = decode_bytes(packet_payload)
         return {
             'forward': packet_payload[0],
             'is_file': packet_payload[1],
@@ -276,21 +649,196 @@ class AppMessage(BaseMessage):
 
         return self.forward + self.is_file + self.sender + self.data
 
+    def pack_payload_into(self, buffer, header):
+        """ Write file data straight into the buffer after its header """
+        if self.is_file != '1':
+            return super().pack_payload_into(buffer, header)
+        non_file_part = self.forward + self.is_file + self.sender + self.file_name_length() \
+            + self.file_name
+        offset = self._write(buffer, 0, header + non_file_part)
+        return self._write(buffer, offset, self.data)
+
+
+class FileFragmentMessage(BaseMessage):
+    """
+    Carries one piece of a file that is too large for a single packet.
+
+    Payload layout:
+    forward (1) | sender (16) | transfer_id (8) | sequence (8) | total (8) |
+    file name length (2) | file name | data
+    """
+    __slots__ = ('forward', 'sender', 'transfer_id', 'sequence', 'total',
+                 'file_name', 'data')
+    TYPE_STRING = "fragment"
+    TYPE_CODE = "F"
+    MAX_DATA_SIZE = 1200  # bytes, keeps the whole packet below a 1500 MTU
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.forward = kwargs.get('forward', '0')
+        self.sender = kwargs.get('sender')
+        self.transfer_id = kwargs.get('transfer_id')
+        self.sequence = int(kwargs.get('sequence', 0))
+        self.total = int(kwargs.get('total', 1))
+        self.file_name = kwargs.get('file_name', '')
+        self.data = kwargs.get('data', b'')
+
+    @classmethod
+    def new_transfer_id(cls):
+        return format(random.getrandbits(32), '08x')
+
+    def get_sender(self):
+        return self.sender.strip()
+
+    def file_name_length(self):
+        return format(len(self.file_name), '>2')
+
+    @classmethod
+    def parse_payload_to_kwargs(cls, packet_payload):
+        """ Parse package payload string to a dict to be passed to constructor """
+        header = decode_bytes(packet_payload[:43])
+        file_name_length = int(header[41:43])
+        return {
+            'forward': header[0],
+            'sender': header[1:17],
+            'transfer_id': header[17:25],
+            'sequence': header[25:33],
+            'total': header[33:41],
+            'file_name': decode_bytes(packet_payload[43:43 + file_name_length]),
+            'data': packet_payload[43 + file_name_length:]
+        }
+
+    def serialize_fragment_header(self):
+        return self.forward + self.sender + self.transfer_id + \
+            format(self.sequence, '>8') + format(self.total, '>8') + \
+            self.file_name_length() + self.file_name
+
+    def serialize_payload_for_packet(self):
+        """ Specify how to serialize Message Payload to packet string """
+        return self.serialize_fragment_header().encode() + self.data
+
+    def pack_payload_into(self, buffer, header):
+        """ Write the fragment data straight into the buffer after its header """
+        offset = self._write(buffer, 0, header + self.serialize_fragment_header())
+        return self._write(buffer, offset, self.data)
+
+
+class GossipMessage(BaseMessage):
+    """
+    Carries a probe of the SWIM membership protocol (see swim.py) and the
+    membership updates piggybacked on it, both in the JSON payload. Gossip
+    is sent with reliable=False and never ACK'd, a lost probe is what the
+    protocol detects failures with
+    """
+    __slots__ = ()
+    TYPE_STRING = "gossip"
+    TYPE_CODE = "G"
+    BINARY_CODE = 0x85
+
+    def needs_ack(self):
+        return False
+
+    @classmethod
+    def parse_payload_to_kwargs(cls, packet_payload):
+        """ Parse package payload string to a dict to be passed to constructor """
+        return {'payload': decode_bytes(packet_payload)}
+
+    def pack_binary_payload_into(self, buffer, offset):
+        """ The name is included since gossip comes from nodes we never met """
+        return self._write(buffer, offset,
+                           self.origin_node.get_16_byte_name() + self.payload)
+
+    @classmethod
+    def parse_binary_payload_to_kwargs(cls, flags, packet_payload, lookup_name):
+        packet_payload = decode_bytes(packet_payload)
+        return {
+            'name': packet_payload[:cls.NAME_LENGTH],
+            'payload': packet_payload[cls.NAME_LENGTH:]
+        }
+
 
 class AckMessage(BaseMessage):
+    __slots__ = ('ack_id',)
     TYPE_STRING = "ack"
     TYPE_CODE = "K"
+    BINARY_CODE = 0x84
+    BINARY_ACK_ID = struct.Struct('!II')
+    ACKED_SEQUENCE_OFFSET = BaseMessage.BINARY_HEADER.size + 4  # after the node id
+    TEMPLATED = True
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.ack_id = kwargs.get('ack_id')
 
+    def reset(self, uuid, origin_node, destination_node, ack_id, wire_version=0):
+        super().reset(uuid, origin_node, destination_node, wire_version)
+        self.ack_id = ack_id
+
+    @classmethod
+    def parse_payload_to_kwargs(cls, packet_payload):
+        """ Parse package payload string to a dict to be passed to constructor """
+        packet_payload = decode_bytes(packet_payload)
+        name = packet_payload[:cls.NAME_LENGTH]
+        return {"ack_id": name + cls.parse_text_uuid(packet_payload[cls.NAME_LENGTH:])}
+
+    def serialize_payload_for_packet(self):
+        """ Specify how to serialize Message Payload to packet string """
+        return self.ack_id[:self.NAME_LENGTH] + self.ack_id[-self.TEXT_ID_LENGTH:]
+
+    def get_ack_ids(self):
+        return [self.ack_id]
+
+    def pack_into(self, buffer):
+        """ Text ACKs are cheaper to encode than to patch in two places """
+        if self.wire_version:
+            return self.pack_template_into(buffer)
+        return self.encode_into(buffer)
+
+    def patch_template(self, buffer, binary):
+        """ The ACK'd message always comes from the destination, only its sequence changes """
+        super().patch_template(buffer, binary)
+        self.BINARY_SEQUENCE.pack_into(
+            buffer, self.ACKED_SEQUENCE_OFFSET, int(self.ack_id[self.NAME_LENGTH:], 16))
+
+    def pack_binary_payload_into(self, buffer, offset):
+        """ The ACK'd id is sent as the node id and sequence number """
+        name = self.ack_id[:self.NAME_LENGTH]
+        uuid = self.ack_id[self.NAME_LENGTH:]
+        self.BINARY_ACK_ID.pack_into(
+            buffer, offset, ContactNode.name_to_id(name), self.parse_uuid(uuid))
+        return offset + self.BINARY_ACK_ID.size
+
+    @classmethod
+    def parse_binary_payload_to_kwargs(cls, flags, packet_payload, lookup_name):
+        node_id, sequence = cls.BINARY_ACK_ID.unpack_from(packet_payload)
+        return {'ack_id': lookup_name(node_id) + cls.format_uuid(sequence)}
+
+
+class BatchAckMessage(BaseMessage):
+    """
+    ACKs several messages from the same origin at once. The payload is the
+    16 byte name of the origin followed by a comma separated list of uuids
+    """
+    __slots__ = ('ack_ids',)
+    TYPE_STRING = "ack"
+    TYPE_CODE = "B"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.ack_ids = kwargs.get('ack_ids', [])
+
     @classmethod
     def parse_payload_to_kwargs(cls, packet_payload):
         """ Parse package payload string to a dict to be passed to constructor """
-        packet_payload = packet_payload.decode()
-        return {"ack_id": packet_payload}
+        packet_payload = decode_bytes(packet_payload)
+        name = packet_payload[:16]
+        uuids = packet_payload[16:].split(',')
+        return {"ack_ids": [name + uuid for uuid in uuids]}
 
     def serialize_payload_for_packet(self):
         """ Specify how to serialize Message Payload to packet string """
-        return self.ack_id
+        name = self.ack_ids[0][:16]
+        return name + ','.join(ack_id[16:] for ack_id in self.ack_ids)
+
+    def get_ack_ids(self):
+        return self.ack_ids
@@ -9,15 +9,26 @@ Parameters:
     - outbox: Queue that contains messages to be sent out
     - name: Name of the StarNode this socket is attached to
     - verbose: Indicates whether output should be printed with the logger
+    - batch_size: Most packets read or sent per wakeup. With a batch_size
+    above 1 the listener drains every datagram that is already waiting with
+    non-blocking reads before handling them, and the sender takes every
+    queued message (up to batch_size) off the outbox at once
+
+Use set_sent_handler to be told when a message has left the outbox.
 """
 
 import socket
+from queue import Empty
 from logger import Logger
 
 
 class ReliableSocket():
+    SEND_BUFFER_SIZE = 65536  # bytes, larger than any UDP datagram
+    RECEIVE_SIZE = 655070  # bytes
+    BATCH_SIZE = 64  # packets, used when batching is turned on
 
-    def __init__(self, port, process_incoming_packet_func, outbox, name, verbose=False):
+    def __init__(self, port, process_incoming_packet_func, outbox, name, verbose=False,
+                 batch_size=1):
         # Verify Parameters are correct
         self._verify_int(port)
         self._verify_func(process_incoming_packet_func)
@@ -26,18 +37,29 @@ class ReliableSocket():
         self.process_incoming_packet = process_incoming_packet_func
         self._log = Logger(name, verbose)
         self.outbox = outbox
+        self.send_buffer = memoryview(bytearray(self.SEND_BUFFER_SIZE))
+        self.batch_size = batch_size if hasattr(socket, "MSG_DONTWAIT") else 1
+        self.sent_func = None
 
         # Setup Socket
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.host = socket.gethostbyname(socket.gethostname())
         self.sock.bind((self.host, port))
 
+    def set_sent_handler(self, sent_func):
+        """ Calls `sent_func` with every message from the outbox once it was sent """
+        self.sent_func = sent_func
+
     def start_listening(self):
         """ Blocks and listens for incoming packets """
         try:
             while True:
-                data, address = self.sock.recvfrom(655070)
-                self.process_incoming_packet(data, address)
+                if self.batch_size > 1:
+                    for data, address in self.receive_batch():
+                        self.process_incoming_packet(data, address)
+                else:
+                    data, address = self.sock.recvfrom(self.RECEIVE_SIZE)
+                    self.process_incoming_packet(data, address)
 
         except Exception as e:
             print(e)
@@ -49,23 +71,56 @@ class ReliableSocket():
         try:
             self._log.debug(f'Socket is ready to send...')
             while True:
-                message_to_send = self.outbox.get()
-                self.send(message_to_send)
+                messages_to_send = self.get_outbox_batch()
+                for message_to_send in messages_to_send:
+                    self.send(message_to_send)
+                    if self.sent_func is not None:
+                        self.sent_func(message_to_send)
                 self._log.debug(
-                    f'Packet sent successfully. Outbox size: {self.outbox.qsize()}')
+                    f'{len(messages_to_send)} packet(s) sent successfully. Outbox size: {self.outbox.qsize()}')
 
         except Exception as e:
             self._log.error("in ReliableSocket while sending message", e)
 
+    def receive_batch(self):
+        """
+        Blocks until a packet arrives, then reads the packets that are already
+        waiting without blocking. Returns a list of (data, address) tuples
+        """
+        packets = [self.sock.recvfrom(self.RECEIVE_SIZE)]
+        while len(packets) < self.batch_size:
+            try:
+                packets.append(self.sock.recvfrom(
+                    self.RECEIVE_SIZE, socket.MSG_DONTWAIT))
+            except BlockingIOError:
+                break
+        return packets
+
+    def get_outbox_batch(self):
+        """
+        Blocks until a message is queued up, then takes up to batch_size
+        messages off the outbox without blocking
+        """
+        messages = [self.outbox.get()]
+        while len(messages) < self.batch_size:
+            try:
+                messages.append(self.outbox.get_nowait())
+            except Empty:
+                break
+        return messages
+
     def get_ip(self):
         """ Returns the IP of the socket """
         return self.host
 
     def send(self, message):
-        """ Send a Message as a UDP Packet """
-        data, destination = message.prepare_packet()
+        """
+        Send a Message as a UDP Packet. Large packets are written into a
+        send buffer that is reused for every message (see BaseMessage.encode)
+        """
         try:
-            self.sock.sendto(data, destination)
+            self.sock.sendto(message.encode(self.send_buffer),
+                             message.destination_node.get_address())
             return message.uuid
         except Exception as e:
             print(e)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Ring Buffer
+
+Fixed size FIFO between the thread reading packets off the socket and the
+threads parsing them. Adding to a full ring never blocks, the item is
+dropped and counted instead, so a slow parser can never stall the socket.
+
+Parameters:
+    - capacity: Most items the ring holds at once
+"""
+
+from threading import Condition, Lock
+
+
+class RingBuffer():
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError(f'Expected a capacity of at least 1. Recieved: {capacity}')
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0  # next slot to read
+        self.count = 0
+        self.dropped = 0
+        self.lock = Lock()
+        self.not_empty = Condition(self.lock)
+
+    def put(self, item):
+        """ Adds `item` to the ring. Returns False if it was full and dropped it """
+        with self.lock:
+            if self.count == self.capacity:
+                self.dropped += 1
+                return False
+            self.slots[(self.head + self.count) % self.capacity] = item
+            self.count += 1
+            self.not_empty.notify()
+            return True
+
+    def get(self):
+        """ Blocks until an item is available and returns the oldest one """
+        with self.lock:
+            while self.count == 0:
+                self.not_empty.wait()
+            item = self.slots[self.head]
+            self.slots[self.head] = None
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+            return item
+
+    def size(self):
+        with self.lock:
+            return self.count
+
+    def get_dropped_count(self):
+        with self.lock:
+            return self.dropped
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Simulation
+
+Runs a whole StarNet of AsyncStarNodes in one process on a VirtualNetwork
+and measures how long it takes until
+
+    - convergence: every node has every other node in its directory
+    - election: every node agrees on the same Central Node
+    - broadcast: a string sent by one node has reached all the others
+    - false positives: how often a node dropped a peer that was still
+    running from its directory, counted from the start until the crash and
+    per node per hour of that time. The StarNet is left running for
+    `observe` seconds after the broadcast to give the failure detectors time
+    to make mistakes
+    - control traffic: packets sent per node per second while the StarNet
+    is left running, when only heartbeats (or SWIM gossip) and RTT
+    calculations are sent, and how many of them were heartbeats and gossip
+    - crash: the Central Node stops without saying goodbye, until every
+    other node has dropped it from its directory (detected) and agreed on a
+    new Central Node (re-elected)
+
+Times are seconds since the first node was started. Node logs are only
+written with --log-dir, opening a log file for every line is a good part
+of the time a simulation of hundreds of nodes takes.
+
+The simulation runs in virtual time (see clock.py): the clock jumps ahead
+whenever every node is idle, so minutes of heartbeats and timeouts take
+seconds, and with --seed every run is the same. --real-time runs it
+against the real clock instead.
+
+Usage:
+    python3 simulation.py --nodes 100 --latency 0.01 --jitter 0.005 --loss 0.01
+
+--sizes runs one simulation per StarNet size and prints a table of crash
+detection time and control traffic versus N instead, e.g. for SWIM:
+
+    python3 simulation.py --sizes 10 20 50 100 --swim
+
+Parameters:
+    - num_nodes: Number of StarNodes in the StarNet
+    - join_interval: Seconds between two nodes joining the StarNet. Nodes
+    only learn about each other through the POC's directory, so it has to be
+    longer than a discovery round trip or nodes joining at the same time may
+    never find each other
+    - timeout: Seconds to wait for each phase before giving up
+    - observe: Seconds to keep the StarNet running before the crash
+    - crash: Whether to crash the Central Node after the broadcast
+    - phi_threshold: Suspicion level at which nodes drop a peer, None for the
+    fixed HEARTBEAT_TIMEOUT (see StarNode)
+    - piggyback_heartbeats: Whether nodes count every packet as a heartbeat
+    (see StarNode)
+    - swim_membership: Whether nodes detect failures with SWIM gossip
+    instead of heartbeats (see StarNode)
+    - write_logs: Whether the nodes write their log files to the working
+    directory
+    - network_options: latency, jitter, loss, bandwidth, seed and resolution
+    of the VirtualNetwork
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import clock
+from async_star_node import AsyncStarNode
+from failure_detector import PhiAccrualDetector, parse_threshold
+from logger import Logger
+from messages import GossipMessage, HeartbeatMessage
+from virtual_network import VirtualNetwork
+
+
+class SimulatedStarNode(AsyncStarNode):
+    """ AsyncStarNode recording when app messages arrive instead of printing them """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.received = {}  # message data -> time received
+        self.removed = []  # names of the peers that timed out
+
+    def handle_app_message(self, message):
+        self.received[message.data] = clock.now()
+
+    def print_received_file(self, message):
+        pass
+
+    def remove_unresponsive_node(self, node):
+        self.removed.append(node.name)
+        super().remove_unresponsive_node(node)
+
+
+class StarNetSimulation():
+    BASE_PORT = 20000
+    CHECK_INTERVAL = 0.05  # seconds between checks of the StarNet's state
+
+    def __init__(self, num_nodes, join_interval=0.05, timeout=300, observe=60, crash=True,
+                 phi_threshold=PhiAccrualDetector.THRESHOLD, piggyback_heartbeats=False,
+                 swim_membership=False, write_logs=False, **network_options):
+        self.num_nodes = num_nodes
+        self.join_interval = join_interval
+        self.timeout = timeout
+        self.observe = observe
+        self.crash = crash
+        self.phi_threshold = phi_threshold
+        self.piggyback_heartbeats = piggyback_heartbeats
+        self.swim_membership = swim_membership
+        self.write_logs = write_logs
+        self.network_options = network_options
+        self.network = None
+        self.nodes = []
+        self.all_nodes = []
+        self.started = None
+
+    async def run(self):
+        """ Runs every phase and returns a dictionary of results """
+        results = {"nodes": self.num_nodes}
+        self.network = VirtualNetwork(asyncio.get_event_loop(), **self.network_options)
+        self.started = clock.now()
+        wall_started = time.time()
+        logs_enabled = Logger.enabled
+        Logger.enabled = self.write_logs
+        try:
+            await self.start_nodes()
+            results["converged"] = await self.wait_for(self.is_converged)
+            results["elected"] = await self.wait_for(self.is_elected)
+            if results["elected"] is not None:
+                results.update(await self.measure_broadcast())
+            results.update(await self.measure_control_traffic())
+            results.update(self.count_false_positives())
+            if results["elected"] is not None and self.crash:
+                results.update(await self.measure_crash())
+        finally:
+            self.stop()
+            Logger.enabled = logs_enabled
+        elapsed = clock.now() - self.started
+        results["simulated time"] = elapsed
+        results["wall time"] = time.time() - wall_started
+        results["packets"] = self.network.stats["sent"]
+        results["dropped"] = self.network.stats["dropped"]
+        results["packets/node/s"] = self.network.stats["sent"] / self.num_nodes / elapsed
+        return results
+
+    async def start_nodes(self):
+        for i in range(self.num_nodes):
+            poc = {}
+            if self.nodes:
+                poc = {"poc_ip": VirtualNetwork.IP, "poc_port": self.BASE_PORT}
+            node = SimulatedStarNode(f'sim{i}', self.BASE_PORT + i, self.num_nodes,
+                                     transport=self.network.create_endpoint,
+                                     phi_threshold=self.phi_threshold,
+                                     piggyback_heartbeats=self.piggyback_heartbeats,
+                                     swim_membership=self.swim_membership, **poc)
+            self.nodes.append(node)
+            self.all_nodes.append(node)
+            await node.start()
+            await asyncio.sleep(self.join_interval)
+
+    async def wait_for(self, condition):
+        """ Returns the time at which `condition` held or None on timeout """
+        deadline = clock.now() + self.timeout
+        while not condition():
+            if clock.now() > deadline:
+                return None
+            await asyncio.sleep(self.CHECK_INTERVAL)
+        return clock.now() - self.started
+
+    def is_converged(self):
+        return all(node.directory.size() == len(self.nodes) for node in self.nodes)
+
+    def is_elected(self):
+        central_nodes = {node.central_node for node in self.nodes}
+        return self.is_converged() and len(central_nodes) == 1 and None not in central_nodes
+
+    async def measure_crash(self):
+        """
+        Stops the Central Node without any bye messages and times how long
+        the others take to notice and elect a new one
+        """
+        central_node = next(node for node in self.nodes
+                            if node.name == node.central_node)
+        central_node.stop()
+        self.nodes.remove(central_node)
+        crashed = clock.now()
+        detected = await self.wait_for(self.is_converged)
+        reelected = await self.wait_for(lambda: self.is_elected() and
+                                        self.nodes[0].central_node != central_node.name)
+        return {
+            "crash detected": None if detected is None else detected - (crashed - self.started),
+            "crash reelected": None if reelected is None else reelected - (crashed - self.started),
+        }
+
+    async def measure_control_traffic(self):
+        """ Leaves the StarNet running for `observe` seconds and counts the packets sent """
+        sent = self.network.stats["sent"]
+        heartbeats = self.count_sent(HeartbeatMessage)
+        gossip = self.count_sent(GossipMessage)
+        started = clock.now()
+        await asyncio.sleep(self.observe)
+        elapsed = clock.now() - started
+        if not elapsed:
+            return {}
+        return {
+            "control/node/s": (self.network.stats["sent"] - sent) / len(self.nodes) / elapsed,
+            "heartbeats/node/s": (self.count_sent(HeartbeatMessage) - heartbeats) / len(self.nodes) / elapsed,
+            "gossip/node/s": (self.count_sent(GossipMessage) - gossip) / len(self.nodes) / elapsed,
+        }
+
+    def count_sent(self, message_type):
+        """ Packets of `message_type` sent so far in either wire format """
+        codes = (ord(message_type.TYPE_CODE), message_type.BINARY_CODE)
+        return sum(self.network.sent_by_code.get(code, 0) for code in codes)
+
+    def count_false_positives(self):
+        """ Peers dropped by some node while every node was still running """
+        false_positives = sum(len(node.removed) for node in self.all_nodes)
+        hours = (clock.now() - self.started) / 3600
+        return {
+            "false positives": false_positives,
+            "fp/node/h": false_positives / self.num_nodes / hours,
+        }
+
+    async def measure_broadcast(self):
+        """ Sends a string from a random node and times its arrival everywhere """
+        sender = random.choice(self.nodes)
+        data = f'broadcast from {sender.name}'
+        receivers = [node for node in self.nodes if node is not sender]
+        sent = clock.now()
+        sender.broadcast_string(data)
+        await self.wait_for(lambda: all(data in node.received for node in receivers))
+        latencies = sorted(node.received[data] - sent
+                           for node in receivers if data in node.received)
+        if not latencies:
+            return {"delivered": 0}
+        return {
+            "delivered": len(latencies),
+            "latency p50": latencies[len(latencies) // 2],
+            "latency p99": latencies[int(len(latencies) * 0.99)],
+            "latency max": latencies[-1],
+        }
+
+    def stop(self):
+        for node in self.nodes:
+            node.stop()
+
+
+def print_results(results):
+    print('\n--------- StarNet Simulation ---------')
+    for key, value in results.items():
+        if isinstance(value, float):
+            value = f'{value:.3f}'
+        print(format(key, '<18'), 'timed out' if value is None else value)
+
+
+def print_sweep(rows):
+    """ Prints crash detection time and control traffic for every StarNet size """
+    columns = ("nodes", "crash detected", "control/node/s", "heartbeats/node/s",
+               "gossip/node/s", "false positives")
+    print('\n--------- StarNet Simulation ---------')
+    print(*(format(column, '>18') for column in columns))
+    for results in rows:
+        values = []
+        for column in columns:
+            value = results.get(column)
+            if isinstance(value, float):
+                value = f'{value:.3f}'
+            values.append('timed out' if value is None else value)
+        print(*(format(value, '>18') for value in values))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', help='number of star-nodes', type=int, default=100)
+    parser.add_argument('--latency', help='one way latency in seconds', type=float, default=0.01)
+    parser.add_argument('--jitter', help='most extra random latency in seconds', type=float, default=0.0)
+    parser.add_argument('--loss', help='fraction of packets dropped', type=float, default=0.0)
+    parser.add_argument('--bandwidth', help='bytes per second per star-node, 0 for unlimited', type=float, default=0)
+    parser.add_argument('--resolution', help='packets are delivered at the next multiple of this many seconds',
+                        type=float, default=0.0001)
+    parser.add_argument('--join-interval', help='seconds between star-nodes joining', type=float, default=0.05)
+    parser.add_argument('--timeout', help='seconds to wait for each phase', type=float, default=300)
+    parser.add_argument('--seed', help='seed for the virtual network and the star-nodes', type=int)
+    parser.add_argument('--observe', help='seconds to keep the star-net running before the crash',
+                        type=float, default=60)
+    parser.add_argument('--no-crash', help='skip crashing the central node', action='store_true')
+    parser.add_argument('--phi-threshold', help='suspicion level at which star-nodes drop a peer',
+                        type=parse_threshold, default=PhiAccrualDetector.THRESHOLD)
+    parser.add_argument('--fixed-timeout', help='drop peers after a fixed timeout instead',
+                        action='store_true')
+    parser.add_argument('--piggyback-heartbeats', help='count every packet as a heartbeat',
+                        action='store_true')
+    parser.add_argument('--swim', help='detect failures with SWIM gossip instead of heartbeats',
+                        action='store_true')
+    parser.add_argument('--sizes', help='run once per number of star-nodes and compare them',
+                        type=int, nargs='+')
+    parser.add_argument('--real-time', help='run against the real clock instead of virtual time',
+                        action='store_true')
+    parser.add_argument('--log-dir', help='directory the star-node logs are written to')
+    args = parser.parse_args()
+
+    def simulate(num_nodes):
+        simulation = StarNetSimulation(
+            num_nodes, join_interval=args.join_interval, timeout=args.timeout,
+            observe=args.observe, crash=not args.no_crash,
+            phi_threshold=None if args.fixed_timeout else args.phi_threshold,
+            piggyback_heartbeats=args.piggyback_heartbeats, swim_membership=args.swim,
+            latency=args.latency, jitter=args.jitter, loss=args.loss,
+            bandwidth=args.bandwidth, seed=args.seed, resolution=args.resolution,
+            write_logs=args.log_dir is not None)
+        if args.seed is not None:
+            random.seed(args.seed)
+        if args.real_time:
+            return clock.run_in_real_time(simulation.run())
+        return clock.run_in_virtual_time(simulation.run())
+
+    if args.log_dir is not None:
+        os.chdir(args.log_dir)
+    if args.sizes:
+        print_sweep([simulate(num_nodes) for num_nodes in args.sizes])
+    else:
+        print_results(simulate(args.nodes))
@@ -8,40 +8,114 @@ reliable message transmission
 Parameters:
     - name: Name of the StarNode this socket is attached to
     - port: Port number to listen on
-    - report_func: function to be called whenever a packet is received
+    - report_func: function called with every message received, and with
+    no message once the socket is started
     - verbose: Indicates whether output should be printed with the logger
+    - delayed_acks: Coalesce the ACKs for one peer into a single packet sent
+    at most ACK_DELAY seconds after the first message was received. Only
+    enable this when every node in the StarNet understands BatchAckMessages
+    - flow_control: Limit the app messages and file fragments in flight to
+    each peer with a congestion window (see flow_control.py). Off by default.
+    Senders streaming a file wait_for_room either way, without flow control
+    until fewer than STREAM_WINDOW bulk messages to the peer await an ACK
+    - batch_io: Read and send packets in batches (see ReliableSocket)
+    - parser_workers: Number of threads parsing received packets. The
+    listening thread only copies packets into a ring buffer of ring_size
+    packets and never waits for them to be parsed. Packets arriving while the
+    ring is full are dropped and counted. With 0 workers packets are parsed
+    on the listening thread. More than one worker may reorder messages
+    - ring_size: Most received packets waiting to be parsed
+    - transport: Function creating the socket packets are sent and received
+    with, called like ReliableSocket(port, process_incoming_packet_func,
+    outbox, name). Defaults to ReliableSocket, see virtual_network.py for
+    an in-memory one. The socket also needs ReliableSocket's set_sent_handler
+
+Messages received a second time because their ACK was lost are ACK'd again
+but not put in a queue (see duplicate_filter.py). Stragglers, messages
+with an id behind the window of their sender, are neither queued nor ACK'd
+since they may come from a peer that restarted, and its sender would take
+an ACK for delivery. Every SocketManager picks a random epoch when it is
+created and advertises it in its discovery requests. A peer announcing a
+different epoch than before has restarted and its old ids are forgotten,
+as are the ids of peers removed with forget_peer(), so the resent
+stragglers are accepted from then on.
+
+Messages the Central Node has to forward to every peer are neither accepted
+nor ACK'd while MAX_BACKLOG messages are already waiting for room in a
+window or to be handled. Their senders resend them later, so the memory
+used to forward a file does not grow with the size of the file.
+
+Peers that advertise a wire version in their discovery request, or that
+send us a binary packet, are sent messages in the binary wire format
+(see BaseMessage). Everyone else gets the original text format.
 """
 
+import random
 from queue import Queue
-from threading import Thread
-import time
+from threading import Condition, Thread
+import clock
 
+from ack_tracker import AckTracker
+from duplicate_filter import DUPLICATE, NEW, STRAGGLER, DuplicateFilter
+from flow_control import FlowController
 from reliable_socket import ReliableSocket
+from ring_buffer import RingBuffer
 from contact_node import ContactNode
 from message_factory import MessageFactory
+from messages import BaseMessage
 from logger import Logger
 
 
 class SocketManager():
-    ACK_TIMEOUT = 1.1  # seconds
+    ACK_DELAY = 0.02  # seconds
+    MAX_ACK_BATCH = 64  # ACKs per BatchAckMessage
+    RING_SIZE = 4096  # packets
+    MAX_BACKLOG = 4096  # messages, see is_backlogged
+    STREAM_WINDOW = 64  # bulk messages in flight to one peer, see wait_for_room
 
-    def __init__(self, name, port, report_func, verbose=False):
+    def __init__(self, name, port, report_func, verbose=False, delayed_acks=False,
+                 flow_control=False, batch_io=False, parser_workers=1,
+                 ring_size=RING_SIZE, transport=None):
         self._log = Logger(name, verbose)
         self.report = report_func
         self.outbox = Queue()
-        self.awaiting_ack = Queue()
-        self.sock = ReliableSocket(
-            port, self.process_incoming_packet, self.outbox, name, verbose=False)
+        self.awaiting_ack = AckTracker()
+        self.delayed_acks = delayed_acks
+        self.pending_acks = {}
+        self.pending_acks_added = Condition()
+        self.flow_control = flow_control
+        self.flow = FlowController(self._transmit)
+        self.bulk_in_flight = {}  # name -> bulk messages awaiting an ACK without flow control
+        self.bulk_settled = Condition()
+        self.wire_versions = {}
+        self.duplicates = DuplicateFilter()
+        self.epoch = random.getrandbits(32)
+        self.peer_epochs = {}  # name -> epoch advertised in its discovery requests
+        self.parser_workers = parser_workers
+        self.received_packets = RingBuffer(ring_size)
+        self.transport = transport
+        self.resolve_node = None
+        self.sock = self._create_socket(port, name, batch_io)
 
         self.node = ContactNode(name, self.sock.get_ip(), port)
+        MessageFactory.register_name(name)
         self.messages = {
             "heartbeat": Queue(),
             "rtt": Queue(),
             "discovery": Queue(),
             "app": Queue(),
+            "fragment": Queue(),
             "ack": Queue(),
+            "gossip": Queue(),
         }
 
+    def set_node_resolver(self, resolve_node):
+        """
+        Incoming packets get their origin ContactNode from
+        `resolve_node(name, address)` instead of a new one each
+        """
+        self.resolve_node = resolve_node
+
     def start(self):
         """ Initializes the Socket and begins listening and sending """
         listening_thread = Thread(
@@ -50,6 +124,10 @@ class SocketManager():
         sending_thread = Thread(target=self.sock.start_sending, daemon=True)
         sending_thread.start()
 
+        for _ in range(self.parser_workers):
+            parser_thread = Thread(target=self.parse_packets, daemon=True)
+            parser_thread.start()
+
         ack_watch_thread = Thread(target=self.watch_for_acks, daemon=True)
         ack_watch_thread.start()
 
@@ -57,72 +135,307 @@ class SocketManager():
             target=self.watch_for_ack_timeout, daemon=True)
         ack_timeout_thread.start()
 
+        if self.delayed_acks:
+            delayed_ack_thread = Thread(
+                target=self.send_delayed_acks, daemon=True)
+            delayed_ack_thread.start()
+
         self.report()
 
-    def send_message(self, message):
-        """ Queues up a message to be sent out reliably with acks"""
+    def send_message(self, message, reliable=True):
+        """
+        Queues up a message to be sent out reliably with acks. Messages sent
+        with reliable=False are sent once and never resent
+        """
+        self._set_wire_format(message)
+        if not reliable:
+            self._transmit(message, reliable=False)
+        elif self._is_windowed(message):
+            self.flow.submit(message)
+        else:
+            self._transmit(message)
+
+    def wait_for_room(self, destination):
+        """
+        Blocks until a bulk message to `destination` can be sent right away.
+        Without flow control that is while fewer than STREAM_WINDOW of them
+        are waiting for an ACK, so a file streamed to a peer is never queued
+        up as a whole
+        """
+        if self.flow_control:
+            self.flow.wait_for_room(destination.name)
+            return
+        with self.bulk_settled:
+            while not self.has_room(destination):
+                self.bulk_settled.wait()
+
+    def has_room(self, destination):
+        """ Whether a bulk message to `destination` can be sent right away """
+        if self.flow_control:
+            return self.flow.has_room(destination.name)
+        with self.bulk_settled:
+            return self.bulk_in_flight.get(destination.get_name(), 0) < self.STREAM_WINDOW
+
+    def get_capabilities(self):
+        """ Features of this node advertised in discovery requests """
+        return {"wire": BaseMessage.WIRE_VERSION, "epoch": self.epoch}
+
+    def _transmit(self, message, reliable=True):
+        """ Puts a message in the outbox and starts waiting for its ACK """
+        self._send_packet(message)
+        if reliable and message.TYPE_STRING != "ack":
+            timeout = message.destination_node.get_rto(message.resent)
+            self.awaiting_ack.track(message, clock.now(), timeout)
+            if message.resent == 0 and self._is_counted(message):
+                self._count_bulk(message, 1)
+
+    def _set_wire_format(self, message):
+        """
+        Picks the wire format the destination understands. Done once before
+        the message is tracked anywhere since it can cut the uuid short, and
+        kept when it is resent so the receiver sees its uuid in one sequence
+        space
+        """
+        if message.TYPE_STRING != "ack":  # ACKs use the format of the ACK'd message
+            message.wire_version = self.wire_versions.get(
+                message.destination_node.get_name(), 0)
+            message.fit_uuid_to_format()
+
+    def _send_packet(self, message):
         self.outbox.put(message)
-        if message.TYPE_STRING != "ack":
-            self.awaiting_ack.put((message, time.time()))
+
+    def _create_socket(self, port, name, batch_io):
+        """ Creates the socket packets are sent and received with """
+        receive_func = self.receive_packet if self.parser_workers > 0 else self.process_incoming_packet
+        if self.transport is not None:
+            sock = self.transport(port, receive_func, self.outbox, name)
+        else:
+            sock = ReliableSocket(
+                port, receive_func, self.outbox, name, verbose=False,
+                batch_size=ReliableSocket.BATCH_SIZE if batch_io else 1)
+        sock.set_sent_handler(self.message_sent)
+        return sock
+
+    def message_sent(self, message):
+        """ Called by the socket once `message` left the outbox """
+        if message.TYPE_STRING == "ack":
+            MessageFactory.recycle(message)  # never resent
+
+    def _is_windowed(self, message):
+        return self.flow_control and self.flow.is_windowed(message)
+
+    def _is_counted(self, message):
+        """ Bulk messages are counted per peer when there are no windows """
+        return not self.flow_control and self.flow.is_windowed(message)
+
+    def _count_bulk(self, message, change):
+        with self.bulk_settled:
+            name = message.destination_node.get_name()
+            count = self.bulk_in_flight.get(name, 0) + change
+            if count > 0:
+                self.bulk_in_flight[name] = count
+            else:
+                self.bulk_in_flight.pop(name, None)
+            if change < 0:
+                self.bulk_settled.notify_all()
 
     def watch_for_acks(self):
-        """ Wait for incoming ACKs and start a therad to process them """
+        """ Wait for incoming ACKs and settle them as they arrive """
         while True:
             ack_message = self.messages['ack'].get()
-            process_ack_thread = Thread(
-                target=self.process_ack, args=(ack_message,), daemon=True)
-            process_ack_thread.start()
+            self.process_ack(ack_message)
 
     def process_ack(self, ack_message):
-        """ Find the message being ACK'd and mark it received by sender """
-        processing = True
-        while processing:
-            sent_message, time_sent = self.awaiting_ack.get()
-            if sent_message.get_message_id() == ack_message.ack_id:
-                processing = False
-            else:
-                self.awaiting_ack.put((sent_message, time_sent))
+        """
+        Find the message being ACK'd and mark it received by sender. The
+        round trip is used to update the RTO of the destination unless the
+        message was resent, in which case it is unknown which copy was ACK'd
+        """
+        peer_name = ack_message.origin_node.get_name()
+        for ack_id in ack_message.get_ack_ids():
+            entry = self.awaiting_ack.settle(peer_name, ack_id)
+            if entry is not None:
+                sent_message, time_sent, deadline = entry
+                if self._is_windowed(sent_message):
+                    self.flow.on_ack(sent_message)
+                elif self._is_counted(sent_message):
+                    self._count_bulk(sent_message, -1)
+                if sent_message.resent == 0:
+                    sent_message.destination_node.update_rto(
+                        clock.now() - time_sent)
+                    # Sent once and ACK'd, so it is not in the outbox anymore
+                    MessageFactory.recycle(sent_message)
 
     def watch_for_ack_timeout(self):
         """ 
-        Cycles through all messages in the awaiting ack queue and if
-        any message is still in the queue after ACK_TIMEOUT seconds, resend it
+        Sleeps until the earliest retransmission deadline and resends every
+        message that has been waiting longer than its destination's RTO
         """
         while True:
-            sent_message, time_sent = self.awaiting_ack.get()
-            timeout_time = time.time() + self.ACK_TIMEOUT
-            if time_sent + self.ACK_TIMEOUT < time.time():
-                sent_message.resent += 1
-                if sent_message.resent < 15:
-                    self.send_message(sent_message)
-                    self._log.write_to_log(
-                        "ACK", f"Attempt {sent_message.resent} to resend {sent_message.TYPE_STRING} message {sent_message.uuid} to {sent_message.destination_node.get_name()}")
-                else:
-                    self._log.write_to_log(
-                        "ACK", f"Drop message to {sent_message.destination_node.get_name()}")
-            else:
-                self.awaiting_ack.put((sent_message, time_sent))
+            expired = self.awaiting_ack.wait_for_expired()
+            for sent_message, time_sent, deadline in expired:
+                self.resend_message(sent_message)
+
+    def resend_message(self, sent_message):
+        """ Resends a message that was not ACK'd or drops it after 15 attempts """
+        sent_message.resent += 1
+        windowed = self._is_windowed(sent_message)
+        if sent_message.resent < 15:
+            if windowed:
+                self.flow.on_loss(sent_message)
+            self._transmit(sent_message)
+            self._log.write_to_log(
+                "ACK", f"Attempt {sent_message.resent} to resend {sent_message.TYPE_STRING} message {sent_message.uuid} to {sent_message.destination_node.get_name()}")
+        else:
+            if windowed:
+                self.flow.on_drop(sent_message)
+            elif self._is_counted(sent_message):
+                self._count_bulk(sent_message, -1)
+            self._log.write_to_log(
+                "ACK", f"Drop message to {sent_message.destination_node.get_name()}")
 
-            time.sleep(.3)  # Ensure this thread doesn't hog the queue
+    def receive_packet(self, data, address):
+        """ Hands a packet to the parser workers without waiting for them """
+        self.received_packets.put((data, address))
+
+    def parse_packets(self):
+        """ Parser worker, processes packets in the order they were received """
+        while True:
+            data, address = self.received_packets.get()
+            self.process_incoming_packet(data, address)
 
     def process_incoming_packet(self, data, address):
         """
         Takes an incomming packet and uses the Type field of the packet
-        to put it in the proper message queue. Responds to sender w/ ACK packet
+        to put it in the proper message queue. Responds to sender w/ ACK packet.
+        Duplicates are ACK'd again since the first ACK may have been lost,
+        stragglers are not ACK'd at all
         """
         try:
             new_message = MessageFactory.create_message(
                 packet_data=data,
                 origin_address=address,
-                destination_node=self.node)
+                destination_node=self.node,
+                resolve_node=self.resolve_node)
+            if self.is_backlogged(new_message):
+                self._log.write_to_log(
+                    "ACK", f"Backlogged, {new_message.TYPE_STRING} message {new_message.uuid} from {new_message.origin_node.get_name()} not accepted")
+                return
+            self._detect_restart(new_message)
+            received = NEW if new_message.TYPE_STRING == "ack" else \
+                self.duplicates.check(new_message)
+            if received == STRAGGLER:
+                self._log.write_to_log(
+                    "ACK", f"Straggler {new_message.TYPE_STRING} message {new_message.uuid} from {new_message.origin_node.get_name()} not accepted")
+                return
+            if received == DUPLICATE:
+                self._log.write_to_log(
+                    "ACK", f"Duplicate {new_message.TYPE_STRING} message {new_message.uuid} from {new_message.origin_node.get_name()}")
+                if new_message.needs_ack():
+                    self.acknowledge(new_message)
+                return
+            self._update_wire_version(new_message)
             self._put_new_message_in_queue(new_message)
-            self.report()
-            if new_message.TYPE_STRING != "ack":
-                ack_message = MessageFactory.generate_ack_message(new_message)
-                self.send_message(ack_message)
+            self.report(new_message)
+            if new_message.needs_ack():
+                self.acknowledge(new_message)
         except Exception as e:
             print(e)
 
+    def is_backlogged(self, message):
+        """ Whether `message` has to be forwarded while MAX_BACKLOG messages are waiting """
+        if getattr(message, 'forward', '0') != '1':
+            return False
+        return self.get_backlog() >= self.MAX_BACKLOG
+
+    def get_backlog(self):
+        """ Messages waiting for room in a window or to be handled """
+        return self.flow.pending_count() + self.messages["app"].qsize() + \
+            self.messages["fragment"].qsize()
+
+    def acknowledge(self, message):
+        """ Send an ACK for `message` right away or add it to the next batch """
+        if not self.delayed_acks:
+            ack_message = MessageFactory.generate_ack_message(message)
+            self.send_message(ack_message)
+            return
+
+        with self.pending_acks_added:
+            node = message.origin_node
+            name = node.get_name()
+            if name not in self.pending_acks:
+                self.pending_acks[name] = (node, [])
+            ack_ids = self.pending_acks[name][1]
+            ack_ids.append(message.get_message_id())
+            if len(ack_ids) >= self.MAX_ACK_BATCH:
+                del self.pending_acks[name]
+                self._send_ack_batch(node, ack_ids)
+            self.pending_acks_added.notify()
+
+    def send_delayed_acks(self):
+        """
+        Waits for ACKs to be queued up and sends one BatchAckMessage per peer
+        ACK_DELAY seconds after the first one was queued
+        """
+        while True:
+            with self.pending_acks_added:
+                while not self.pending_acks:
+                    self.pending_acks_added.wait()
+            clock.sleep(self.ACK_DELAY)
+            with self.pending_acks_added:
+                batches = self.pending_acks
+                self.pending_acks = {}
+            for node, ack_ids in batches.values():
+                self._send_ack_batch(node, ack_ids)
+
+    def _send_ack_batch(self, destination, ack_ids):
+        ack_message = MessageFactory.generate_batch_ack_message(
+            origin_node=self.node,
+            destination_node=destination,
+            ack_ids=ack_ids)
+        self.send_message(ack_message)
+
+    def forget_peer(self, name):
+        """ Forgets the ids received from a peer that left the StarNet """
+        self.duplicates.forget(name)
+        self.peer_epochs.pop(name, None)
+
+    def _detect_restart(self, message):
+        """ Forgets the ids of a peer whose discovery request has a new epoch """
+        if message.TYPE_STRING != "discovery" or message.direction != "0":
+            return
+        capabilities = message.get_payload()
+        if not isinstance(capabilities, dict) or "epoch" not in capabilities:
+            return
+        name = message.origin_node.get_name()
+        epoch = self.peer_epochs.get(name)
+        if epoch is not None and epoch != capabilities["epoch"]:
+            self.duplicates.forget(name)
+            self._log.write_to_log("ACK", f'{name} restarted, forgetting its message ids')
+        self.peer_epochs[name] = capabilities["epoch"]
+
+    def get_duplicate_stats(self):
+        """ Returns the number of duplicates dropped per message type """
+        return self.duplicates.get_stats()
+
+    def get_receive_drops(self):
+        """ Returns the number of packets dropped because the ring was full """
+        return self.received_packets.get_dropped_count()
+
+    def _update_wire_version(self, message):
+        """ Remember which wire format the sender of `message` understands """
+        name = message.origin_node.get_name()
+        if message.wire_version:
+            self.wire_versions[name] = min(
+                message.wire_version, BaseMessage.WIRE_VERSION)
+        elif message.TYPE_STRING == "discovery" and message.direction == "0":
+            capabilities = message.get_payload()
+            if isinstance(capabilities, dict) and capabilities.get("wire"):
+                self.wire_versions[name] = min(
+                    capabilities["wire"], BaseMessage.WIRE_VERSION)
+            else:
+                self.wire_versions.pop(name, None)
+
     def _put_new_message_in_queue(self, message):
         """
         Takes paresed data from incomming messaged and uses the Type field 
@@ -146,3 +459,11 @@ class SocketManager():
     def get_app_message(self):
         """ Blocks and returns an application message when avaiable """
         return self.messages["app"].get()
+
+    def get_fragment_message(self):
+        """ Blocks and returns a file fragment message when avaiable """
+        return self.messages["fragment"].get()
+
+    def get_gossip_message(self):
+        """ Blocks and returns a SWIM gossip message when avaiable """
+        return self.messages["gossip"].get()
@@ -5,19 +5,27 @@ StarNet Node
 1. Upon startup attempt to contact POC if one is given
 2. Heartbeat Thread starts trying to reach Contact Nodes
 3. RTT Thread starts calculating RTT
+
+With swim_membership the heartbeat threads are replaced by the SWIM gossip
+protocol (see swim.py), which probes one ContactNode per protocol period
+instead of heartbeating all of them. Every node in the StarNet has to use it
 """
 
 import argparse
 import socket
-import time
+import clock
 import json
 import queue
 import os
-from threading import Thread
+from threading import Condition, Thread
 from contact_directory import ContactDirectory
 from contact_node import ContactNode
+from failure_detector import PhiAccrualDetector, parse_threshold
+from file_transfer import FileAssembler, count_fragments, iter_fragments, read_fragments
 from socket_manager import SocketManager
+from swim import SwimMembership
 from message_factory import MessageFactory
+from messages import FileFragmentMessage
 from logger import Logger
 
 
@@ -27,18 +35,31 @@ class StarNode():
     NO_CONTACT_TIMEOUT = 60 * 3  # 3 minutes
     INITIAL_RTT_DEFAULT = 10
     RTT_COUNTDOWN_INIT = 15
-
-    def __init__(self, name, port, num_nodes, poc_ip=0, poc_port=0, verbose=False):
+    RTT_RESPONSE_TIMEOUT = 6  # seconds
+    POC_RETRY_INTERVAL = 2  # seconds
+    HEARTBEAT_INTERVAL = 3  # seconds
+    IDLE_TIMEOUT = ContactNode.HEARTBEAT_TIMEOUT / 2  # seconds, see piggyback_heartbeats
+
+    def __init__(self, name, port, num_nodes, poc_ip=0, poc_port=0, verbose=False,
+                 delayed_acks=False, batch_io=False, parser_workers=1, transport=None,
+                 phi_threshold=PhiAccrualDetector.THRESHOLD, piggyback_heartbeats=False,
+                 swim_membership=False, flow_control=False):
         # Initialize instance variables
         self._log = Logger(name, verbose=verbose)
         self._log.clear_log()
         self.num_nodes = num_nodes
+        self.phi_threshold = phi_threshold  # None times nodes out after HEARTBEAT_TIMEOUT
+        # Every packet counts as a sign of life and only idle nodes get heartbeats
+        self.piggyback_heartbeats = piggyback_heartbeats
         self.central_node = None  # Stores name of central node
         self.shortest_rtt = self.INITIAL_RTT_DEFAULT  # placeholder
         self.rtt_calcd_for_size = 0
 
         self.rtt_queue = queue.Queue()
-        self.rtt_countdown = time.time() + self.RTT_COUNTDOWN_INIT
+        self.rtt_response_received = Condition()
+        self.rtt_countdown = clock.now() + self.RTT_COUNTDOWN_INIT
+        self.rtt_countdown_changed = Condition()
+        self.last_contacted = clock.now()
         self.directory = ContactDirectory(name, verbose)
         if poc_ip != 0 and poc_port != 0:
             self.poc = ContactNode("poc", poc_ip, poc_port)
@@ -46,10 +67,18 @@ class StarNode():
             self.poc = None
 
         # Initialize things related to the socket
-        self.socket_manager = SocketManager(
-            name, port, self.report, verbose)
+        self.socket_manager = self._create_socket_manager(
+            name, port, verbose, delayed_acks=delayed_acks, flow_control=flow_control,
+            batch_io=batch_io, parser_workers=parser_workers, transport=transport)
         self.directory.set_star_node(self.socket_manager.node)
+        self.socket_manager.set_node_resolver(self.directory.resolve)
         self.name = self.socket_manager.node.get_name()
+        self.file_assembler = FileAssembler(self.name)
+        self.swim = None
+        if swim_membership:
+            self.swim = SwimMembership(
+                self.directory, self.socket_manager.node, self.send_gossip,
+                self.add_gossiped_node, self.remove_unresponsive_node, verbose)
 
     """
     General Control Functions
@@ -61,16 +90,21 @@ class StarNode():
 
         if self.poc != None:
             self._start_thread(self.contact_poc, daemon=True)
-            self.send_discovery_message(self.poc)
         self._start_thread(self.watch_for_discovery_messages, daemon=True)
         self._start_thread(self.watch_for_heartbeat_messages, daemon=True)
-        self._start_thread(self.send_heartbeat_messages, daemon=True)
-        self._start_thread(self.watch_for_heartbeat_timeouts, daemon=True)
+        if self.swim is not None:
+            self._start_thread(self.run_swim_protocol, daemon=True)
+            self._start_thread(self.watch_for_gossip_messages, daemon=True)
+        else:
+            self._start_thread(self.send_heartbeat_messages, daemon=True)
+            self._start_thread(self.watch_for_heartbeat_timeouts, daemon=True)
         self._start_thread(self.watch_for_rtt_messages, daemon=True)
         self._start_thread(self.calculate_rtt_timer, daemon=True)
         self._start_thread(self.watch_for_app_messages, daemon=True)
+        self._start_thread(self.watch_for_fragment_messages, daemon=True)
 
         while True:  # Blocking. Nothing can go below this
+            clock.sleep(self.time_until_inactive())
             self.check_for_inactivity()
 
     def start_non_blocking(self):
@@ -81,6 +115,14 @@ class StarNode():
         self._log.print_log()
 
     def disconnect(self):
+        self.send_disconnect_messages()
+        self._log.write_to_log("Terminated", 'Node has gracefully terminated.')
+
+        import sys
+        sys.exit(f'{self.name} has gracefully terminated.')
+
+    def send_disconnect_messages(self):
+        """ Tells every ContactNode that this node is leaving """
         for node in self.directory.get_current_list():
             bye_message = MessageFactory.generate_discovery_message(
                 origin_node=self.socket_manager.node,
@@ -88,14 +130,18 @@ class StarNode():
                 disconnect="1"
             )
             self.socket_manager.send_message(bye_message)
-        self._log.write_to_log("Terminated", 'Node has gracefully terminated.')
-
-        import sys
-        sys.exit(f'{self.name} has gracefully terminated.')
 
-    def report(self):
-        """ Updates the time a packet was last received from {message.get_sender()} """
-        self.last_contacted = time.time()
+    def report(self, message=None):
+        """
+        Updates the time a packet was last received, and with piggybacked
+        heartbeats the time its sender was last heard from
+        """
+        self.last_contacted = clock.now()
+        if message is not None and self.piggyback_heartbeats:
+            if message.TYPE_STRING == "heartbeat":
+                message.origin_node.heartbeat()
+            else:
+                message.origin_node.refresh()
 
     def check_for_inactivity(self):
         """
@@ -104,10 +150,17 @@ class StarNode():
         If node has been inactive (received no packets) for more than
         3 minutes (NO_CONTACT_TIMEOUT) then terminated program
         """
-        if self.last_contacted + self.NO_CONTACT_TIMEOUT < time.time():
+        if self.is_inactive():
             import sys
             sys.exit("StarNode terminated due to inactivity with other nodes")
 
+    def is_inactive(self):
+        return self.time_until_inactive() == 0
+
+    def time_until_inactive(self):
+        """ Seconds until NO_CONTACT_TIMEOUT passes without receiving a packet """
+        return max(0, self.last_contacted + self.NO_CONTACT_TIMEOUT - clock.now())
+
     """
     Application Message Functions
 
@@ -115,15 +168,18 @@ class StarNode():
 
     def watch_for_app_messages(self):
         while True:
-            message = self.socket_manager.get_app_message()
-            if message.forward == "1":
-                self.broadcast_as_central_node(message)
-                self._log.write_to_log(
-                    "Message", f'Message from {message.origin_node.get_name()} forwarded as central node.')
-            if message.is_file == "1":
-                self.handle_app_message_file(message)
-            else:
-                self.handle_app_message(message)
+            self.process_app_message(self.socket_manager.get_app_message())
+
+    def process_app_message(self, message):
+        """ Forwards `message` if this is the Central Node and shows it """
+        if message.forward == "1":
+            self.broadcast_as_central_node(message)
+            self._log.write_to_log(
+                "Message", f'Message from {message.origin_node.get_name()} forwarded as central node.')
+        if message.is_file == "1":
+            self.handle_app_message_file(message)
+        else:
+            self.handle_app_message(message)
 
     def handle_app_message(self, message):
         """
@@ -137,8 +193,14 @@ class StarNode():
             "Message", f'Message received from {message.get_sender()} ')
 
     def handle_app_message_file(self, message):
-        with open(f'{self.name}-{message.file_name}', 'wb') as f:
-            f.write(message.data)
+        self.save_received_file(message.file_name, message.data)
+        self.print_received_file(message)
+
+    def save_received_file(self, file_name, data):
+        with open(f'{self.name}-{file_name}', 'wb') as f:
+            f.write(data)
+
+    def print_received_file(self, message):
         to_print = f'\nMessage recieved from: {message.get_sender()}...\n'
         to_print += f'File recieved: {message.file_name}\n'
         to_print += 'Star-node command:'
@@ -166,6 +228,13 @@ class StarNode():
         self._log.write_to_log("Message", f'Message sent to all nodes.')
 
     def broadcast_file(self, file_name, data):
+        """
+        Sends a file to all nodes in the network via the Central Node. Files
+        that do not fit in a single packet are sent as FileFragmentMessages
+        """
+        if len(data) > FileFragmentMessage.MAX_DATA_SIZE:
+            return self.broadcast_file_in_fragments(file_name, data)
+
         app_message = MessageFactory.generate_app_message(
             origin_node=self.socket_manager.node,
             destination_node=self.directory.get(self.central_node),
@@ -196,6 +265,97 @@ class StarNode():
                 )
                 self.socket_manager.send_message(app_message)
 
+    def broadcast_file_in_fragments(self, file_name, data):
+        """
+        Splits a file into fragments that are each sent (and resent when lost)
+        on their own. They are reassembled by the receiving nodes.
+        """
+        total = count_fragments(len(data))
+        return self._broadcast_fragments(file_name, total, iter_fragments(data))
+
+    def broadcast_file_from_path(self, path):
+        """
+        Streams the file at `path` to all nodes in the network without
+        reading the whole file into memory. Files that fit in a single
+        packet are sent as one AppMessage like broadcast_file does
+        """
+        size = os.path.getsize(path)
+        if size <= FileFragmentMessage.MAX_DATA_SIZE:
+            with open(path, 'rb') as f:
+                return self.broadcast_file(path, f.read())
+        total = count_fragments(size)
+        return self._broadcast_fragments(path, total, read_fragments(path))
+
+    def _broadcast_fragments(self, file_name, total, pieces):
+        """
+        Sends each piece yielded by `pieces` as a FileFragmentMessage. Waits
+        for room to the destination before every fragment (see
+        SocketManager.wait_for_room), so only the fragments in flight are
+        held in memory, with or without flow control
+        """
+        transfer_id = FileFragmentMessage.new_transfer_id()
+        destinations, forward = self._get_fragment_destinations()
+        for sequence, piece in enumerate(pieces):
+            for node in destinations:
+                self.socket_manager.wait_for_room(node)
+                self.socket_manager.send_message(self._generate_fragment_message(
+                    node, forward, transfer_id, sequence, total, file_name, piece))
+        self._log.write_to_log(
+            "Message", f'File sent to all nodes in {total} fragments.')
+
+    def _get_fragment_destinations(self):
+        """ Returns the nodes fragments are sent to and their forward flag """
+        if self._is_central_node():
+            return self.directory.get_current_list(), '0'
+        return [self.directory.get(self.central_node)], '1'
+
+    def _generate_fragment_message(self, node, forward, transfer_id, sequence,
+                                   total, file_name, piece):
+        return MessageFactory.generate_fragment_message(
+            origin_node=self.socket_manager.node,
+            destination_node=node,
+            forward=forward,
+            sender=self.socket_manager.node.get_16_byte_name(),
+            transfer_id=transfer_id,
+            sequence=sequence,
+            total=total,
+            file_name=file_name,
+            data=piece,
+        )
+
+    def watch_for_fragment_messages(self):
+        while True:
+            self.process_fragment_message(
+                self.socket_manager.get_fragment_message())
+
+    def process_fragment_message(self, message):
+        """ Forwards `message` if this is the Central Node and stores it """
+        if not self.file_assembler.is_valid_fragment(message):
+            self._log.write_to_log(
+                "Message", f'Invalid fragment {message.sequence}/{message.total} from {message.get_sender()} dropped.')
+            return
+        if message.forward == "1":
+            self.forward_fragment_as_central_node(message)
+        transfer = self.file_assembler.add_fragment(message)
+        if transfer is not None:
+            self.print_received_file(transfer)
+
+    def forward_fragment_as_central_node(self, message):
+        for node in self.directory.get_current_list():
+            if node.get_name() != message.origin_node.get_name():
+                fragment_message = MessageFactory.generate_fragment_message(
+                    origin_node=self.socket_manager.node,
+                    destination_node=node,
+                    forward='0',
+                    sender=message.sender,
+                    transfer_id=message.transfer_id,
+                    sequence=message.sequence,
+                    total=message.total,
+                    file_name=message.file_name,
+                    data=message.data,
+                )
+                self.socket_manager.send_message(fragment_message)
+
     def _is_central_node(self):
         return self.central_node == self.name
 
@@ -207,47 +367,68 @@ class StarNode():
     """
 
     def contact_poc(self):
+        """
+        Keeps sending Discovery Requests to the POC until it has been added.
+        They are not sent reliably because the POC's name is not known yet,
+        so its ACKs cannot be matched, and this loop resends them anyway
+        """
         while self.directory.poc_not_added(self.poc):
-            self.send_discovery_message(self.poc)
-            time.sleep(2)
+            self.send_discovery_message(self.poc, reliable=False)
+            clock.sleep(self.POC_RETRY_INTERVAL)
 
     def watch_for_discovery_messages(self):
         """ Waits and handles all discovery messages that arrive to this node. """
         while True:
-            message = self.socket_manager.get_discovery_message()
-            if message.disconnect == "1":
-                self.handle_disconnect(message)
-            elif message.direction == "0":
-                self.respond_to_discovery_message(message)
-            elif message.direction == "1":
-                serialized_directory = message.get_payload()
-                self.directory.merge_serialized_directory(serialized_directory)
-                self.initiate_rtt_calculation()
+            self.process_discovery_message(
+                self.socket_manager.get_discovery_message())
+
+    def process_discovery_message(self, message):
+        if message.disconnect == "1":
+            self.handle_disconnect(message)
+        elif message.direction == "0":
+            self.respond_to_discovery_message(message)
+        elif message.direction == "1":
+            serialized_directory = message.get_payload()
+            self.directory.merge_serialized_directory(
+                serialized_directory, message.origin_node.get_name())
+            self.initiate_rtt_calculation()
 
     def handle_disconnect(self, message):
         name = message.origin_node.get_name()
         self.directory.remove(name)
+        self.socket_manager.forget_peer(name)
         self.initiate_rtt_calculation()
         self._log.write_to_log("Discovery", f'{name} has terminated.')
 
     def respond_to_discovery_message(self, message):
-        """ Responds to Discovery Message by sending node's directory """
+        """
+        Responds to Discovery Message by sending the part of node's directory
+        the sender is missing, or all of it to nodes without delta support
+        """
+        sync_state = message.get_payload()
+        if isinstance(sync_state, dict) and sync_state.get("directory"):
+            payload = self.directory.serialize_delta(sync_state)
+        else:
+            payload = self.directory.serialize()
         resp_msg = MessageFactory.generate_discovery_message(
             origin_node=self.socket_manager.node,
-            destination_node=message.origin_node,
+            destination_node=self.directory.get_canonical(message.origin_node),
             direction="1",
-            payload=self.directory.serialize())
+            payload=payload)
         self.socket_manager.send_message(resp_msg)
         self.ensure_sender_is_known(message)
 
-    def send_discovery_message(self, destination):
+    def send_discovery_message(self, destination, reliable=True):
         """ Sends a Discovery Request Message to the destination"""
+        capabilities = self.socket_manager.get_capabilities()
+        capabilities.update(self.directory.get_sync_state(destination.get_name()))
         discovery_message = MessageFactory.generate_discovery_message(
             origin_node=self.socket_manager.node,
             destination_node=destination,
-            direction='0'
+            direction='0',
+            payload=json.dumps(capabilities)
         )
-        self.socket_manager.send_message(discovery_message)
+        self.socket_manager.send_message(discovery_message, reliable)
 
     def ensure_sender_is_known(self, message):
         """ Send a Discovery message if sender of `message` is unknown """
@@ -266,48 +447,127 @@ class StarNode():
     """
 
     def watch_for_heartbeat_timeouts(self):
+        """ Sleeps until the next ContactNode could time out and checks them """
         while True:
-            for node in self.directory.get_current_list():
-                if node.is_unresponsive():
-                    self.directory.remove(node.name)
-                    self.initiate_rtt_calculation()
-                    self._log.write_to_log(
-                        "Heartbeat", f'{node.name} has stopped responding.')
-            time.sleep(2)
+            self.remove_unresponsive_nodes()
+            clock.sleep(self.time_until_next_heartbeat_timeout())
+
+    def remove_unresponsive_nodes(self):
+        for node in self.directory.get_current_list():
+            if node.is_unresponsive(self.phi_threshold):
+                self.remove_unresponsive_node(node)
+
+    def remove_unresponsive_node(self, node):
+        """ Drops a ContactNode that stopped responding and starts a new election """
+        self.directory.remove(node.name)
+        self.socket_manager.forget_peer(node.name)
+        self.initiate_rtt_calculation()
+        self._log.write_to_log(
+            "Heartbeat", f'{node.name} has stopped responding.')
+
+    def time_until_next_heartbeat_timeout(self):
+        """
+        Seconds until the earliest ContactNode times out, or HEARTBEAT_INTERVAL
+        if that is sooner. A heartbeat can bring a node's deadline forward when
+        its failure detector gets more confident, and nodes added later have
+        no deadline yet
+        """
+        now = clock.now()
+        deadlines = [node.get_timeout_deadline(self.phi_threshold)
+                     for node in self.directory.get_current_list()]
+        deadline = min(deadlines, default=now + self.HEARTBEAT_INTERVAL)
+        return max(0, min(deadline - now, self.HEARTBEAT_INTERVAL))
 
     def watch_for_heartbeat_messages(self):
         """ Waits and handles all heartbeat messages that arrive to this node. """
         while True:
-            message = self.socket_manager.get_heartbeat_message()
-            self.ensure_sender_is_known(message)
-            if message.direction == "0":
-                self.respond_to_heartbeat_message(message)
-            elif message.direction == "1":
-                self.handle_heartbeat_response(message)
+            self.process_heartbeat_message(
+                self.socket_manager.get_heartbeat_message())
+
+    def process_heartbeat_message(self, message):
+        self.ensure_sender_is_known(message)
+        if message.direction == "0":
+            self.respond_to_heartbeat_message(message)
+        elif message.direction == "1":
+            self.handle_heartbeat_response(message)
 
     def handle_heartbeat_response(self, message):
-        """ Handle a response Heartbeat message """
-        self.directory.get(message.origin_node.get_name()).heartbeat()
+        """ Handle a response Heartbeat message, report already did if piggybacking """
+        if not self.piggyback_heartbeats:
+            self.directory.get(message.origin_node.get_name()).heartbeat()
 
     def respond_to_heartbeat_message(self, message):
         """ Respond to a Heartbeat Message """
         heartbeat_message = MessageFactory.generate_heartbeat_message(
             origin_node=self.socket_manager.node,
-            destination_node=message.origin_node,
-            direction="1"
+            destination_node=self.directory.get_canonical(message.origin_node),
+            direction="1",
+            reliable=not self.piggyback_heartbeats
         )
-        self.socket_manager.send_message(heartbeat_message)
+        self.socket_manager.send_message(heartbeat_message, heartbeat_message.reliable)
 
     def send_heartbeat_messages(self):
-        """ Sends a Heartbeat Message to all ContactNodes """
+        """ Sends a Heartbeat Message to all ContactNodes every few seconds """
         while True:
-            for node in self.directory.get_current_list():
-                heartbeat_message = MessageFactory.generate_heartbeat_message(
-                    origin_node=self.socket_manager.node,
-                    destination_node=node
-                )
-                self.socket_manager.send_message(heartbeat_message)
-            time.sleep(3)
+            self.send_heartbeats()
+            clock.sleep(self.HEARTBEAT_INTERVAL)
+
+    def send_heartbeats(self):
+        """
+        Sends a Heartbeat Message to every ContactNode, or with piggybacked
+        heartbeats an unreliable one to every node not heard from for
+        IDLE_TIMEOUT
+        """
+        for node in self.directory.get_current_list():
+            if self.piggyback_heartbeats and not node.is_idle(self.IDLE_TIMEOUT):
+                continue
+            heartbeat_message = MessageFactory.generate_heartbeat_message(
+                origin_node=self.socket_manager.node,
+                destination_node=node,
+                reliable=not self.piggyback_heartbeats
+            )
+            self.socket_manager.send_message(heartbeat_message, heartbeat_message.reliable)
+
+    """
+    SWIM Membership Functions
+
+    Used instead of the heartbeat functions with swim_membership. Members
+    are probed by SwimMembership, which adds the ContactNodes it hears of
+    and removes the ones it declares dead
+    """
+
+    def run_swim_protocol(self):
+        """ Probes a member every protocol period, indirectly if it does not answer """
+        while True:
+            self.swim.probe()
+            clock.sleep(self.swim.PING_TIMEOUT)
+            self.swim.probe_indirectly()
+            clock.sleep(self.swim.PROTOCOL_PERIOD - self.swim.PING_TIMEOUT)
+
+    def watch_for_gossip_messages(self):
+        """ Waits and handles all gossip messages that arrive to this node. """
+        while True:
+            self.process_gossip_message(
+                self.socket_manager.get_gossip_message())
+
+    def process_gossip_message(self, message):
+        if self.swim is not None:
+            self.swim.process_message(message)
+
+    def send_gossip(self, destination, payload):
+        """ Sends a SWIM probe once, a lost one is what SWIM detects failures with """
+        gossip_message = MessageFactory.generate_gossip_message(
+            origin_node=self.socket_manager.node,
+            destination_node=destination,
+            payload=payload
+        )
+        self.socket_manager.send_message(gossip_message, reliable=False)
+
+    def add_gossiped_node(self, node):
+        """ Adds a ContactNode that SWIM heard of and starts a new election """
+        self.directory.add(node)
+        self.initiate_rtt_calculation()
+        self._log.write_to_log("SWIM", f'{node.name} has joined.')
 
     """
     Round Trip Time (RTT) Functions
@@ -320,20 +580,22 @@ class StarNode():
     def watch_for_rtt_messages(self):
         """ Waits and handles all RTT messages that arrive to this node. """
         while True:
-            message = self.socket_manager.get_rtt_message()
-            self.ensure_sender_is_known(message)
-            if message.stage == "0":
-                self.respond_to_rtt_message(message)
-            elif message.stage == "1":
-                self.handle_rtt_response(message)
-            elif message.stage == "2":
-                self.handle_rtt_broadcast(message)
+            self.process_rtt_message(self.socket_manager.get_rtt_message())
+
+    def process_rtt_message(self, message):
+        self.ensure_sender_is_known(message)
+        if message.stage == "0":
+            self.respond_to_rtt_message(message)
+        elif message.stage == "1":
+            self.handle_rtt_response(message)
+        elif message.stage == "2":
+            self.handle_rtt_broadcast(message)
 
     def respond_to_rtt_message(self, message):
         """ Respond to a RTT Message """
         rtt_message = MessageFactory.generate_rtt_message(
             origin_node=self.socket_manager.node,
-            destination_node=message.origin_node,
+            destination_node=self.directory.get_canonical(message.origin_node),
             stage="1"
         )
         self.socket_manager.send_message(rtt_message)
@@ -344,43 +606,79 @@ class StarNode():
         sender = message.origin_node.get_name()
         self._log.write_to_log(
             "RTT", f'Response received from {sender}. RTT to node is {message.get_rtt()} ')
-        self.rtt_queue.put((sender, message))
+        self._queue_rtt_response((sender, message))
+
+    def _queue_rtt_response(self, response):
+        with self.rtt_response_received:
+            self.rtt_queue.put_nowait(response)
+            self.rtt_response_received.notify_all()
 
     def handle_rtt_broadcast(self, message):
         new_rtt_sum = message.get_rtt_sum()
         sender = message.origin_node.get_name()
+        if not self.directory.exists(sender):
+            return  # not discovered yet, ensure_sender_is_known asked for its directory
         network_size = message.get_network_size()
-        self.directory.get(sender).update_rtt_sum(new_rtt_sum, network_size)
+        node = self.directory.get(sender)
+        node.update_rtt_sum(new_rtt_sum, network_size)
 
         self._log.write_to_log(
             "RTT", f'Received RTT Sum Broadcast from {sender}. RTT Sum: {new_rtt_sum} ')
 
-        self.set_central_node()
+        self.set_central_node(node)
 
     def initiate_rtt_calculation(self, when=3):
-        self.rtt_countdown = time.time() + when
+        self.rtt_countdown = clock.now() + when
         if self.directory.size() != self.rtt_calcd_for_size:
             self.shortest_rtt = 9
+        self._wake_rtt_timer()
+
+    def _wake_rtt_timer(self):
+        with self.rtt_countdown_changed:
+            self.rtt_countdown_changed.notify_all()
 
     def calculate_rtt_timer(self):
         """
-        Blocks and calculates RTT whenever self.rtt_countdown < time.time()
+        Blocks and calculates RTT whenever self.rtt_countdown < clock.now().
+        Sleeps until the countdown ends or initiate_rtt_calculation moves it
         """
         try:
             while True:
-                while time.time() < self.rtt_countdown:
-                    time.sleep(.5)
+                with self.rtt_countdown_changed:
+                    while clock.now() < self.rtt_countdown:
+                        clock.wait(self.rtt_countdown_changed,
+                                   self.rtt_countdown - clock.now())
                 prev_time = self.rtt_countdown
                 self.calculate_rtt()
                 if self.rtt_countdown == prev_time:
-                    self.rtt_countdown = time.time() + self.RTT_COUNTDOWN_INIT
+                    self.rtt_countdown = clock.now() + self.RTT_COUNTDOWN_INIT
         except Exception as e:
             print(e)
 
     def calculate_rtt(self):
-        """ Sends a RTT Message to all ContactNodes """
+        """
+        Sends a RTT Message to all ContactNodes and waits until they all
+        responded or RTT_RESPONSE_TIMEOUT has passed
+        """
+        node_list = self.send_rtt_requests()
+        timeout = clock.now() + self.RTT_RESPONSE_TIMEOUT
+        rtt_responses = {}
+        with self.rtt_response_received:
+            while (clock.now() < timeout) and (len(rtt_responses) < len(node_list)):
+                if self.rtt_queue.empty():
+                    clock.wait(self.rtt_response_received, timeout - clock.now())
+                    continue
+                name, message = self.rtt_queue.get_nowait()
+                try:
+                    rtt_responses[name] = message.get_rtt()
+                except ValueError:
+                    self._log.write_to_log("RTT", f'Malformed RTT Response from {name}')
+        self.finish_rtt_calculation(node_list, rtt_responses)
+
+    def send_rtt_requests(self):
+        """ Sends a RTT request to every ContactNode and returns them """
         self._log.write_to_log("RTT", "Starting new RTT Calc")
-        node_list = self.directory.get_current_list()
+        node_list = list(self.directory.get_current_list())
         for node in node_list:
             rtt_message = MessageFactory.generate_rtt_message(
                 origin_node=self.socket_manager.node,
@@ -388,16 +686,10 @@ class StarNode():
             )
             self.socket_manager.send_message(rtt_message)
             self._log.write_to_log("RTT", f'Request sent to {node.get_name()}')
+        return node_list
 
-        timeout = time.time() + 6
-        rtt_responses = {}
-        while (time.time() < timeout) and (len(rtt_responses) < len(node_list)):
-            try:
-                name, message = self.rtt_queue.get(timeout=2)
-                rtt_responses[name] = message.get_rtt()
-            except Exception as e:
-                pass
-
+    def finish_rtt_calculation(self, node_list, rtt_responses):
+        """ Uses the responses if every node in `node_list` answered """
         if len(rtt_responses) == len(node_list):
             self.process_rtt_times(rtt_responses)
         else:
@@ -410,7 +702,9 @@ class StarNode():
         rtt_sum = 0.0
         for name, rtt in rtt_responses.items():
             rtt_sum += rtt
-            self.directory.get(name).rtt = rtt
+            node = self.directory.get(name)
+            node.rtt = rtt
+            node.seed_rto(rtt)
         self._log.write_to_log("RTT", f'New RTT sum computed: {rtt_sum} ')
         self.directory.star_node.update_rtt_sum(rtt_sum, self.directory.size())
 
@@ -427,8 +721,9 @@ class StarNode():
             )
             self.socket_manager.send_message(rtt_message)
 
-    def set_central_node(self):
-        name, rtt = self.directory.check_central_node()
+    def set_central_node(self, changed=None):
+        """ Picks the Central Node again, see ContactDirectory.check_central_node """
+        name, rtt = self.directory.check_central_node(changed)
         self.central_node = name
         self.shortest_rtt = rtt
         self._log.write_to_log("RTT", f'Central Node: {name}')
@@ -437,6 +732,10 @@ class StarNode():
     Util Functions
     """
 
+    def _create_socket_manager(self, name, port, verbose, **options):
+        """ Creates the SocketManager the node sends and receives with """
+        return SocketManager(name, port, self.report, verbose, **options)
+
     def _start_thread(self, fn, daemon=False):
         """ Allows any function to be started in a Daemon Thread """
         daemon = Thread(target=fn, daemon=daemon)
@@ -456,10 +755,33 @@ if __name__ == "__main__":
     parser.add_argument(
         'poc_port', help='the UDP port number of the PoC for this star-node. Set to 0 if this star-node does not have a PoC', type=int)
     parser.add_argument('n', help='the maximum number of star-nodes', type=int)
+    parser.add_argument(
+        '--delayed-acks', help='batch ACKs to each star-node (all star-nodes must support it)', action='store_true')
+    parser.add_argument(
+        '--flow-control', help='limit the app messages and file fragments in flight to each star-node', action='store_true')
+    parser.add_argument(
+        '--batch-io', help='read and send several packets per socket wakeup', action='store_true')
+    parser.add_argument(
+        '--parser-workers', help='threads parsing received packets (0 parses on the listening thread)', type=int, default=1)
+    parser.add_argument(
+        '--phi-threshold', help='suspicion level at which a star-node is considered offline', type=parse_threshold,
+        default=PhiAccrualDetector.THRESHOLD)
+    parser.add_argument(
+        '--piggyback-heartbeats', help='count every packet as a heartbeat and only send heartbeats to idle star-nodes', action='store_true')
+    parser.add_argument(
+        '--fixed-timeout', help=f'consider star-nodes offline after {ContactNode.HEARTBEAT_TIMEOUT}s without a heartbeat instead', action='store_true')
+    parser.add_argument(
+        '--swim', help='detect failures with SWIM gossip instead of heartbeats (all star-nodes must use it)', action='store_true')
     args = parser.parse_args()
 
     star = StarNode(name=args.name, port=args.local_port, num_nodes=args.n,
-                    poc_ip=args.poc_address, poc_port=args.poc_port, verbose=False)
+                    poc_ip=args.poc_address, poc_port=args.poc_port, verbose=False,
+                    delayed_acks=args.delayed_acks, flow_control=args.flow_control,
+                    batch_io=args.batch_io,
+                    parser_workers=args.parser_workers,
+                    phi_threshold=None if args.fixed_timeout else args.phi_threshold,
+                    piggyback_heartbeats=args.piggyback_heartbeats,
+                    swim_membership=args.swim)
     star.start_non_blocking()
 
     running = True
@@ -470,9 +792,7 @@ if __name__ == "__main__":
         if command[0] == 'send':
             if os.path.isfile(command[1]):
                 file_name = command[1]
-                with open(file_name, 'rb') as f:
-                    file_data = f.read()
-                    star.broadcast_file(file_name, file_data)
+                star.broadcast_file_from_path(file_name)
             else:
                 string_to_send = ' '.join(command[1:])
                 star.broadcast_string(string_to_send)
@@ -481,13 +801,17 @@ if __name__ == "__main__":
             d = []
             rtt_sum = 0
             print("\n--------- Current Status ---------")
-            print(format("Name", "<16"), "RTT")
+            print(format("Name", "<16"), format("RTT", "<24"), "RTO")
             for node in star.directory.get_current_list():
-                print(format(node.get_name(), "<16"), node.rtt)
+                print(format(node.get_name(), "<16"),
+                      format(node.rtt, "<24"), node.rto)
                 rtt_sum += node.rtt
             print(f'\nMy RTT sum: {rtt_sum}\n')
             print(f'\nCentral Node: {star.central_node}')
             print(f'Shortest RTT: {star.shortest_rtt}\n')
+            duplicates = star.socket_manager.get_duplicate_stats()
+            print(f'Duplicates suppressed: {sum(duplicates.values())} {duplicates}')
+            print(f'Packets dropped by receive ring: {star.socket_manager.get_receive_drops()}\n')
 
         elif command[0] == 'disconnect':
             star.disconnect()
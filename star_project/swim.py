@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+SWIM Membership
+
+Gossip membership and failure detection (Das et al., "SWIM: Scalable
+Weakly-consistent Infection-style Process Group Membership Protocol") for
+StarNets too large for every node to heartbeat every other node.
+
+Every PROTOCOL_PERIOD a node pings one member, taking them in turns from a
+shuffled list. If no ack arrives within PING_TIMEOUT it asks
+INDIRECT_PROBES other members to ping the target (ping-req) and pass the
+ack on, so one lossy link does not get a node suspected. A target that
+answered neither way by the end of the period is suspected, and declared
+dead unless it refutes the suspicion within the suspicion timeout by
+gossiping that it is alive with a higher incarnation number.
+
+Membership updates (alive, suspect, dead) are never sent on their own.
+They are piggybacked on the pings and acks, the least sent ones first,
+RETRANSMIT_MULTIPLIER * log10(N) times each, which is enough to reach every
+member in O(log N) periods. Every node sends about the same number of
+packets per period however large the StarNet gets, only the suspicion
+timeout and the time updates take to spread grow with log N.
+
+Members are the online nodes of the ContactDirectory. Every node in the
+StarNet has to run SWIM, nodes without it do not answer the probes.
+
+Parameters:
+    - directory: ContactDirectory of the node
+    - node: ContactNode of the node
+    - send_func: function sending a gossip payload, called like
+    send_func(destination_node, payload). It does not need to be reliable
+    - member_joined: function called with a new ContactNode gossip brought
+    news of, it has to add it to the directory
+    - member_failed: function called with the ContactNode of a member
+    declared dead, it has to remove it from the directory
+    - verbose: Indicates whether output should be printed with the logger
+"""
+
+import heapq
+import json
+import math
+import random
+from threading import Lock
+import clock
+
+from contact_node import ContactNode
+from logger import Logger
+
+ALIVE = "alive"
+SUSPECT = "suspect"
+DEAD = "dead"
+
+
+class SwimMembership():
+    PROTOCOL_PERIOD = 1  # seconds
+    PING_TIMEOUT = 0.5  # seconds
+    INDIRECT_PROBES = 3
+    SUSPICION_MULTIPLIER = 4  # protocol periods per log10(N)
+    RETRANSMIT_MULTIPLIER = 4  # piggybacks of an update per log10(N)
+    MAX_PIGGYBACKED = 6  # updates per message
+
+    def __init__(self, directory, node, send_func, member_joined, member_failed,
+                 verbose=False):
+        self._log = Logger(node.name, verbose)
+        self.directory = directory
+        self.node = node
+        self.send = send_func
+        self.member_joined = member_joined
+        self.member_failed = member_failed
+        self.lock = Lock()
+        self.incarnation = 0
+        self.members = {}  # name -> (state, incarnation) last gossiped
+        self.suspects = {}  # name -> time its suspicion ends
+        self.updates = {}  # name -> [update, times piggybacked]
+        self.probe_order = []
+        self.probe_id = 0  # last id given to one of our probes or a relayed one
+        self.current_probe = 0  # id of our probe of probe_target
+        self.probe_target = None
+        self.probe_acked = True
+        self.relays = {}  # probe id -> (node that asked, its probe id, expiry)
+        self._queue_update(ALIVE, node, self.incarnation)
+
+    def get_suspicion_timeout(self):
+        """ Seconds a suspected member has to refute it """
+        size = max(self.directory.size(), 10)
+        return self.SUSPICION_MULTIPLIER * math.log10(size) * self.PROTOCOL_PERIOD
+
+    def get_retransmit_limit(self):
+        """ How many messages each update is piggybacked on """
+        return self.RETRANSMIT_MULTIPLIER * math.ceil(math.log10(self.directory.size() + 1))
+
+    """
+    Protocol Period
+    """
+
+    def probe(self):
+        """
+        Starts a protocol period. Suspects the last target if it never
+        answered, declares expired suspects dead and pings the next member
+        """
+        with self.lock:
+            now = clock.now()
+            if not self.probe_acked and self.directory.exists(self.probe_target.name):
+                self._suspect(self.probe_target, now)
+            self._expire_suspicions(now)
+            self._expire_relays(now)
+            self.probe_target = self._next_target()
+            self.probe_acked = self.probe_target is None
+            if self.probe_target is not None:
+                self.probe_id += 1
+                self.current_probe = self.probe_id
+                self._send(self.probe_target, "ping", self.current_probe)
+
+    def probe_indirectly(self):
+        """ Asks INDIRECT_PROBES other members to ping a target that did not answer """
+        with self.lock:
+            if self.probe_acked:
+                return
+            target = self.probe_target
+            helpers = [node for node in self.directory.get_current_list()
+                       if node.name != target.name]
+            for helper in random.sample(helpers, min(len(helpers), self.INDIRECT_PROBES)):
+                self._send(helper, "ping-req", self.current_probe, target)
+
+    def _next_target(self):
+        """ Members are probed in turns, in a new random order every round """
+        while True:
+            if not self.probe_order:
+                self.probe_order = list(self.directory.get_current_list())
+                random.shuffle(self.probe_order)
+                if not self.probe_order:
+                    return None
+            node = self.probe_order.pop()
+            if node.is_online:
+                return node
+
+    def _expire_relays(self, now):
+        for probe_id, (node, requested_id, expiry) in list(self.relays.items()):
+            if expiry <= now:
+                del self.relays[probe_id]
+
+    """
+    Messages
+    """
+
+    def process_message(self, message):
+        """ Applies the piggybacked updates and answers a ping, ping-req or ack """
+        payload = message.get_payload()
+        sender = self.directory.get_canonical(message.origin_node)
+        with self.lock:
+            for update in payload.get("updates", ()):
+                self._apply_update(*update)
+            kind = payload["type"]
+            if kind == "ping":
+                self._send(sender, "ack", payload["probe"])
+            elif kind == "ping-req":
+                self.probe_id += 1
+                self.relays[self.probe_id] = (sender, payload["probe"],
+                                              clock.now() + self.PROTOCOL_PERIOD)
+                self._send(self._get_node(*payload["target"]), "ping", self.probe_id)
+            elif kind == "ack":
+                self._handle_ack(payload["probe"])
+
+    def _handle_ack(self, probe_id):
+        """ Ends our probe or passes the ack on to the node that asked for it """
+        if probe_id == self.current_probe:
+            self.probe_acked = True
+        relay = self.relays.pop(probe_id, None)
+        if relay is not None:
+            requester, requested_id, expiry = relay
+            self._send(requester, "ack", requested_id)
+
+    def _send(self, destination, kind, probe_id, target=None):
+        payload = {"type": kind, "probe": probe_id, "updates": self._take_updates()}
+        if target is not None:
+            payload["target"] = [target.name, target.ip, target.port]
+        self.send(destination, json.dumps(payload))
+
+    def _get_node(self, name, ip, port):
+        if self.directory.exists(name):
+            return self.directory.get(name)
+        return ContactNode(name, ip, port)
+
+    """
+    Membership Updates
+    """
+
+    def _queue_update(self, state, node, incarnation):
+        """ Gossips an update, replacing older news about the same member """
+        update = [state, node.name, node.ip, node.port, incarnation]
+        self.updates[node.name] = [update, 0]
+
+    def _take_updates(self):
+        """ The updates piggybacked on the next message, least sent first """
+        if not self.updates:
+            return []
+        limit = self.get_retransmit_limit()
+        taken = heapq.nsmallest(self.MAX_PIGGYBACKED, self.updates.items(),
+                                key=lambda item: item[1][1])
+        updates = []
+        for name, entry in taken:
+            entry[1] += 1
+            if entry[1] >= limit:
+                del self.updates[name]
+            updates.append(entry[0])
+        return updates
+
+    def _apply_update(self, state, name, ip, port, incarnation):
+        """ Applies gossip about a member if it is newer than what we know """
+        if name == self.node.name:
+            if state != ALIVE and incarnation >= self.incarnation:
+                self._refute(incarnation)
+            return
+        known_state, known_incarnation = self.members.get(name, (None, -1))
+        if state == ALIVE:
+            if incarnation > known_incarnation:
+                self._set_alive(ContactNode(name, ip, port), incarnation)
+        elif state == SUSPECT:
+            if known_state == DEAD or not self.directory.exists(name):
+                return
+            if incarnation > known_incarnation or \
+                    (incarnation == known_incarnation and known_state != SUSPECT):
+                self._suspect(self.directory.get(name), clock.now(), incarnation)
+        elif state == DEAD:
+            if known_state != DEAD and incarnation >= known_incarnation:
+                self._declare_dead(ContactNode(name, ip, port), incarnation)
+
+    def _refute(self, incarnation):
+        """ Tells everyone we are alive after being suspected or declared dead """
+        self.incarnation = incarnation + 1
+        self._queue_update(ALIVE, self.node, self.incarnation)
+        self._log.write_to_log(
+            "SWIM", f'Refuted suspicion with incarnation {self.incarnation}')
+
+    def _set_alive(self, node, incarnation):
+        self.members[node.name] = (ALIVE, incarnation)
+        self.suspects.pop(node.name, None)
+        self._queue_update(ALIVE, node, incarnation)
+        if not self.directory.exists(node.name):
+            self.probe_order.insert(random.randint(0, len(self.probe_order)), node)
+            self.member_joined(node)
+
+    def _suspect(self, node, now, incarnation=None):
+        """ Gives a member the suspicion timeout to refute that it failed """
+        known_state, known_incarnation = self.members.get(node.name, (ALIVE, 0))
+        if incarnation is None:
+            if known_state == SUSPECT:
+                return
+            incarnation = known_incarnation
+        self.members[node.name] = (SUSPECT, incarnation)
+        self.suspects.setdefault(node.name, now + self.get_suspicion_timeout())
+        self._queue_update(SUSPECT, node, incarnation)
+        self._log.write_to_log("SWIM", f'Suspecting {node.name}')
+
+    def _expire_suspicions(self, now):
+        for name, deadline in list(self.suspects.items()):
+            if deadline <= now:
+                state, incarnation = self.members[name]
+                self._declare_dead(self.directory.get(name), incarnation)
+
+    def _declare_dead(self, node, incarnation):
+        self.members[node.name] = (DEAD, incarnation)
+        self.suspects.pop(node.name, None)
+        self._queue_update(DEAD, node, incarnation)
+        if self.directory.exists(node.name):
+            self.member_failed(self.directory.get(node.name))
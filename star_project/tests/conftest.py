@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def log_dir(tmp_path, monkeypatch):
+    """ Nodes write their logs and received files to the working directory """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def simulated_clock():
+    """ Installs a SimulatedClock for the test and the previous clock after it """
+    import clock
+    previous_clock = clock.get_clock()
+    simulated_clock = clock.SimulatedClock(start=1000.0)
+    clock.install(simulated_clock)
+    yield simulated_clock
+    clock.install(previous_clock)
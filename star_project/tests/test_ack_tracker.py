@@ -0,0 +1,93 @@
+import time
+from threading import Thread
+
+from ack_tracker import AckTracker
+from contact_node import ContactNode
+from message_factory import MessageFactory
+
+ORIGIN = ContactNode("origin", "10.0.0.1", 1)
+
+
+def sent_message(destination_name="peer"):
+    destination = ContactNode(destination_name, "10.0.0.1", 2)
+    return MessageFactory.generate_rtt_message(origin_node=ORIGIN, destination_node=destination)
+
+
+def test_settled_message_never_expires():
+    tracker = AckTracker()
+    acked, lost = sent_message(), sent_message()
+    tracker.track(acked, 0, 1)
+    tracker.track(lost, 0, 2)
+    assert tracker.settle("peer", acked.get_message_id())[0] is acked
+    assert tracker.settle("peer", acked.get_message_id()) is None
+    assert tracker.next_deadline() == 2
+    assert [entry[0] for entry in tracker.pop_expired(5)] == [lost]
+    assert tracker.size() == 0
+
+
+def test_messages_expire_in_deadline_order():
+    tracker = AckTracker()
+    messages = [sent_message() for _ in range(3)]
+    for timeout, message in zip((3, 1, 2), messages):
+        tracker.track(message, 10, timeout)
+    assert tracker.pop_expired(10.5) == []
+    assert [entry[0] for entry in tracker.pop_expired(12)] == [messages[1], messages[2]]
+    assert tracker.is_waiting(messages[0])
+
+
+def test_ids_are_only_unique_per_destination():
+    tracker = AckTracker()
+    first, second = sent_message("first"), sent_message("second")
+    second.uuid = first.uuid
+    tracker.track(first, 0, 1)
+    tracker.track(second, 0, 1)
+    assert tracker.settle("second", second.get_message_id())[0] is second
+    assert tracker.is_waiting(first)
+
+
+def test_resent_message_only_expires_at_its_new_deadline():
+    tracker = AckTracker()
+    message = sent_message()
+    tracker.track(message, 0, 1)
+    tracker.track(message, 1, 2)
+    assert tracker.pop_expired(2) == []
+    assert [entry[0] for entry in tracker.pop_expired(3)] == [message]
+
+
+def test_settled_entries_are_compacted_out_of_the_heap():
+    tracker = AckTracker()
+    tracker.COMPACT_THRESHOLD = 10
+    messages = [sent_message() for _ in range(30)]
+    for message in messages:
+        tracker.track(message, 0, 1)
+    for message in messages[:-1]:
+        tracker.settle("peer", message.get_message_id())
+    tracker.track(sent_message(), 0, 1)
+    assert len(tracker.deadlines) == 2
+
+
+def test_wait_for_expired_wakes_up_for_an_earlier_deadline():
+    tracker = AckTracker()
+    tracker.track(sent_message(), time.time(), 60)
+    expired = []
+    waiter = Thread(target=lambda: expired.extend(tracker.wait_for_expired()), daemon=True)
+    waiter.start()
+    message = sent_message()
+    tracker.track(message, time.time(), 0.05)
+    waiter.join(5)
+    assert [entry[0] for entry in expired] == [message]
+
+
+def test_wait_for_expired_wakes_up_when_the_clock_passes_the_deadline(simulated_clock):
+    tracker = AckTracker()
+    message = sent_message()
+    tracker.track(message, simulated_clock.now(), 1.5)
+    expired = []
+    waiter = Thread(target=lambda: expired.extend(tracker.wait_for_expired()), daemon=True)
+    waiter.start()
+    simulated_clock.advance(1)
+    waiter.join(0.2)
+    assert waiter.is_alive()
+    simulated_clock.advance(1)
+    waiter.join(5)
+    assert [entry[0] for entry in expired] == [message]
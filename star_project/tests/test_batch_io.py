@@ -0,0 +1,58 @@
+import socket
+import time
+from queue import Queue
+from threading import Thread
+
+from contact_node import ContactNode
+from message_factory import MessageFactory
+from reliable_socket import ReliableSocket
+
+
+def create_socket(received=None, batch_size=ReliableSocket.BATCH_SIZE):
+    def on_packet(data, address):
+        if received is not None:
+            received.append((data, address))
+
+    sock = ReliableSocket(0, on_packet, Queue(), "node", batch_size=batch_size)
+    return sock, ContactNode("node", sock.get_ip(), sock.sock.getsockname()[1])
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_sender_takes_every_queued_message_up_to_the_batch_size():
+    sock, node = create_socket(batch_size=3)
+    for i in range(5):
+        sock.outbox.put(i)
+    assert sock.get_outbox_batch() == [0, 1, 2]
+    assert sock.get_outbox_batch() == [3, 4]
+    sock.sock.close()
+
+
+def test_listener_drains_waiting_datagrams_up_to_the_batch_size():
+    sock, node = create_socket(batch_size=3)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+        for i in range(5):
+            client.sendto(bytes([i]), node.get_address())
+        time.sleep(0.1)
+    assert [data for data, address in sock.receive_batch()] == [b'\x00', b'\x01', b'\x02']
+    assert [data for data, address in sock.receive_batch()] == [b'\x03', b'\x04']
+    sock.sock.close()
+
+
+def test_batched_sockets_deliver_every_packet():
+    received = []
+    sender, sender_node = create_socket()
+    receiver, receiver_node = create_socket(received)
+    for _ in range(200):
+        sender.outbox.put(MessageFactory.generate_heartbeat_message(
+            origin_node=sender_node, destination_node=receiver_node, direction="0"))
+    Thread(target=receiver.start_listening, daemon=True).start()
+    Thread(target=sender.start_sending, daemon=True).start()
+    assert wait_until(lambda: len(received) == 200)
+    assert all(data[:1] == b'H' for data, address in received)
+    sender.sock.close()
@@ -0,0 +1,67 @@
+import asyncio
+import time
+from threading import Thread
+
+import clock
+
+
+def test_virtual_time_skips_ahead_to_the_next_timer():
+    async def sleep_for_an_hour():
+        started = clock.now()
+        await asyncio.sleep(3600)
+        return clock.now() - started
+
+    wall_started = time.time()
+    assert clock.run_in_virtual_time(sleep_for_an_hour()) >= 3600
+    assert time.time() - wall_started < 5
+    assert isinstance(clock.get_clock(), clock.SystemClock)
+
+
+def test_timers_fire_in_order_in_virtual_time():
+    fired = []
+
+    async def timers():
+        loop = asyncio.get_event_loop()
+        for delay in (3, 1, 2):
+            loop.call_later(delay, fired.append, delay)
+        await asyncio.sleep(5)
+
+    clock.run_in_virtual_time(timers())
+    assert fired == [1, 2, 3]
+
+
+def test_threads_sleep_until_the_simulated_clock_is_advanced(simulated_clock):
+    sleeper = Thread(target=clock.sleep, args=(10,), daemon=True)
+    sleeper.start()
+    simulated_clock.advance(9)
+    sleeper.join(0.1)
+    assert sleeper.is_alive()
+    simulated_clock.advance(1)
+    sleeper.join(5)
+    assert not sleeper.is_alive()
+
+
+def test_rtt_calculation_waits_for_responses_on_the_simulated_clock(simulated_clock):
+    from contact_node import ContactNode
+    from message_factory import MessageFactory
+    from star_node import StarNode
+
+    node = StarNode("a", 0, 3)
+    peers = [ContactNode(name, "127.0.0.1", port) for name, port in (("b", 1), ("c", 2))]
+    for peer in peers:
+        node.directory.add(peer)
+    finished = []
+    node.finish_rtt_calculation = lambda node_list, responses: finished.append(responses)
+    calculation = Thread(target=node.calculate_rtt, daemon=True)
+    calculation.start()
+    response = MessageFactory.generate_rtt_message(origin_node=peers[0],
+                                                   destination_node=node.socket_manager.node,
+                                                   stage="1", send_time=clock.now() - 0.2,
+                                                   receive_time=clock.now())
+    node.handle_rtt_response(response)
+    calculation.join(0.1)
+    assert calculation.is_alive()
+    simulated_clock.advance(node.RTT_RESPONSE_TIMEOUT)
+    calculation.join(1)  # well before a real-time wait would time out
+    assert not calculation.is_alive()
+    assert list(finished[0]) == ["b"]
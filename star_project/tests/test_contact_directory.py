@@ -0,0 +1,63 @@
+import json
+
+from contact_directory import ContactDirectory
+from contact_node import ContactNode
+
+
+def create_directory(name, port):
+    directory = ContactDirectory(name, verbose=False)
+    directory.set_star_node(ContactNode(name, "10.0.0.1", port))
+    return directory
+
+
+def discover(requester, responder):
+    """ requester sends a discovery request to responder and merges the response """
+    sync_state = requester.get_sync_state(responder.name)
+    response = json.loads(responder.serialize_delta(sync_state))
+    requester.merge_serialized_directory(response, responder.name)
+    responder.add(ContactNode(requester.name, "10.0.0.1", requester.star_node.port))
+    return response
+
+
+def test_delta_only_has_new_nodes():
+    a, b, c, d = [create_directory(name, port) for port, name in enumerate("ABCD")]
+    discover(b, a)
+    discover(c, a)
+    discover(b, a)
+    discover(d, a)
+    response = discover(b, a)
+    assert not response["full"]
+    assert sorted(node["name"] for node in response["nodes"]) == ["A", "D"]
+    assert b.exists("D")
+
+
+def test_peer_removed_then_rediscovered():
+    a, x = create_directory("A", 1), create_directory("X", 2)
+    discover(a, x)
+    assert a.exists("X")
+    a.remove("X")
+    assert not a.exists("X")
+    discover(a, x)
+    assert a.exists("X")
+
+
+def test_delta_since_last_merge_includes_responder():
+    a, x = create_directory("A", 1), create_directory("X", 2)
+    discover(a, x)
+    sync_state = {"directory": ContactDirectory.FORMAT, "since": x.version}
+    response = json.loads(x.serialize_delta(sync_state))
+    assert [node["name"] for node in response["nodes"]] == ["X"]
+
+
+def test_change_log_is_compacted():
+    a, x = create_directory("A", 1), create_directory("X", 2)
+    old_version = a.version
+    for _ in range(3 * ContactDirectory.MAX_CHANGES):
+        a.add(ContactNode("X", "10.0.0.1", 2))
+        a.remove("X")
+    assert len(a.changes) <= 2 * ContactDirectory.MAX_CHANGES
+    sync_state = {"directory": ContactDirectory.FORMAT, "since": old_version}
+    assert json.loads(a.serialize_delta(sync_state))["full"]
+    sync_state["since"] = a.version - 1
+    response = json.loads(a.serialize_delta(sync_state))
+    assert not response["full"]
@@ -0,0 +1,75 @@
+import time
+from threading import Thread
+
+from contact_node import ContactNode
+from message_factory import MessageFactory
+from socket_manager import SocketManager
+
+
+def received_messages(manager, peer, count):
+    return [MessageFactory.generate_rtt_message(origin_node=peer, destination_node=manager.node)
+            for _ in range(count)]
+
+
+def test_acks_are_sent_right_away_by_default():
+    manager = SocketManager("receiver", 0, lambda message=None: None)
+    peer = ContactNode("peer", "127.0.0.1", 1)
+    message, = received_messages(manager, peer, 1)
+    manager.acknowledge(message)
+    ack = manager.outbox.get_nowait()
+    assert ack.TYPE_CODE == "K"
+    assert ack.get_ack_ids() == [message.get_message_id()]
+
+
+def test_acks_are_batched_per_peer():
+    manager = SocketManager("receiver", 0, lambda message=None: None, delayed_acks=True)
+    first, second = ContactNode("first", "127.0.0.1", 1), ContactNode("second", "127.0.0.1", 2)
+    for message in received_messages(manager, first, 3) + received_messages(manager, second, 2):
+        manager.acknowledge(message)
+    assert manager.outbox.empty()
+    assert {name: len(ack_ids) for name, (node, ack_ids) in manager.pending_acks.items()} == \
+        {"first": 3, "second": 2}
+
+
+def test_full_batch_is_sent_without_waiting():
+    manager = SocketManager("receiver", 0, lambda message=None: None, delayed_acks=True)
+    peer = ContactNode("peer", "127.0.0.1", 1)
+    messages = received_messages(manager, peer, SocketManager.MAX_ACK_BATCH)
+    for message in messages:
+        manager.acknowledge(message)
+    batch = manager.outbox.get_nowait()
+    assert batch.get_ack_ids() == [message.get_message_id() for message in messages]
+    assert manager.pending_acks == {}
+
+
+def test_pending_acks_are_sent_after_the_delay():
+    manager = SocketManager("receiver", 0, lambda message=None: None, delayed_acks=True)
+    Thread(target=manager.send_delayed_acks, daemon=True).start()
+    peer = ContactNode("peer", "127.0.0.1", 1)
+    messages = received_messages(manager, peer, 2)
+    started = time.time()
+    for message in messages:
+        manager.acknowledge(message)
+    batch = manager.outbox.get(timeout=5)
+    assert time.time() - started >= SocketManager.ACK_DELAY
+    assert batch.get_ack_ids() == [message.get_message_id() for message in messages]
+
+
+def test_batch_ack_survives_the_wire_and_settles_every_message():
+    sender = SocketManager("sender", 0, lambda message=None: None)
+    receiver = SocketManager("receiver", 0, lambda message=None: None, delayed_acks=True)
+    messages = [MessageFactory.generate_rtt_message(origin_node=sender.node,
+                                                    destination_node=receiver.node)
+                for _ in range(3)]
+    for message in messages:
+        sender.awaiting_ack.track(message, time.time(), 60)
+        receiver.acknowledge(message)
+    batch = MessageFactory.generate_batch_ack_message(
+        origin_node=receiver.node, destination_node=sender.node,
+        ack_ids=receiver.pending_acks["sender"][1])
+    parsed = MessageFactory.create_message(
+        packet_data=batch.to_packet_string(),
+        origin_address=receiver.node.get_address(),
+        destination_node=sender.node)
+    sender.process_ack(parsed)
+    assert sender.awaiting_ack.size() == 0
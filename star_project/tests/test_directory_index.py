@@ -0,0 +1,44 @@
+from contact_directory import ContactDirectory
+from contact_node import ContactNode
+from message_factory import MessageFactory
+from socket_manager import SocketManager
+
+
+def create_directory():
+    directory = ContactDirectory("self", False)
+    directory.set_star_node(ContactNode("self", "127.0.0.1", 1))
+    peer = ContactNode("peer", "127.0.0.1", 2)
+    directory.add(peer)
+    return directory, peer
+
+
+def test_resolve_returns_the_directory_node_for_its_name_and_address():
+    directory, peer = create_directory()
+    assert directory.resolve("peer", ("127.0.0.1", 2)) is peer
+    assert directory.resolve(peer.get_16_byte_name(), ("127.0.0.1", 2)) is peer
+
+
+def test_resolve_creates_a_node_for_unknown_senders():
+    directory, peer = create_directory()
+    moved = directory.resolve("peer", ("127.0.0.1", 3))
+    impostor = directory.resolve("other", ("127.0.0.1", 2))
+    assert moved is not peer and moved.get_address() == ("127.0.0.1", 3)
+    assert impostor is not peer and impostor.get_name() == "other"
+
+
+def test_poc_is_found_by_address():
+    directory, peer = create_directory()
+    assert not directory.poc_not_added(ContactNode("poc", "127.0.0.1", 2))
+    assert directory.poc_not_added(ContactNode("poc", "127.0.0.1", 4))
+
+
+def test_received_messages_carry_the_directory_node():
+    manager = SocketManager("self", 0, lambda message=None: None, parser_workers=0)
+    directory = ContactDirectory("self", False)
+    directory.set_star_node(manager.node)
+    peer = ContactNode("peer", "127.0.0.1", 2)
+    directory.add(peer)
+    manager.set_node_resolver(directory.resolve)
+    message = MessageFactory.generate_rtt_message(origin_node=peer, destination_node=manager.node)
+    manager.process_incoming_packet(message.to_packet_string(), peer.get_address())
+    assert manager.messages["rtt"].get_nowait().origin_node is peer
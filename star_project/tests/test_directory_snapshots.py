@@ -0,0 +1,74 @@
+import random
+from threading import Thread
+
+from contact_directory import ContactDirectory
+from contact_node import ContactNode
+
+
+def create_directory(*peer_names):
+    directory = ContactDirectory("self", False)
+    directory.set_star_node(ContactNode("self", "10.0.0.1", 1))
+    peers = [ContactNode(name, "10.0.0.1", port) for port, name in enumerate(peer_names, 2)]
+    for peer in peers:
+        directory.add(peer)
+    return directory, peers
+
+
+def test_snapshots_follow_nodes_coming_online_and_being_removed():
+    directory, (a, b, c) = create_directory("a", "b", "c")
+    assert directory.size() == 4
+    assert directory.get_current_list() == (a, b, c)
+    directory.remove("b")
+    assert directory.size() == 3
+    assert directory.get_current_list() == (a, c)
+    directory.add(b)
+    assert directory.get_current_list() == (a, c, b)
+
+
+def test_snapshot_taken_before_a_change_is_not_modified():
+    directory, (a, b) = create_directory("a", "b")
+    snapshot = directory.get_current_list()
+    directory.remove("a")
+    directory.add(ContactNode("c", "10.0.0.1", 9))
+    assert snapshot == (a, b)
+
+
+def test_readers_do_not_wait_for_the_lock():
+    directory, peers = create_directory("a", "b")
+    results = []
+    with directory.lock:
+        reader = Thread(target=lambda: results.extend(
+            [directory.size(), directory.get_current_list(), directory.serialize()]),
+            daemon=True)
+        reader.start()
+        reader.join(5)
+        assert not reader.is_alive()
+    assert results[:2] == [3, tuple(peers)]
+
+
+def test_central_node_ties_go_to_the_smallest_name():
+    directory, (b, a) = create_directory("b", "a")
+    for node in (directory.star_node, a, b):
+        node.update_rtt_sum(1.0, 3)
+    assert directory.check_central_node() == ("a", 1.0)
+    b.update_rtt_sum(0.5, 3)
+    assert directory.check_central_node() == ("b", 0.5)
+
+
+def test_central_node_follows_single_rtt_sum_updates():
+    directory, peers = create_directory("a", "b", "c", "d")
+    rng = random.Random(1)
+    for node in (directory.star_node, *peers):
+        node.update_rtt_sum(rng.random(), 5)
+    directory.check_central_node()
+    for _ in range(200):
+        node = rng.choice(peers)
+        node.update_rtt_sum(rng.random(), rng.choice((4, 5)))
+        expected = directory._find_central_node(directory.online_nodes)
+        assert directory.check_central_node(node) == (expected[0].name, expected[1])
+    peers[1].update_rtt_sum(-1.0, 5)
+    assert directory.check_central_node(peers[1]) == ("b", -1.0)
+    directory.remove("b")
+    peers[0].update_rtt_sum(10.0, 5)
+    expected = directory._find_central_node(directory.online_nodes)
+    assert directory.check_central_node(peers[0]) == (expected[0].name, expected[1])
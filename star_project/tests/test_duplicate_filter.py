@@ -0,0 +1,139 @@
+import asyncio
+
+from contact_node import ContactNode
+from duplicate_filter import DUPLICATE, NEW, STRAGGLER, DuplicateFilter, SequenceWindow
+from message_factory import MessageFactory
+from socket_manager import SocketManager
+from virtual_network import VirtualNetwork
+
+SPACE = 2 ** 32
+
+
+def test_window_drops_repeated_ids():
+    window = SequenceWindow(64, 10, SPACE)
+    assert not window.check_and_add(10)
+    assert window.check_and_add(12)
+    assert window.check_and_add(11)
+    assert not window.check_and_add(11)
+    assert not window.check_and_add(12)
+
+
+def test_window_wraps_around():
+    window = SequenceWindow(64, SPACE - 2, SPACE)
+    assert window.check_and_add(SPACE - 1)
+    assert window.check_and_add(0)
+    assert window.check_and_add(1)
+    assert not window.check_and_add(SPACE - 1)
+    assert not window.check_and_add(0)
+    assert window.highest == 1
+
+
+def test_window_wraps_around_text_space():
+    window = SequenceWindow(64, 0xffff, 0x10000)
+    assert window.check_and_add(0)
+    assert not window.check_and_add(0xffff)
+
+
+def test_straggler_behind_window_is_dropped():
+    window = SequenceWindow(4096, 1, SPACE)
+    for sequence in range(2, 5000):
+        assert window.check_and_add(sequence)
+    assert not window.check_and_add(100)
+    assert not window.check_and_add(4999)
+    assert window.check_and_add(5000)
+    assert window.highest == 5000
+
+
+def test_straggler_is_told_apart_from_a_duplicate():
+    duplicates = DuplicateFilter(window_size=64)
+    origin = ContactNode("b", "10.0.0.1", 9002)
+    destination = ContactNode("a", "10.0.0.1", 9001)
+    message = MessageFactory.generate_rtt_message(origin_node=origin,
+                                                  destination_node=destination)
+    sequence = message.get_sequence()
+    assert duplicates.check(message) == NEW
+    assert duplicates.check(message) == DUPLICATE
+    message.uuid = message.format_uuid(sequence - 64)
+    assert duplicates.check(message) == STRAGGLER
+    assert duplicates.get_straggler_count() == 1
+    assert duplicates.get_stats() == {"rtt": 1}
+
+
+def test_forget_starts_a_new_window():
+    duplicates = DuplicateFilter(window_size=64)
+    origin = ContactNode("b", "10.0.0.1", 9002)
+    destination = ContactNode("a", "10.0.0.1", 9001)
+    message = MessageFactory.generate_rtt_message(origin_node=origin,
+                                                  destination_node=destination)
+    assert not duplicates.is_duplicate(message)
+    assert duplicates.is_duplicate(message)
+    duplicates.forget("b")
+    assert not duplicates.is_duplicate(message)
+
+
+class Peer():
+    """ A SocketManager on a VirtualNetwork whose packets are handed over by hand """
+
+    def __init__(self, network, name, port):
+        self.manager = SocketManager(name, port, lambda message=None: None,
+                                     transport=network.create_socket)
+        self.node = self.manager.node
+        self.acked = []
+        self.manager.acknowledge = self.acked.append
+
+    def continue_sequence_at(self, peer, sequence):
+        MessageFactory.sequences[(self.node.get_name(), peer.node.get_address())] = sequence
+
+    def heartbeat_to(self, peer):
+        message = MessageFactory.generate_heartbeat_message(
+            origin_node=self.node, destination_node=peer.node)
+        self.manager._set_wire_format(message)
+        return message
+
+    def discovery_to(self, peer):
+        message = MessageFactory.generate_discovery_message(
+            origin_node=self.node, destination_node=peer.node, direction='0',
+            payload='{"wire": 1, "epoch": %d}' % self.manager.epoch)
+        self.manager._set_wire_format(message)
+        return message
+
+    def receive(self, sender, message):
+        queue = self.manager.messages[message.TYPE_STRING]
+        before = queue.qsize()
+        self.manager.process_incoming_packet(message.to_packet_string(),
+                                             sender.node.get_address())
+        return queue.qsize() > before
+
+
+def test_restarted_peer_is_recognised_by_its_epoch():
+    network = VirtualNetwork(asyncio.new_event_loop())
+    receiver = Peer(network, "a", 9100)
+    sender = Peer(network, "b", 9101)
+    sender.continue_sequence_at(receiver, 50000)
+    assert receiver.receive(sender, sender.discovery_to(receiver))
+    for _ in range(10):
+        assert receiver.receive(sender, sender.heartbeat_to(receiver))
+
+    # Same name, new sequence far behind the old one
+    network.detach(sender.manager.sock)
+    sender = Peer(network, "b", 9101)
+    sender.continue_sequence_at(receiver, 40000)
+    heartbeat = sender.heartbeat_to(receiver)
+    receiver.acked.clear()
+    assert not receiver.receive(sender, heartbeat)
+    assert receiver.acked == []  # so the sender resends it
+    assert receiver.receive(sender, sender.discovery_to(receiver))
+    assert receiver.receive(sender, heartbeat)
+    assert receiver.acked[-1].uuid == heartbeat.uuid
+
+
+def test_removed_peer_is_forgotten():
+    network = VirtualNetwork(asyncio.new_event_loop())
+    receiver = Peer(network, "a", 9200)
+    sender = Peer(network, "b", 9201)
+    sender.continue_sequence_at(receiver, 50000)
+    assert receiver.receive(sender, sender.heartbeat_to(receiver))
+    sender.continue_sequence_at(receiver, 40000)
+    assert not receiver.receive(sender, sender.heartbeat_to(receiver))
+    receiver.manager.forget_peer("b")
+    assert receiver.receive(sender, sender.heartbeat_to(receiver))
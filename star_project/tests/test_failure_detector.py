@@ -0,0 +1,34 @@
+import argparse
+
+import pytest
+
+from failure_detector import PhiAccrualDetector, parse_threshold
+
+
+def regular_detector(interval=1.0):
+    detector = PhiAccrualDetector()
+    for _ in range(10):
+        detector.add_interval(interval)
+    return detector
+
+
+@pytest.mark.parametrize("threshold", [0.5, 1, 8, 16, 17, 20, 100, PhiAccrualDetector.MAX_THRESHOLD])
+def test_phi_reaches_threshold_at_timeout(threshold):
+    detector = regular_detector()
+    assert detector.phi(detector.get_timeout(threshold)) == pytest.approx(threshold, rel=1e-6)
+
+
+def test_timeout_grows_with_threshold():
+    detector = regular_detector()
+    timeouts = [detector.get_timeout(threshold) for threshold in (1, 8, 17, 100)]
+    assert timeouts == sorted(timeouts)
+
+
+@pytest.mark.parametrize("text", ["0", "-1", "301", "inf", "nan"])
+def test_parse_threshold_rejects_out_of_range(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_threshold(text)
+
+
+def test_parse_threshold_accepts_large_values():
+    assert parse_threshold("20") == 20
@@ -0,0 +1,121 @@
+import os
+
+from contact_node import ContactNode
+from file_transfer import FileAssembler, count_fragments, iter_fragments, read_fragments
+from message_factory import MessageFactory
+from messages import FileFragmentMessage
+
+SENDER = ContactNode("sender", "127.0.0.1", 1)
+RECEIVER = ContactNode("receiver", "127.0.0.1", 2)
+
+
+def fragment_messages(data, transfer_id="0000beef", file_name="file.bin"):
+    fragments = list(iter_fragments(data))
+    return [MessageFactory.generate_fragment_message(
+        origin_node=SENDER, destination_node=RECEIVER, sender=SENDER.get_16_byte_name(),
+        transfer_id=transfer_id, sequence=sequence, total=len(fragments),
+        file_name=file_name, data=bytes(fragment))
+        for sequence, fragment in enumerate(fragments)]
+
+
+def test_files_are_split_into_fragments_of_at_most_max_data_size():
+    data = bytes(range(256)) * 10
+    fragments = list(iter_fragments(data))
+    assert len(fragments) == count_fragments(len(data)) == 3
+    assert all(len(fragment) <= FileFragmentMessage.MAX_DATA_SIZE for fragment in fragments)
+    assert b''.join(fragments) == data
+    assert [bytes(fragment) for fragment in iter_fragments(b'')] == [b'']
+
+
+def test_files_are_read_one_fragment_at_a_time(tmp_path):
+    data = os.urandom(5000)
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    fragments = read_fragments(str(path))
+    assert len(next(fragments)) == FileFragmentMessage.MAX_DATA_SIZE
+    assert len(list(fragments)) == count_fragments(len(data)) - 1
+
+
+def test_fragment_survives_the_wire():
+    message, = fragment_messages(b'\x00\xffdata', file_name="name with spaces")
+    parsed = MessageFactory.create_message(
+        packet_data=message.to_packet_string(),
+        origin_address=SENDER.get_address(),
+        destination_node=RECEIVER)
+    assert (parsed.get_sender(), parsed.transfer_id, parsed.sequence, parsed.total) == \
+        ("sender", "0000beef", 0, 1)
+    assert parsed.file_name == "name with spaces"
+    assert parsed.data == b'\x00\xffdata'
+
+
+def test_fragments_are_written_to_disk_in_any_order(tmp_path):
+    data = os.urandom(5000)
+    messages = fragment_messages(data)
+    assembler = FileAssembler("receiver")
+    assert all(assembler.add_fragment(message) is None for message in messages[:0:-1])
+    transfer = assembler.add_fragment(messages[0])
+    assert transfer.file_name == "file.bin"
+    assert transfer.get_sender() == "sender"
+    assert (tmp_path / "receiver-file.bin").read_bytes() == data
+    assert os.listdir(str(tmp_path)) == ["receiver-file.bin"]
+
+
+def test_stale_transfers_are_deleted(tmp_path):
+    messages = fragment_messages(bytes(3000))
+    assembler = FileAssembler("receiver")
+    assembler.add_fragment(messages[0])
+    assembler.transfers[("sender", "0000beef")].last_update -= FileAssembler.TRANSFER_TIMEOUT + 1
+    assembler.add_fragment(fragment_messages(b'other', transfer_id="0000cafe")[0])
+    assert assembler.transfers == {}
+    assert os.listdir(str(tmp_path)) == ["receiver-file.bin"]
+
+
+def test_duplicate_fragments_do_not_complete_a_transfer():
+    messages = fragment_messages(bytes(3000))
+    assembler = FileAssembler("receiver")
+    assembler.add_fragment(messages[0])
+    assert assembler.add_fragment(messages[0]) is None
+    assert assembler.add_fragment(messages[1]) is None
+    assert assembler.add_fragment(messages[2]) is not None
+
+
+def test_fragments_resent_after_completion_are_ignored():
+    messages = fragment_messages(b'small')
+    assembler = FileAssembler("receiver")
+    assert assembler.add_fragment(messages[0]) is not None
+    assert assembler.add_fragment(messages[0]) is None
+
+
+def test_fragments_outside_their_count_are_rejected(tmp_path):
+    message, = fragment_messages(b'data')
+    assembler = FileAssembler("receiver")
+    for sequence, total in ((1, 1), (5, 2), (-1, 2), (0, 0)):
+        message.sequence, message.total = sequence, total
+        assert not assembler.is_valid_fragment(message)
+        assert assembler.add_fragment(message) is None
+    assert assembler.transfers == {}
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_fragment_claiming_another_count_than_its_transfer_is_rejected():
+    messages = fragment_messages(bytes(3000))
+    assembler = FileAssembler("receiver")
+    assembler.add_fragment(messages[0])
+    messages[1].total = 2
+    assert assembler.add_fragment(messages[1]) is None
+    assert assembler.transfers[("sender", "0000beef")].received_count == 1
+
+
+def test_oversized_fragment_is_rejected():
+    message, = fragment_messages(b'data')
+    message.data = bytes(FileFragmentMessage.MAX_DATA_SIZE + 1)
+    assert FileAssembler("receiver").add_fragment(message) is None
+
+
+def test_no_space_is_reserved_for_missing_fragments(tmp_path):
+    messages = fragment_messages(bytes(3000))
+    assembler = FileAssembler("receiver")
+    assembler.add_fragment(messages[0])
+    assembler.transfers[("sender", "0000beef")].file.flush()
+    part_path, = tmp_path.iterdir()
+    assert part_path.stat().st_size == FileFragmentMessage.MAX_DATA_SIZE
@@ -0,0 +1,114 @@
+from threading import Thread
+
+import pytest
+
+from contact_node import ContactNode
+from flow_control import FlowController, PeerWindow
+from message_factory import MessageFactory
+from socket_manager import SocketManager
+
+ORIGIN = ContactNode("origin", "127.0.0.1", 1)
+
+
+def app_messages(count, destination_name="peer"):
+    destination = ContactNode(destination_name, "127.0.0.1", 2)
+    return [MessageFactory.generate_app_message(origin_node=ORIGIN, destination_node=destination)
+            for _ in range(count)]
+
+
+def test_only_a_window_of_messages_is_sent_per_peer():
+    sent = []
+    flow = FlowController(sent.append)
+    messages = app_messages(PeerWindow.INITIAL_WINDOW + 2)
+    other = app_messages(1, "other")
+    for message in messages + other:
+        flow.submit(message)
+    assert sent == messages[:PeerWindow.INITIAL_WINDOW] + other
+    assert flow.pending_count() == 2
+
+
+def test_ack_grows_the_window_and_releases_queued_messages():
+    sent = []
+    flow = FlowController(sent.append)
+    messages = app_messages(PeerWindow.INITIAL_WINDOW + 2)
+    for message in messages:
+        flow.submit(message)
+    flow.on_ack(messages[0])
+    assert flow.get_window_size("peer") == PeerWindow.INITIAL_WINDOW + 1
+    assert sent == messages
+    assert flow.pending_count() == 0
+
+
+def test_window_grows_by_one_per_round_trip_above_ssthresh():
+    window = PeerWindow()
+    window.cwnd = window.ssthresh = 10
+    for _ in range(10):
+        window.grow()
+    assert window.cwnd == pytest.approx(11, abs=0.05)
+
+
+def test_loss_halves_the_window_once_per_rto():
+    flow = FlowController(lambda message: None)
+    message, = app_messages(1)
+    window = flow._get_window(message)
+    window.cwnd = 16
+    flow.on_loss(message)
+    flow.on_loss(message)
+    assert window.cwnd == 8
+    assert window.ssthresh == 8
+
+
+def test_dropped_message_frees_its_slot():
+    sent = []
+    flow = FlowController(sent.append)
+    messages = app_messages(PeerWindow.INITIAL_WINDOW + 1)
+    for message in messages:
+        flow.submit(message)
+    flow.on_drop(messages[0])
+    assert sent == messages
+    assert flow.get_window_size("peer") == PeerWindow.INITIAL_WINDOW
+
+
+def test_streaming_sender_waits_until_an_ack_frees_a_slot():
+    flow = FlowController(lambda message: None)
+    messages = app_messages(PeerWindow.INITIAL_WINDOW)
+    for message in messages:
+        flow.submit(message)
+    waiter = Thread(target=flow.wait_for_room, args=("peer",), daemon=True)
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    flow.on_ack(messages[0])
+    waiter.join(5)
+    assert not waiter.is_alive()
+
+
+def test_streaming_without_flow_control_is_bounded_per_peer():
+    manager = SocketManager("origin", 0, lambda message=None: None)
+    peer = ContactNode("peer", "127.0.0.1", 2)
+    messages = [MessageFactory.generate_app_message(origin_node=manager.node, destination_node=peer)
+                for _ in range(SocketManager.STREAM_WINDOW)]
+    for message in messages:
+        assert manager.has_room(peer)
+        manager.send_message(message)
+    assert manager.outbox.qsize() == SocketManager.STREAM_WINDOW
+    waiter = Thread(target=manager.wait_for_room, args=(peer,), daemon=True)
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    manager.process_ack(MessageFactory.generate_ack_message(messages[0]))
+    waiter.join(5)
+    assert not waiter.is_alive()
+
+
+def test_dropped_stream_message_frees_its_slot():
+    manager = SocketManager("origin", 0, lambda message=None: None)
+    peer = ContactNode("peer", "127.0.0.1", 2)
+    messages = [MessageFactory.generate_app_message(origin_node=manager.node, destination_node=peer)
+                for _ in range(SocketManager.STREAM_WINDOW)]
+    for message in messages:
+        manager.send_message(message)
+    messages[0].resent = 14
+    manager.resend_message(messages[0])
+    assert manager.has_room(peer)
+    assert manager.bulk_in_flight == {"peer": SocketManager.STREAM_WINDOW - 1}
@@ -0,0 +1,60 @@
+from contact_node import ContactNode
+from message_factory import MessageFactory
+from messages import AckMessage, BaseMessage, HeartbeatMessage
+from socket_manager import SocketManager
+from virtual_network import VirtualNetwork
+
+ORIGIN = ContactNode("origin", "10.0.0.1", 1)
+OTHER = ContactNode("other", "10.0.0.1", 2)
+DESTINATION = ContactNode("destination", "10.0.0.1", 3)
+
+
+def test_sequences_are_counted_per_origin():
+    first = MessageFactory.generate_heartbeat_message(origin_node=ORIGIN,
+                                                      destination_node=DESTINATION)
+    MessageFactory.generate_heartbeat_message(origin_node=OTHER, destination_node=DESTINATION)
+    second = MessageFactory.generate_heartbeat_message(origin_node=ORIGIN,
+                                                       destination_node=DESTINATION)
+    assert second.get_sequence() == (first.get_sequence() + 1) % MessageFactory.SEQUENCE_SPACE
+
+
+def test_recycled_messages_stay_with_their_origin():
+    heartbeat = MessageFactory.generate_heartbeat_message(origin_node=ORIGIN,
+                                                          destination_node=DESTINATION)
+    MessageFactory.recycle(heartbeat)
+    other = MessageFactory.generate_heartbeat_message(origin_node=OTHER,
+                                                      destination_node=DESTINATION)
+    assert other is not heartbeat
+    again = MessageFactory.generate_heartbeat_message(origin_node=ORIGIN,
+                                                      destination_node=DESTINATION)
+    assert again is heartbeat
+    assert again.destination_node is DESTINATION
+
+
+def test_take_from_empty_pool():
+    MessageFactory.free_messages.pop((HeartbeatMessage, "origin"), None)
+    assert MessageFactory._take(HeartbeatMessage, ORIGIN) is None
+
+
+def test_oldest_template_is_evicted(monkeypatch):
+    monkeypatch.setattr(BaseMessage, "MAX_TEMPLATES", 2)
+    monkeypatch.setattr(BaseMessage, "templates", {})
+    buffer = memoryview(bytearray(2048))
+    for port in range(4):
+        destination = ContactNode(f'peer{port}', "10.0.0.1", 100 + port)
+        heartbeat = MessageFactory.generate_heartbeat_message(origin_node=ORIGIN,
+                                                              destination_node=destination)
+        heartbeat.wire_version = BaseMessage.WIRE_VERSION
+        heartbeat.pack_into(buffer)
+    templates = BaseMessage.templates["origin"]
+    assert [key[2] for key in templates] == ["peer2", "peer3"]
+
+
+def test_threaded_socket_manager_recycles_sent_acks():
+    manager = SocketManager("acker", 9300, lambda message=None: None,
+                            transport=VirtualNetwork(None).create_socket)
+    heartbeat = MessageFactory.generate_heartbeat_message(origin_node=OTHER,
+                                                          destination_node=manager.node)
+    ack = MessageFactory.generate_ack_message(heartbeat)
+    manager.message_sent(ack)
+    assert MessageFactory._take(AckMessage, manager.node) is ack
@@ -0,0 +1,64 @@
+import pytest
+
+from contact_node import ContactNode
+from message_factory import MessageFactory
+from messages import BaseMessage
+
+ORIGIN = ContactNode("origin", "10.0.0.1", 1)
+DESTINATION = ContactNode("destination", "10.0.0.1", 2)
+
+
+def send(message):
+    """ The message the destination parses from the packet for `message` """
+    buffer = memoryview(bytearray(2048))
+    packet = bytes(message.encode(buffer))
+    MessageFactory.register_name(ORIGIN.name)
+    return MessageFactory.create_message(packet, origin_address=ORIGIN.get_address(),
+                                         destination_node=DESTINATION)
+
+
+@pytest.mark.parametrize("wire_version", [0, BaseMessage.WIRE_VERSION])
+@pytest.mark.parametrize("reliable", [True, False])
+def test_heartbeat_reliable_flag_survives_both_formats(wire_version, reliable):
+    heartbeat = MessageFactory.generate_heartbeat_message(
+        origin_node=ORIGIN, destination_node=DESTINATION, direction='1', reliable=reliable)
+    heartbeat.wire_version = wire_version
+    received = send(heartbeat)
+    assert received.direction == '1'
+    assert received.needs_ack() == reliable
+
+
+def test_legacy_text_heartbeat_is_acked():
+    packet = b'H' + ORIGIN.get_16_byte_name().encode() + b'0042' + b'0'
+    received = MessageFactory.create_message(packet, origin_address=ORIGIN.get_address(),
+                                             destination_node=DESTINATION)
+    assert received.uuid == '00000042'
+    assert received.needs_ack()
+
+
+def test_text_ids_keep_the_legacy_width():
+    heartbeat = MessageFactory.generate_heartbeat_message(origin_node=ORIGIN,
+                                                          destination_node=DESTINATION)
+    heartbeat.fit_uuid_to_format()
+    packet = heartbeat.to_packet_string()
+    assert len(packet) == 1 + BaseMessage.NAME_LENGTH + 4 + 2
+    assert send(heartbeat).get_message_id() == heartbeat.get_message_id()
+
+
+@pytest.mark.parametrize("wire_version", [0, BaseMessage.WIRE_VERSION])
+@pytest.mark.parametrize("network_size", [3, 30, 1000])
+def test_rtt_sum_broadcast_carries_the_network_size(wire_version, network_size):
+    broadcast = MessageFactory.generate_rtt_message(
+        origin_node=ORIGIN, destination_node=DESTINATION, stage="2",
+        network_size=network_size, rtt_sum=0.345)
+    broadcast.wire_version = wire_version
+    received = send(broadcast)
+    assert received.get_network_size() == network_size
+    assert received.get_rtt_sum() == 0.345
+
+
+def test_legacy_text_rtt_sum_broadcast_is_parsed():
+    packet = b'R' + ORIGIN.get_16_byte_name().encode() + b'0042' + b'240.345'
+    received = MessageFactory.create_message(packet, origin_address=ORIGIN.get_address(),
+                                             destination_node=DESTINATION)
+    assert (received.get_network_size(), received.get_rtt_sum()) == (4, 0.345)
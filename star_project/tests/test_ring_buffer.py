@@ -0,0 +1,56 @@
+from threading import Thread
+
+import pytest
+
+from contact_node import ContactNode
+from message_factory import MessageFactory
+from ring_buffer import RingBuffer
+from socket_manager import SocketManager
+
+
+def test_items_come_out_in_order_across_the_wrap():
+    ring = RingBuffer(3)
+    for item in range(3):
+        assert ring.put(item)
+    assert [ring.get(), ring.get()] == [0, 1]
+    ring.put(3)
+    ring.put(4)
+    assert [ring.get() for _ in range(3)] == [2, 3, 4]
+    assert ring.size() == 0
+
+
+def test_full_ring_drops_and_counts_new_items():
+    ring = RingBuffer(2)
+    assert ring.put("a") and ring.put("b")
+    assert not ring.put("c")
+    assert ring.get_dropped_count() == 1
+    assert [ring.get(), ring.get()] == ["a", "b"]
+
+
+def test_get_blocks_until_an_item_is_put():
+    ring = RingBuffer(1)
+    items = []
+    reader = Thread(target=lambda: items.append(ring.get()), daemon=True)
+    reader.start()
+    reader.join(0.1)
+    assert reader.is_alive()
+    ring.put("packet")
+    reader.join(5)
+    assert items == ["packet"]
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+def test_parser_worker_dispatches_packets_from_the_ring():
+    manager = SocketManager("receiver", 0, lambda message=None: None)
+    peer = ContactNode("peer", "127.0.0.1", 1)
+    message = MessageFactory.generate_rtt_message(origin_node=peer,
+                                                  destination_node=manager.node)
+    manager.receive_packet(message.to_packet_string(), peer.get_address())
+    assert manager.received_packets.size() == 1
+    Thread(target=manager.parse_packets, daemon=True).start()
+    parsed = manager.messages["rtt"].get(timeout=5)
+    assert parsed.origin_node.get_name() == "peer"
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from contact_directory import ContactDirectory
+from contact_node import ContactNode
+from message_factory import MessageFactory
+from socket_manager import SocketManager
+
+
+def test_first_sample_sets_rto_to_three_round_trips():
+    node = ContactNode("peer", "10.0.0.1", 1)
+    assert node.get_rto() == ContactNode.INITIAL_RTO
+    node.update_rto(0.5)
+    assert node.srtt == 0.5
+    assert node.rttvar == 0.25
+    assert node.get_rto() == pytest.approx(1.5)
+
+
+def test_later_samples_are_smoothed():
+    node = ContactNode("peer", "10.0.0.1", 1)
+    node.update_rto(0.5)
+    node.update_rto(1.0)
+    rttvar = 0.75 * 0.25 + 0.25 * 0.5
+    srtt = 0.875 * 0.5 + 0.125 * 1.0
+    assert node.get_rto() == pytest.approx(srtt + 4 * rttvar)
+
+
+def test_rto_is_clamped_and_backed_off():
+    node = ContactNode("peer", "10.0.0.1", 1)
+    node.update_rto(0.001)
+    assert node.get_rto() == ContactNode.MIN_RTO
+    assert node.get_rto(attempt=2) == 4 * ContactNode.MIN_RTO
+    assert node.get_rto(attempt=20) == ContactNode.MAX_RTO
+
+
+def test_rtt_measurement_only_seeds_an_empty_estimator():
+    node = ContactNode("peer", "10.0.0.1", 1)
+    node.seed_rto(2.0)
+    node.seed_rto(0.1)
+    assert node.srtt == 2.0
+
+
+@pytest.mark.parametrize("resent", [0, 1])
+def test_karn_only_samples_messages_sent_once(resent):
+    manager = SocketManager("sender", 0, lambda message=None: None)
+    peer = ContactNode("receiver", "127.0.0.1", 1)
+    message = MessageFactory.generate_rtt_message(origin_node=manager.node,
+                                                  destination_node=peer)
+    message.resent = resent
+    manager.awaiting_ack.track(message, time.time() - 0.4, peer.get_rto(resent))
+    manager.process_ack(MessageFactory.generate_ack_message(message))
+    assert manager.awaiting_ack.size() == 0
+    if resent:
+        assert peer.srtt is None
+        assert peer.get_rto() == ContactNode.INITIAL_RTO
+    else:
+        assert peer.srtt == pytest.approx(0.4, abs=0.1)
+
+
+def test_padded_names_from_packets_resolve_to_the_directory_node():
+    directory = ContactDirectory("self", False)
+    peer = ContactNode("peer", "10.0.0.1", 1)
+    directory.add(peer)
+    from_packet = ContactNode(peer.get_16_byte_name(), "10.0.0.1", 1)
+    assert directory.get_canonical(from_packet) is peer
@@ -0,0 +1,46 @@
+import asyncio
+import random
+
+import pytest
+
+import clock
+from simulation import StarNetSimulation
+from virtual_network import VirtualNetwork
+
+
+def run_simulation(**options):
+    random.seed(1)
+    simulation = StarNetSimulation(4, timeout=120, observe=5, seed=1, **options)
+    return clock.run_in_virtual_time(simulation.run())
+
+
+@pytest.mark.parametrize("swim_membership", [False, True])
+def test_star_net_fails_over_to_a_new_central_node(swim_membership):
+    results = run_simulation(swim_membership=swim_membership, loss=0.01)
+    assert results["converged"] is not None
+    assert results["elected"] is not None
+    assert results["delivered"] == 3
+    assert results["false positives"] == 0
+    assert results["crash detected"] is not None
+    assert results["crash reelected"] is not None
+
+
+def test_dropped_peer_is_discovered_again():
+    random.seed(1)
+    simulation = StarNetSimulation(4, timeout=120, seed=1)
+
+    async def scenario():
+        simulation.network = VirtualNetwork(asyncio.get_event_loop(),
+                                            **simulation.network_options)
+        simulation.started = clock.now()
+        try:
+            await simulation.start_nodes()
+            assert await simulation.wait_for(simulation.is_converged) is not None
+            node, peer = simulation.nodes[0], simulation.nodes[1]
+            node.remove_unresponsive_node(node.directory.get(peer.name))
+            assert not node.directory.exists(peer.name)
+            return await simulation.wait_for(lambda: node.directory.exists(peer.name))
+        finally:
+            simulation.stop()
+
+    assert clock.run_in_virtual_time(scenario()) is not None
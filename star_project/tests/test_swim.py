@@ -0,0 +1,153 @@
+import json
+
+import pytest
+
+from contact_directory import ContactDirectory
+from contact_node import ContactNode
+from message_factory import MessageFactory
+from swim import ALIVE, DEAD, SUSPECT, SwimMembership
+
+
+class Cluster():
+    """ SwimMembership instances passing gossip through an in-memory queue """
+
+    def __init__(self, *names):
+        self.nodes = {name: ContactNode(name, "127.0.0.1", port)
+                      for port, name in enumerate(names, 1)}
+        self.members = {}
+        self.sent = []  # (origin name, destination name, payload)
+        self.delivered = []
+        self.failed = {name: [] for name in names}
+        self.crashed = set()
+        for name in names:
+            self.members[name] = self._create_member(name)
+
+    def _create_member(self, name):
+        directory = ContactDirectory(name, False)
+        directory.set_star_node(self.nodes[name])
+        for other in self.nodes.values():
+            if other.name != name:
+                directory.add(ContactNode(other.name, other.ip, other.port))
+
+        def member_failed(node):
+            self.failed[name].append(node.name)
+            directory.remove(node.name)
+
+        return SwimMembership(
+            directory, directory.star_node,
+            lambda destination, payload: self.sent.append((name, destination.name, payload)),
+            directory.add, member_failed)
+
+    def deliver(self):
+        """ Passes on every gossip message until none are left """
+        while self.sent:
+            origin, destination, payload = self.sent.pop(0)
+            if destination in self.crashed:
+                continue
+            self.delivered.append((origin, destination, json.loads(payload)))
+            self.members[destination].process_message(
+                MessageFactory.generate_gossip_message(
+                    origin_node=self.nodes[origin], destination_node=self.nodes[destination],
+                    payload=payload))
+
+    def ping_req(self, origin, destination, probe_id, target):
+        """ Queues a ping-req as `origin` would send it for its probe `probe_id` """
+        node = self.nodes[target]
+        self.sent.append((origin, destination, json.dumps({
+            "type": "ping-req", "probe": probe_id, "updates": [],
+            "target": [node.name, node.ip, node.port]})))
+
+    def kinds(self):
+        return [(origin, destination, json.loads(payload)["type"])
+                for origin, destination, payload in self.sent]
+
+
+def test_target_answering_the_ping_is_not_suspected(simulated_clock):
+    cluster = Cluster("a", "b")
+    a = cluster.members["a"]
+    a.probe()
+    assert cluster.kinds() == [("a", "b", "ping")]
+    cluster.deliver()
+    assert a.probe_acked
+    a.probe_indirectly()
+    assert cluster.sent == []
+
+
+def test_ack_relayed_by_a_helper_ends_the_probe(simulated_clock):
+    cluster = Cluster("a", "b", "c")
+    a = cluster.members["a"]
+    a.probe()
+    target = a.probe_target.name
+    helper = ({"b", "c"} - {target}).pop()
+    cluster.sent.clear()  # the direct ping is lost
+    a.probe_indirectly()
+    assert cluster.kinds() == [("a", helper, "ping-req")]
+    cluster.deliver()
+    assert a.probe_acked
+    assert a.members.get(target, (ALIVE, 0))[0] == ALIVE
+
+
+def test_ack_of_the_target_ends_the_probe_while_relaying_a_ping(simulated_clock):
+    cluster = Cluster("a", "b", "c", "d")
+    cluster.crashed.add("d")
+    a = cluster.members["a"]
+    a.probe_order = [a.directory.get("b")]
+    a.probe()
+    cluster.ping_req("c", "a", 7, "d")  # arrives before b's ack
+    cluster.deliver()
+    assert a.probe_acked
+
+
+def test_ack_relayed_for_our_probe_is_not_passed_on(simulated_clock):
+    cluster = Cluster("a", "b", "c", "d")
+    cluster.crashed.add("d")
+    a = cluster.members["a"]
+    a.probe_order = [a.directory.get("b")]
+    a.probe()
+    cluster.sent.clear()  # the direct ping is lost
+    cluster.ping_req("c", "a", 7, "d")
+    cluster.deliver()
+    a.probe_indirectly()
+    cluster.deliver()
+    assert a.probe_acked
+    assert [payload for origin, destination, payload in cluster.delivered
+            if (origin, destination) == ("a", "c") and payload["type"] == "ack"] == []
+
+
+def test_silent_target_is_suspected_then_declared_dead(simulated_clock):
+    cluster = Cluster("a", "b")
+    cluster.crashed.add("b")
+    a = cluster.members["a"]
+    a.probe()
+    a.probe_indirectly()
+    cluster.deliver()
+    simulated_clock.advance(a.PROTOCOL_PERIOD)
+    a.probe()
+    assert a.members["b"][0] == SUSPECT
+    assert cluster.failed["a"] == []
+    simulated_clock.advance(a.get_suspicion_timeout())
+    a.probe()
+    assert a.members["b"][0] == DEAD
+    assert cluster.failed["a"] == ["b"]
+
+
+def test_suspected_member_refutes_with_a_higher_incarnation(simulated_clock):
+    cluster = Cluster("a", "b")
+    a, b = cluster.members["a"], cluster.members["b"]
+    a._suspect(a.directory.get("b"), simulated_clock.now())
+    a.probe()
+    cluster.deliver()
+    assert b.incarnation == 1
+    b.probe()
+    cluster.deliver()
+    assert a.members["b"] == (ALIVE, 1)
+    assert "b" not in a.suspects
+
+
+@pytest.mark.parametrize("size,limit", [(2, 4), (10, 8), (200, 12)])
+def test_updates_are_piggybacked_log_n_times(size, limit):
+    cluster = Cluster("a", "b")
+    a = cluster.members["a"]
+    for i in range(size - 2):
+        a.directory.add(ContactNode(f'n{i}', "127.0.0.1", 100 + i))
+    assert a.get_retransmit_limit() == limit
@@ -0,0 +1,42 @@
+import asyncio
+
+import clock
+from virtual_network import VirtualNetwork
+
+
+class Receiver():
+    def __init__(self, network, port):
+        self.port = port
+        self.received = []
+        network.attach(self)
+
+    def get_address(self):
+        return (VirtualNetwork.IP, self.port)
+
+    def deliver(self, data, address):
+        self.received.append((clock.now(), data))
+
+
+def send_packets(resolution, delays):
+    async def scenario():
+        network = VirtualNetwork(asyncio.get_event_loop(), latency=0.01,
+                                 resolution=resolution)
+        receiver = Receiver(network, 2)
+        started = clock.now()
+        for delay, data in delays:
+            await asyncio.sleep(delay)
+            network.transmit((VirtualNetwork.IP, 1), receiver.get_address(), data)
+        await asyncio.sleep(1)
+        return [(round(time - started, 4), data) for time, data in receiver.received]
+
+    return clock.run_in_virtual_time(scenario(), clock.SimulatedClock(start=0.0))
+
+
+def test_packets_due_in_the_same_tick_are_delivered_together_in_order():
+    received = send_packets(0.001, [(0, b'a'), (0.0002, b'b'), (0.0009, b'c')])
+    assert received == [(0.011, b'a'), (0.011, b'b'), (0.012, b'c')]
+
+
+def test_zero_resolution_delivers_every_packet_at_its_own_time():
+    received = send_packets(0, [(0, b'a'), (0.0002, b'b')])
+    assert received == [(0.01, b'a'), (0.0102, b'b')]
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Virtual Network
+
+In-memory replacement for UDP so that hundreds of StarNodes can run in one
+process without binding real ports. Packets are encoded exactly as they
+would be on the wire and delivered to the receiving node after a delay made
+up of:
+
+    - the time the sender's link is busy with earlier packets (bandwidth)
+    - the packet's transmission time, size / bandwidth
+    - latency plus a random 0..jitter extra, so packets can be reordered
+
+Packets are dropped with probability `loss`, and so are packets larger than
+MAX_DATAGRAM or sent to an address nobody is listening on. Packets sent are
+counted in stats and by their first byte, the message type, in
+sent_by_code.
+
+Deliveries are timers on an asyncio event loop. Delivery times are moved
+to the next multiple of `resolution` and every packet due at the same time is
+delivered by one timer, so a busy network of hundreds of nodes does not
+schedule one timer, and run one event loop iteration, per packet. Packets
+delivered together arrive in the order they were sent. Nodes on the async
+runtime use create_endpoint as their transport. Threaded nodes use
+create_socket, with the event loop running in another thread.
+
+Parameters:
+    - loop: Event loop the deliveries are scheduled on
+    - latency: One way delay of every packet in seconds
+    - jitter: Most extra random delay of a packet in seconds
+    - loss: Fraction of packets dropped
+    - bandwidth: Bytes per second each node can send, 0 for unlimited
+    - seed: Seed for the random numbers deciding jitter and loss
+    - resolution: Seconds delivery times are moved to the next multiple of,
+    0 to deliver every packet at its own time
+"""
+
+import asyncio
+import math
+import random
+from queue import Queue
+
+from reliable_socket import ReliableSocket
+
+
+class VirtualNetwork():
+    IP = "10.0.0.1"
+    MAX_DATAGRAM = 65507  # bytes
+
+    def __init__(self, loop, latency=0.01, jitter=0.0, loss=0.0, bandwidth=0,
+                 seed=None, resolution=0.0001):
+        self.loop = loop
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.bandwidth = bandwidth
+        self.random = random.Random(seed)
+        self.resolution = resolution
+        self.batches = {}  # delivery time in multiples of resolution -> packets
+        self.endpoints = {}
+        self.link_free_at = {}
+        self.stats = {"sent": 0, "delivered": 0, "dropped": 0, "bytes": 0}
+        self.sent_by_code = {}
+
+    def create_endpoint(self, port, process_incoming_packet_func, name):
+        """ Transport for an AsyncSocketManager """
+        return VirtualEndpoint(self, port, process_incoming_packet_func)
+
+    def create_socket(self, port, process_incoming_packet_func, outbox, name):
+        """ Transport for a threaded SocketManager """
+        return VirtualSocket(self, port, process_incoming_packet_func, outbox)
+
+    def attach(self, endpoint):
+        self.endpoints[endpoint.get_address()] = endpoint
+
+    def detach(self, endpoint):
+        self.endpoints.pop(endpoint.get_address(), None)
+
+    def transmit(self, source, destination, data):
+        """ Delivers `data` from `source` to `destination` after the link delay """
+        if self._in_loop():
+            self._schedule(source, destination, data)
+        else:
+            self.loop.call_soon_threadsafe(self._schedule, source, destination, data)
+
+    def _schedule(self, source, destination, data):
+        self.stats["sent"] += 1
+        self.stats["bytes"] += len(data)
+        self.sent_by_code[data[0]] = self.sent_by_code.get(data[0], 0) + 1
+        if len(data) > self.MAX_DATAGRAM or self.random.random() < self.loss:
+            self.stats["dropped"] += 1
+            return
+
+        now = self.loop.time()
+        departure = now
+        if self.bandwidth:
+            departure = max(now, self.link_free_at.get(source, now)) + \
+                len(data) / self.bandwidth
+            self.link_free_at[source] = departure
+        delay = departure - now + self.latency + self.random.uniform(0, self.jitter)
+        if not self.resolution:
+            self.loop.call_later(delay, self._deliver, source, destination, data)
+            return
+        tick = math.floor((now + delay) / self.resolution) + 1
+        batch = self.batches.get(tick)
+        if batch is None:
+            batch = self.batches[tick] = []
+            self.loop.call_at(tick * self.resolution, self._deliver_batch, tick)
+        batch.append((source, destination, data))
+
+    def _deliver_batch(self, tick):
+        for source, destination, data in self.batches.pop(tick):
+            self._deliver(source, destination, data)
+
+    def _deliver(self, source, destination, data):
+        endpoint = self.endpoints.get(destination)
+        if endpoint is None:
+            self.stats["dropped"] += 1
+            return
+        self.stats["delivered"] += 1
+        endpoint.deliver(data, source)
+
+    def _in_loop(self):
+        # Unlike get_running_loop() this returns None outside of a loop, and
+        # it is also available on Python 3.6
+        return asyncio._get_running_loop() is self.loop
+
+
+class VirtualEndpoint():
+    """ Transport with the interface of StarDatagramProtocol """
+
+    def __init__(self, network, port, process_incoming_packet_func):
+        self.network = network
+        self.port = port
+        self.process_incoming_packet = process_incoming_packet_func
+        self.send_buffer = memoryview(bytearray(ReliableSocket.SEND_BUFFER_SIZE))
+
+    async def open(self):
+        self.network.attach(self)
+
+    def close(self):
+        self.network.detach(self)
+
+    def get_ip(self):
+        return self.network.IP
+
+    def get_address(self):
+        return (self.get_ip(), self.port)
+
+    def send(self, message):
+        self.network.transmit(self.get_address(),
+                              message.destination_node.get_address(),
+                              bytes(message.encode(self.send_buffer)))
+
+    def deliver(self, data, address):
+        self.process_incoming_packet(data, address)
+
+
+class VirtualSocket(VirtualEndpoint):
+    """ Transport with the interface of ReliableSocket """
+
+    def __init__(self, network, port, process_incoming_packet_func, outbox):
+        super().__init__(network, port, process_incoming_packet_func)
+        self.outbox = outbox
+        self.inbox = Queue()
+        self.sent_func = None
+        network.attach(self)
+
+    def set_sent_handler(self, sent_func):
+        self.sent_func = sent_func
+
+    def start_listening(self):
+        """ Blocks and processes the packets delivered by the network """
+        while True:
+            data, address = self.inbox.get()
+            self.process_incoming_packet(data, address)
+
+    def start_sending(self):
+        """ Blocks and sends messages that are queued up in the outbox """
+        while True:
+            message = self.outbox.get()
+            self.send(message)
+            if self.sent_func is not None:
+                self.sent_func(message)
+
+    def deliver(self, data, address):
+        self.inbox.put((data, address))